@@ -23,7 +23,7 @@ Dependencies:
 """
 
 from manim import *
-from manim import *
+
 
 class MCPWaifuQueueExplanation(Scene):
     def construct(self):
@@ -122,4 +122,4 @@ class MCPWaifuQueueExplanation(Scene):
         conclusion = Text("Efficient Async AI Processing with MCP and Redis", font_size=32, color=GOLD)
         self.play(Write(conclusion))
         self.wait(2)
-        self.play(FadeOut(conclusion), FadeOut(components), FadeOut(labels), FadeOut(arrows))
\ No newline at end of file
+        self.play(FadeOut(conclusion), FadeOut(components), FadeOut(labels), FadeOut(arrows))
@@ -3,13 +3,13 @@ MCP Waifu Queue Package.
 
 This package implements an MCP (Model Context Protocol) server for conversational AI
 text generation using Redis queues for asynchronous processing. The system supports
-multiple AI providers (OpenRouter and Google Gemini) with automatic fallback and
-configurable provider selection.
+multiple AI providers (OpenRouter and an offline local stub) behind a
+latency-aware router with automatic fallback and configurable provider selection.
 
 The package provides:
 - MCP server implementation with FastMCP
 - Redis-based job queue system using RQ (Redis Queue)
-- Multi-provider AI text generation (OpenRouter/Gemini)
+- Multi-provider AI text generation with routing and failover
 - Configuration management via Pydantic settings
 - Async request processing with job status tracking
 
@@ -21,9 +21,9 @@ Main components:
 - worker.py: RQ worker process
 - models.py: Pydantic models for requests/responses
 - utils.py: Utility functions for the worker
-- providers/: Provider-specific implementations
+- providers/: Provider registry, router and provider implementations
 
 Version: 0.1.0
 """
 # This file makes the directory a Python package. It can be empty.
-__version__ = "0.1.0"
\ No newline at end of file
+__version__ = "0.1.0"
@@ -0,0 +1,264 @@
+"""
+Token-Budget Admission Control.
+
+This module decides, at enqueue time, whether the queue can take on more
+work. Every request is charged an estimated token cost, and the tokens of
+requests that are queued or running are tracked per client and for the
+whole server in Redis. A request that would push either total over its limit
+is deferred for up to admission_max_wait_seconds and then rejected with a
+retry-after hint, so a burst from one client cannot fill the queue for
+everyone and the queue as a whole stays bounded.
+
+Key Features:
+- Cost estimate per prompt: estimated prompt tokens plus max_new_tokens
+- Global and per-client limits on outstanding tokens (0 disables a limit).
+  A request is always admitted while nothing is outstanding in its scope,
+  so a single prompt larger than a limit cannot be starved
+- Batches are admitted all-or-nothing in one atomic Lua script call
+- Reservations are leases keyed by job id: workers release them when the job
+  completes or finally fails, and leases older than admission_lease_seconds
+  expire on their own, so a crashed worker or an expired job cannot leak
+  budget
+- Sync and async (redis.asyncio) admission and release
+
+Rejected requests raise AdmissionRejectedError, which carries the scope that was
+full (global or client) and a retry_after hint in seconds.
+
+Redis Layout:
+- waifu:admission:leases: Sorted set of job ids scored by lease expiry time
+- waifu:admission:jobs: Hash of job id -> "<cost>|<client>"
+- waifu:admission:tokens: Hash of outstanding tokens: "global" and
+  "client:<client id>"
+
+Usage:
+    controller = get_admission_controller()
+    if controller is not None:
+        controller.admit(client_id, [(job_id, estimate_cost(prompt))])
+    ...
+    release_admission(job_id)  # in the worker, once the job is done
+
+Dependencies:
+- redis: Shared budget state (sync and redis.asyncio)
+- ratelimit: Prompt token estimate
+- metrics: Rejection counter
+- config: Limits, lease length and deferral settings
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from mcp_waifu_queue import metrics
+from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.ratelimit import MAX_POLL_SECONDS, estimate_tokens
+from mcp_waifu_queue.settings import on_reload
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "waifu:admission:"
+LEASES_KEY = KEY_PREFIX + "leases"
+JOBS_KEY = KEY_PREFIX + "jobs"
+TOKENS_KEY = KEY_PREFIX + "tokens"
+
+# Shared by both scripts. KEYS: leases, jobs, tokens
+_RELEASE_FUNCTION = """
+local function release(job_id)
+    local lease = redis.call('HGET', KEYS[2], job_id)
+    redis.call('ZREM', KEYS[1], job_id)
+    if not lease then
+        return
+    end
+    redis.call('HDEL', KEYS[2], job_id)
+    local sep = string.find(lease, '|', 1, true)
+    local cost = tonumber(string.sub(lease, 1, sep - 1))
+    for _, field in ipairs({'global', 'client:' .. string.sub(lease, sep + 1)}) do
+        if redis.call('HINCRBY', KEYS[3], field, -cost) <= 0 then
+            redis.call('HDEL', KEYS[3], field)
+        end
+    end
+end
+"""
+
+# ARGV: now, lease expiry, global limit, client limit, client, then job id/cost pairs
+# Returns "" when admitted, else the scope whose limit was reached.
+_ADMIT_SCRIPT = _RELEASE_FUNCTION + """
+local now = tonumber(ARGV[1])
+for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now)) do
+    release(job_id)
+end
+
+local client_field = 'client:' .. ARGV[5]
+local cost = 0
+for i = 6, #ARGV, 2 do
+    cost = cost + tonumber(ARGV[i + 1])
+end
+local limits = {{'global', 'global', tonumber(ARGV[3])}, {'client', client_field, tonumber(ARGV[4])}}
+for _, limit in ipairs(limits) do
+    local used = tonumber(redis.call('HGET', KEYS[3], limit[2]) or '0')
+    if limit[3] > 0 and used > 0 and used + cost > limit[3] then
+        return limit[1]
+    end
+end
+
+for i = 6, #ARGV, 2 do
+    redis.call('ZADD', KEYS[1], tonumber(ARGV[2]), ARGV[i])
+    redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1] .. '|' .. ARGV[5])
+end
+redis.call('HINCRBY', KEYS[3], 'global', cost)
+redis.call('HINCRBY', KEYS[3], client_field, cost)
+return ''
+"""
+
+# ARGV: job ids
+_RELEASE_SCRIPT = _RELEASE_FUNCTION + """
+for _, job_id in ipairs(ARGV) do
+    release(job_id)
+end
+return 0
+"""
+
+
+class AdmissionRejectedError(RuntimeError):
+    """The queue's token budget is exhausted; the client should retry later."""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Server is at capacity ({scope} token budget); retry after {retry_after:g}s")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def estimate_cost(prompt: str, max_new_tokens: Optional[int] = None) -> int:
+    """Tokens a request may consume: its estimated prompt plus the completion limit."""
+    if max_new_tokens is None:
+        max_new_tokens = Config.load().max_new_tokens
+    return estimate_tokens(prompt) + max_new_tokens
+
+
+class AdmissionController:
+    """Per-client and global budgets of outstanding tokens, kept in Redis."""
+
+    def __init__(
+        self,
+        connection: redis.Redis,
+        global_token_limit: int = 0,
+        client_token_limit: int = 0,
+        lease_seconds: float = 3600.0,
+        max_wait_seconds: float = 0.0,
+        retry_after_seconds: float = 5.0,
+        async_connection: Optional[aioredis.Redis] = None,
+    ):
+        self.connection = connection
+        self.async_connection = async_connection
+        self.global_token_limit = global_token_limit
+        self.client_token_limit = client_token_limit
+        self.lease_seconds = lease_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.retry_after_seconds = retry_after_seconds
+        self._admit = connection.register_script(_ADMIT_SCRIPT)
+        self._release = connection.register_script(_RELEASE_SCRIPT)
+        if async_connection is not None:
+            self._aadmit = async_connection.register_script(_ADMIT_SCRIPT)
+            self._arelease = async_connection.register_script(_RELEASE_SCRIPT)
+
+    def _admit_args(self, client: str, reservations: list[tuple[str, int]]) -> dict:
+        now = time.time()
+        args = [now, now + self.lease_seconds, self.global_token_limit, self.client_token_limit, client]
+        for job_id, cost in reservations:
+            args.extend([job_id, cost])
+        return {"keys": [LEASES_KEY, JOBS_KEY, TOKENS_KEY], "args": args}
+
+    def _rejected(self, scope: bytes, client: str, cost: int) -> AdmissionRejectedError:
+        scope = scope.decode()
+        metrics.ADMISSION_REJECTED_TOTAL.labels(scope=scope).inc()
+        logger.warning(f"Rejected {cost} tokens from client {client}: {scope} token budget is full")
+        return AdmissionRejectedError(scope, self.retry_after_seconds)
+
+    def admit(self, client: str, reservations: list[tuple[str, int]]) -> None:
+        """Reserves (job_id, cost) pairs for client, all or none.
+
+        Waits up to max_wait_seconds for budget to free up, then raises
+        AdmissionRejectedError.
+        """
+        if not reservations:
+            return
+        deadline = time.monotonic() + self.max_wait_seconds
+        while True:
+            scope = self._admit(**self._admit_args(client, reservations))
+            if not scope:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise self._rejected(scope, client, sum(cost for _, cost in reservations))
+            time.sleep(min(self.retry_after_seconds, MAX_POLL_SECONDS, remaining))
+
+    async def aadmit(self, client: str, reservations: list[tuple[str, int]]) -> None:
+        """Async admit, using the controller's redis.asyncio connection."""
+        if not reservations:
+            return
+        deadline = time.monotonic() + self.max_wait_seconds
+        while True:
+            scope = await self._aadmit(**self._admit_args(client, reservations))
+            if not scope:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise self._rejected(scope, client, sum(cost for _, cost in reservations))
+            await asyncio.sleep(min(self.retry_after_seconds, MAX_POLL_SECONDS, remaining))
+
+    def release(self, *job_ids: str, pipeline=None) -> None:
+        """Returns the reserved tokens of finished jobs; unknown ids are ignored.
+
+        With a pipeline, the release is queued on it and runs when it executes.
+        """
+        if job_ids:
+            self._release(keys=[LEASES_KEY, JOBS_KEY, TOKENS_KEY], args=list(job_ids), client=pipeline)
+
+    async def arelease(self, *job_ids: str) -> None:
+        """Async release, using the controller's redis.asyncio connection."""
+        if job_ids:
+            await self._arelease(keys=[LEASES_KEY, JOBS_KEY, TOKENS_KEY], args=list(job_ids))
+
+    def outstanding(self) -> dict[str, int]:
+        """Returns the outstanding tokens, globally and per client."""
+        return {field.decode(): int(value) for field, value in self.connection.hgetall(TOKENS_KEY).items()}
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> Optional[AdmissionController]:
+    """Returns the process-wide controller, or None when admission control is disabled."""
+    global _controller
+    config = Config.load()
+    if not config.admission_enabled:
+        return None
+    if _controller is None:
+        _controller = AdmissionController(
+            redis.from_url(config.redis_url),
+            global_token_limit=config.admission_global_token_limit,
+            client_token_limit=config.admission_client_token_limit,
+            lease_seconds=config.admission_lease_seconds,
+            max_wait_seconds=config.admission_max_wait_seconds,
+            retry_after_seconds=config.admission_retry_after_seconds,
+            async_connection=aioredis.from_url(config.redis_url),
+        )
+    return _controller
+
+
+def _reset_controller() -> None:
+    global _controller
+    _controller = None
+
+
+on_reload(_reset_controller)
+
+
+def release_admission(job_id: str, pipeline=None) -> None:
+    """Returns a finished job's reserved tokens when admission control is enabled."""
+    controller = get_admission_controller()
+    if controller is not None:
+        controller.release(job_id, pipeline=pipeline)
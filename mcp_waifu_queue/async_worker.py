@@ -0,0 +1,348 @@
+"""
+Asyncio Worker Engine.
+
+This module implements an asyncio-based alternative to the RQ worker. Instead
+of blocking one process on a single provider call, it pulls jobs from the same
+Redis queues and keeps many provider calls in flight at once on one event loop.
+
+Key Features:
+- Dequeues jobs enqueued by task_queue.add_to_queue (same RQ queues and keys)
+- Configurable number of concurrently running jobs
+- Weighted scheduling across priority lanes, like the RQ worker
+- Per-job timeouts (the job's own RQ timeout, or a configured default)
+- Graceful shutdown on SIGINT/SIGTERM: stop dequeuing (even while every
+  slot is busy), drain in-flight jobs, requeue whatever is still running when
+  the grace period expires
+- Running jobs are recorded as executions in the queue's StartedJobRegistry,
+  as the RQ worker does, so RQ's registry cleanup fails or retries the jobs
+  of a worker that died
+- Writes statuses and results through RQ's job API so
+  task_queue.get_job_status_from_queue reports them unchanged
+- Publishes a completion notification, and returns the job's admission
+  budget, in the same transaction
+- Records the same per-lane job metrics as the RQ worker
+- Jobs that return an rq.Retry (throttled provider calls) are scheduled to
+  run again after the retry's interval (or requeued at the back of their
+  queue without one), as the RQ worker does, until Retry.max is reached.
+  The worker runs RQ's scheduler to put due jobs back on their queues
+
+Execution:
+Jobs whose function is utils.call_predict_response are awaited through the
+async provider path (utils.acall_predict_response). Any other job function is
+run in a thread so foreign jobs on the same queue still complete.
+
+Usage:
+    python -m mcp_waifu_queue.async_worker
+    # or: WORKER_MODE=async python -m mcp_waifu_queue.worker
+
+Dependencies:
+- redis, rq: Queue access and job bookkeeping
+- http_client: Shared async HTTP client, closed on shutdown
+- utils: The async prediction entry point
+- lanes: Weighted lane ordering
+- config: Concurrency, timeout and shutdown settings (read at startup) and
+  lane weights (read on each dequeue, so settings reloads apply)
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import signal
+import socket
+import traceback
+from datetime import timedelta
+from typing import Optional
+
+import redis
+from rq import Queue, Retry
+from rq.exceptions import DequeueTimeout
+from rq.executions import Execution
+from rq.job import Job, JobStatus
+from rq.scheduler import RQScheduler
+from rq.utils import now
+
+from mcp_waifu_queue import http_client, metrics
+from mcp_waifu_queue.admission import release_admission
+from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.lanes import weighted_order
+from mcp_waifu_queue.notifications import publish_completion
+from mcp_waifu_queue.serializer import get_serializer
+from mcp_waifu_queue.settings import install_reload_signal
+from mcp_waifu_queue.utils import acall_predict_response
+
+logger = logging.getLogger(__name__)
+
+# Seconds a single blocking dequeue waits; bounds how long shutdown takes to notice.
+DEQUEUE_TIMEOUT = 1
+# Matches rq's default result_ttl for jobs enqueued without one.
+DEFAULT_RESULT_TTL = 500
+# Seconds a started-registry entry outlives the job's timeout. The worker does not
+# heartbeat, so an entry lasts until the job ends or this expires (the worker died).
+EXECUTION_TTL_MARGIN = 60
+# Started-registry TTL of jobs enqueued without a timeout (timeout=-1).
+UNLIMITED_EXECUTION_TTL = 24 * 3600
+# Seconds between checks for scheduled jobs that are due.
+SCHEDULER_INTERVAL = 1
+
+ASYNC_FUNCS = {
+    "mcp_waifu_queue.utils.call_predict_response": acall_predict_response,
+}
+
+
+class AsyncWorker:
+    """Runs queued jobs concurrently on a single asyncio event loop."""
+
+    def __init__(
+        self,
+        queues: list[Queue],
+        connection: redis.Redis,
+        concurrency: int = 16,
+        default_timeout: int = 180,
+        shutdown_grace: int = 30,
+        name: Optional[str] = None,
+        lane_weights: Optional[dict[str, int]] = None,
+    ):
+        self.queues = queues
+        # None follows the configured lane weights, re-read on each dequeue so reloads apply.
+        self.lane_weights = lane_weights
+        self.connection = connection
+        self.concurrency = max(1, concurrency)
+        self.default_timeout = default_timeout
+        self.shutdown_grace = shutdown_grace
+        self.name = name or f"async-{socket.gethostname()}.{os.getpid()}"
+        self._stop = asyncio.Event()
+        self._tasks: set[asyncio.Task] = set()
+        self._executions: dict[str, Execution] = {}
+
+    def request_stop(self) -> None:
+        """Stops dequeuing new jobs; in-flight jobs are allowed to drain."""
+        if not self._stop.is_set():
+            logger.info(f"Worker {self.name}: shutdown requested")
+            self._stop.set()
+
+    async def run(self) -> None:
+        """Main loop: dequeue while a slot is free, until stop is requested."""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            # Not supported on this platform or not in the main thread
+            with contextlib.suppress(NotImplementedError, RuntimeError):
+                loop.add_signal_handler(sig, self.request_stop)
+
+        slots = asyncio.Semaphore(self.concurrency)
+        queue_names = ", ".join(q.name for q in self.queues)
+        logger.info(f"Worker {self.name}: listening on {queue_names} (concurrency={self.concurrency})")
+        scheduler = asyncio.create_task(self._schedule())
+        try:
+            while await self._acquire_slot(slots):
+                try:
+                    dequeued = await self._dequeue()
+                except Exception:
+                    slots.release()
+                    logger.exception(f"Worker {self.name}: dequeue failed")
+                    await asyncio.sleep(DEQUEUE_TIMEOUT)
+                    continue
+                if dequeued is None:
+                    slots.release()
+                    continue
+                job, queue = dequeued
+                task = asyncio.create_task(self._perform(job, queue))
+                self._tasks.add(task)
+                task.add_done_callback(lambda t: (self._tasks.discard(t), slots.release()))
+        finally:
+            self._stop.set()
+            await self._drain()
+            await scheduler
+            await http_client.aclose()
+
+    async def _acquire_slot(self, slots: asyncio.Semaphore) -> bool:
+        """Waits for a free slot; returns False, holding none, once stop is requested."""
+        acquire = asyncio.ensure_future(slots.acquire())
+        stop = asyncio.ensure_future(self._stop.wait())
+        await asyncio.wait({acquire, stop}, return_when=asyncio.FIRST_COMPLETED)
+        stop.cancel()
+        if not self._stop.is_set():
+            return True
+        if not acquire.cancel():
+            slots.release()  # The slot was acquired as stop was requested.
+        return False
+
+    async def _schedule(self) -> None:
+        """Moves due scheduled jobs onto their queues, like `rq worker --with-scheduler`."""
+        scheduler = RQScheduler(
+            self.queues, connection=self.connection, interval=SCHEDULER_INTERVAL, serializer=self.queues[0].serializer
+        )
+        try:
+            while not self._stop.is_set():
+                try:
+                    await asyncio.to_thread(self._enqueue_scheduled, scheduler)
+                except Exception:
+                    logger.exception(f"Worker {self.name}: enqueueing scheduled jobs failed")
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._stop.wait(), timeout=scheduler.interval)
+        finally:
+            if scheduler.acquired_locks:
+                await asyncio.to_thread(scheduler.release_locks)
+
+    @staticmethod
+    def _enqueue_scheduled(scheduler: RQScheduler) -> None:
+        # One scheduler per queue holds its lock; the others keep trying to take it over.
+        if scheduler.should_reacquire_locks:
+            scheduler.acquire_locks()
+        if scheduler.acquired_locks:
+            scheduler.enqueue_scheduled_jobs()
+            scheduler.heartbeat()
+
+    async def _dequeue(self) -> Optional[tuple[Job, Queue]]:
+        weights = self.lane_weights or Config.load().lanes
+        queues = weighted_order(self.queues, [weights.get(q.name, 1) for q in self.queues])
+        try:
+            return await asyncio.to_thread(
+                Queue.dequeue_any,
+                queues,
+                DEQUEUE_TIMEOUT,
+                connection=self.connection,
+                serializer=queues[0].serializer,
+            )
+        except DequeueTimeout:
+            return None
+
+    async def _drain(self) -> None:
+        if not self._tasks:
+            return
+        logger.info(f"Worker {self.name}: waiting up to {self.shutdown_grace}s for {len(self._tasks)} job(s)")
+        _, pending = await asyncio.wait(set(self._tasks), timeout=self.shutdown_grace)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def _execution_ttl(self, job: Job) -> int:
+        timeout = job.timeout or self.default_timeout
+        return UNLIMITED_EXECUTION_TTL if timeout == -1 else int(timeout) + EXECUTION_TTL_MARGIN
+
+    def _end_execution(self, job: Job, pipeline) -> None:
+        execution = self._executions.pop(job.id, None)
+        if execution is not None:
+            execution.delete(job=job, pipeline=pipeline)
+
+    def _mark_started(self, job: Job, queue: Queue) -> None:
+        with self.connection.pipeline() as pipeline:
+            job.prepare_for_execution(self.name, pipeline=pipeline)
+            self._executions[job.id] = Execution.create(job, self._execution_ttl(job), pipeline=pipeline)
+            # Single-queue dequeues go through rq's intermediate queue; claim the job from it.
+            pipeline.lrem(queue.intermediate_queue_key, 1, job.id)
+            pipeline.execute()
+
+    def _mark_finished(self, job: Job, result) -> None:
+        job._result = result
+        job.ended_at = now()
+        result_ttl = job.get_result_ttl(DEFAULT_RESULT_TTL)
+        with self.connection.pipeline() as pipeline:
+            self._end_execution(job, pipeline)
+            job._handle_success(result_ttl, pipeline=pipeline, worker_name=self.name)
+            job.cleanup(result_ttl, pipeline=pipeline, remove_from_queue=False)
+            release_admission(job.id, pipeline=pipeline)
+            publish_completion(pipeline, job.id, "completed")
+            pipeline.execute()
+
+    def _mark_retry(self, job: Job, queue: Queue, retry: Retry) -> bool:
+        """Schedules (or requeues) a job that asked to be retried; returns False once retries are used up."""
+        if job.number_of_retries and job.number_of_retries >= retry.max:
+            return False
+        job.ended_at = now()
+        interval = Retry.get_interval(job.number_of_retries or 0, retry.intervals)
+        with self.connection.pipeline() as pipeline:
+            self._end_execution(job, pipeline)
+            if interval > 0:
+                job.number_of_retries = (job.number_of_retries or 0) + 1
+                job.set_status(JobStatus.SCHEDULED, pipeline=pipeline)
+                queue.schedule_job(job, now() + timedelta(seconds=interval), pipeline=pipeline)
+            else:
+                job._handle_retry_result(queue=queue, pipeline=pipeline, worker_name=self.name)
+            pipeline.execute()
+        return True
+
+    def _mark_failed(self, job: Job, exc_string: str) -> None:
+        job.ended_at = now()
+        with self.connection.pipeline() as pipeline:
+            self._end_execution(job, pipeline)
+            job.set_status(JobStatus.FAILED, pipeline=pipeline)
+            job._handle_failure(exc_string, pipeline=pipeline, worker_name=self.name)
+            release_admission(job.id, pipeline=pipeline)
+            publish_completion(pipeline, job.id, "failed")
+            pipeline.execute()
+
+    def _requeue(self, job: Job, queue: Queue) -> None:
+        with self.connection.pipeline() as pipeline:
+            # enqueue_job starts a MULTI on the pipeline, so it has to queue the first command.
+            queue.enqueue_job(job, pipeline=pipeline, at_front=True)
+            self._end_execution(job, pipeline)
+            pipeline.execute()
+
+    async def _call(self, job: Job):
+        async_func = ASYNC_FUNCS.get(job.func_name)
+        if async_func is not None:
+            return await async_func(*job.args, job_id=job.id, **job.kwargs)
+        result = await asyncio.to_thread(job.func, *job.args, **job.kwargs)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    async def _perform(self, job: Job, queue: Queue) -> None:
+        metrics.observe_job_started(job)
+        await asyncio.to_thread(self._mark_started, job, queue)
+        timeout = job.timeout or self.default_timeout
+        try:
+            if timeout == -1:
+                result = await self._call(job)
+            else:
+                result = await asyncio.wait_for(self._call(job), timeout=timeout)
+        except asyncio.CancelledError:
+            # Shutdown grace expired: put the job back so another worker picks it up.
+            logger.warning(f"Worker {self.name}: requeueing interrupted job {job.id}")
+            await asyncio.to_thread(self._requeue, job, queue)
+            raise
+        except asyncio.TimeoutError:
+            logger.error(f"Worker {self.name}: job {job.id} exceeded timeout of {timeout}s")
+            exc_string = f"JobTimeoutException: Task exceeded maximum timeout value ({timeout} seconds)"
+            await asyncio.to_thread(self._mark_failed, job, exc_string)
+            metrics.observe_job(job, "failed")
+        except Exception:
+            logger.error(f"Worker {self.name}: job {job.id} failed", exc_info=True)
+            await asyncio.to_thread(self._mark_failed, job, traceback.format_exc())
+            metrics.observe_job(job, "failed")
+        else:
+            if isinstance(result, Retry):
+                if await asyncio.to_thread(self._mark_retry, job, queue, result):
+                    logger.info(f"Worker {self.name}: job {job.id} will be retried")
+                    metrics.observe_job(job, "requeued")
+                else:
+                    exc_string = f"Job failed after {result.max} retry attempts"
+                    await asyncio.to_thread(self._mark_failed, job, exc_string)
+                    metrics.observe_job(job, "failed")
+                return
+            await asyncio.to_thread(self._mark_finished, job, result)
+            metrics.observe_job(job, "completed")
+            logger.info(f"Worker {self.name}: job {job.id} completed")
+
+
+def run(config: Config, listen: list[str]) -> None:
+    """Builds an AsyncWorker from config and runs it until shutdown."""
+    install_reload_signal()
+    conn = redis.from_url(config.redis_url)
+    worker = AsyncWorker(
+        [Queue(name, connection=conn, serializer=get_serializer()) for name in listen],
+        connection=conn,
+        concurrency=config.async_worker_concurrency,
+        default_timeout=config.async_worker_default_timeout_seconds,
+        shutdown_grace=config.async_worker_shutdown_grace_seconds,
+    )
+    asyncio.run(worker.run())
+
+
+if __name__ == '__main__':
+    from mcp_waifu_queue.worker import listen
+
+    logging.basicConfig(level=logging.INFO)
+    run(Config.load(), listen)
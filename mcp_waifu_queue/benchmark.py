@@ -0,0 +1,506 @@
+"""
+Offline Benchmark Harness.
+
+This module measures the enqueue -> worker -> result path end to end without
+network access or API keys, so throughput and latency regressions can be
+caught before they ship.
+
+Key Features:
+- Mock OpenRouter server: a local, OpenRouter-compatible chat completions
+  endpoint (plain and SSE streaming) with configurable latency distribution
+  (fixed, uniform or lognormal), error rate (503) and throttle rate (429 with
+  Retry-After)
+- Redis: an in-process fakeredis server by default, or a real Redis through
+  --redis-url
+- Workers: the asyncio worker or RQ SimpleWorker threads run in the benchmark
+  process; --worker none leaves the queue to externally started workers
+  (real Redis only; they call whichever provider they are configured for,
+  e.g. PROVIDER=local)
+- Load: prompts are submitted through the MCP generate_text tool at a fixed
+  or Poisson arrival rate, and each job is polled through the job://
+  resource, so the MCP layer is part of the measurement
+- Report: jobs/s and mean/p50/p95/p99/max for each stage (enqueue, queue
+  wait, execution, end to end), written as JSON
+- --baseline compares the run with an earlier JSON result
+- --startup measures cold import time of the server and worker modules
+  instead (see Startup Mode)
+
+Stages:
+- enqueue: generate_text call, as seen by the client
+- queue_wait: RQ enqueued_at to started_at (the last attempt, for requeued jobs)
+- execution: RQ started_at to ended_at
+- end_to_end: submission until job:// first reports a final status (includes
+  up to one --poll-interval of polling delay)
+
+Startup Mode:
+Each of task_queue, main and worker is imported --repeats times, each time
+in a fresh interpreter, with REDIS_URL pointing at a port nothing listens
+on. An import that connects to Redis therefore fails the run. The report
+gives import time percentiles per module. It also lists which worker-only
+modules (the job function and the provider stack) each import loaded, and the
+MCP server should load none of them.
+
+Usage:
+    python -m mcp_waifu_queue.benchmark --startup --repeats 10 --output startup.json
+    python -m mcp_waifu_queue.benchmark --rate 50 --jobs 500 --output results.json
+    python -m mcp_waifu_queue.benchmark --worker rq --concurrency 8 --latency-ms 200
+    python -m mcp_waifu_queue.benchmark --error-rate 0.05 --baseline results.json
+
+Dependencies:
+- fakeredis (test extra): In-process Redis when no --redis-url is given
+- task_queue / main: The MCP app and queues under test
+- worker / async_worker: The worker engines under test
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("enqueue", "queue_wait", "execution", "end_to_end")
+FINAL_STATUSES = ("completed", "failed")
+
+STARTUP_MODULES = ("mcp_waifu_queue.task_queue", "mcp_waifu_queue.main", "mcp_waifu_queue.worker")
+# Needed only to run jobs; the startup report shows which of them an import pulled in.
+WORKER_ONLY_MODULES = (
+    "mcp_waifu_queue.utils",
+    "mcp_waifu_queue.resilience",
+    "mcp_waifu_queue.providers.router",
+    "mcp_waifu_queue.providers.openrouter",
+)
+# Nothing listens here, so an import that connects to Redis fails.
+UNREACHABLE_REDIS_URL = "redis://127.0.0.1:1/0"
+_IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {worker_only!r} if m in sys.modules]}}))
+"""
+
+
+class MockOpenRouter:
+    """OpenRouter-compatible chat completions server with injected latency and errors."""
+
+    def __init__(
+        self,
+        latency_ms: float = 50.0,
+        distribution: str = "lognormal",
+        sigma: float = 0.5,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.latency_ms = latency_ms
+        self.distribution = distribution
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.counts = {"requests": 0, "errors": 0, "throttled": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/v1/chat/completions"
+
+    def sample_latency(self) -> float:
+        """One response delay in seconds, drawn from the configured distribution."""
+        mean = self.latency_ms / 1000.0
+        if mean <= 0:
+            return 0.0
+        with self._lock:
+            if self.distribution == "fixed":
+                return mean
+            if self.distribution == "uniform":
+                return self._rng.uniform(0.5 * mean, 1.5 * mean)
+            return self._rng.lognormvariate(math.log(mean) - self.sigma ** 2 / 2, self.sigma)
+
+    def outcome(self) -> int:
+        """The status code for the next response."""
+        with self._lock:
+            self.counts["requests"] += 1
+            roll = self._rng.random()
+            if roll < self.throttle_rate:
+                self.counts["throttled"] += 1
+                return 429
+            if roll < self.throttle_rate + self.error_rate:
+                self.counts["errors"] += 1
+                return 503
+            return 200
+
+    def start(self) -> "MockOpenRouter":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _MockHandler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        threading.Thread(target=self._server.serve_forever, name="mock-openrouter", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: Optional[dict] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        mock: MockOpenRouter = self.server.mock
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(mock.sample_latency())
+        status = mock.outcome()
+        if status == 429:
+            self._send(429, b'{"error": {"message": "rate limited"}}', headers={"Retry-After": "1"})
+            return
+        if status != 200:
+            self._send(status, b'{"error": {"message": "upstream unavailable"}}')
+            return
+        prompt = payload["messages"][-1]["content"]
+        content = f"mock reply to: {prompt[:64]}"
+        if not payload.get("stream"):
+            body = {"choices": [{"message": {"role": "assistant", "content": content}}]}
+            self._send(200, json.dumps(body).encode("utf-8"))
+            return
+        events = [{"choices": [{"delta": {"content": word + " "}}]} for word in content.split()]
+        stream = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+        self._send(200, stream.encode("utf-8"), content_type="text/event-stream")
+
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, q in [0, 100]."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(seconds: list[float]) -> dict:
+    """Count and mean/p50/p95/p99/max in milliseconds."""
+    if not seconds:
+        return {"count": 0}
+    ms = [s * 1000 for s in seconds]
+    return {
+        "count": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 3),
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(max(ms), 3),
+    }
+
+
+def _use_fakeredis() -> None:
+    """Routes every redis.from_url in this process to one in-memory server."""
+    try:
+        import fakeredis
+    except ImportError as e:
+        raise SystemExit("fakeredis is required without --redis-url: pip install -e .[test]") from e
+    import redis
+    import redis.asyncio as aioredis
+
+    server = fakeredis.FakeServer()
+    redis.from_url = lambda *args, **kwargs: fakeredis.FakeRedis(server=server)
+    aioredis.from_url = lambda *args, **kwargs: fakeredis.FakeAsyncRedis(server=server)
+
+
+def _tool_result(content) -> dict:
+    # FastMCP returns either the content list or (content, structured output).
+    if isinstance(content, tuple):
+        content = content[0]
+    return json.loads(content[0].text)
+
+
+async def _submit_and_wait(app, index: int, args) -> dict:
+    submitted = time.perf_counter()
+    request = {"prompt": f"benchmark prompt {index} {os.urandom(4).hex()}"}
+    if args.lane:
+        request["lane"] = args.lane
+    job_id = _tool_result(await app.call_tool("generate_text", {"request": request}))["job_id"]
+    enqueued = time.perf_counter()
+    deadline = submitted + args.job_timeout
+    status = "queued"
+    while time.perf_counter() < deadline:
+        contents = await app.read_resource(f"job://{job_id}")
+        status = json.loads(next(iter(contents)).content)["status"]
+        if status in FINAL_STATUSES:
+            break
+        await asyncio.sleep(args.poll_interval)
+    else:
+        status = "timeout"
+    finished = time.perf_counter()
+    return {
+        "job_id": job_id,
+        "status": status,
+        "submitted": submitted,
+        "finished": finished,
+        "enqueue": enqueued - submitted,
+        "end_to_end": finished - submitted,
+    }
+
+
+async def _generate_load(app, args) -> list[dict]:
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    due = 0.0
+    tasks = []
+    for index in range(args.jobs):
+        delay = started + due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(_submit_and_wait(app, index, args)))
+        due += rng.expovariate(args.rate) if args.arrival == "poisson" else 1.0 / args.rate
+    return await asyncio.gather(*tasks)
+
+
+def _start_rq_workers(queues, connection, count: int, log_level: str) -> list:
+    from rq.timeouts import TimerDeathPenalty
+
+    from mcp_waifu_queue.worker import NotifyingSimpleWorker
+
+    class BenchmarkWorker(NotifyingSimpleWorker):
+        # Runs in a thread: no signal handlers, timer-based job timeouts, short dequeue blocks.
+        death_penalty_class = TimerDeathPenalty
+
+        @property
+        def dequeue_timeout(self) -> int:
+            return 1
+
+        def dequeue_job_and_maintain_ttl(self, timeout, max_idle_time=None):
+            # RQ keeps blocking until a job arrives; give up each second to notice the stop request.
+            while not self._stop_requested:
+                result = super().dequeue_job_and_maintain_ttl(timeout, max_idle_time=1)
+                if result is not None:
+                    return result
+            return None
+
+        def _install_signal_handlers(self) -> None:
+            pass
+
+    workers = []
+    for index in range(count):
+        worker = BenchmarkWorker(
+            queues, connection=connection, serializer=queues[0].serializer, name=f"benchmark-{os.getpid()}-{index}"
+        )
+        thread = threading.Thread(
+            target=worker.work, kwargs={"logging_level": log_level.upper()}, name=worker.name, daemon=True
+        )
+        thread.start()
+        workers.append((worker, thread))
+    return workers
+
+
+def _stage_timings(records: list[dict], connection, serializer) -> None:
+    """Adds queue_wait and execution from the RQ job timestamps of completed jobs."""
+    from rq.job import Job
+
+    completed = [r for r in records if r["status"] == "completed"]
+    jobs = Job.fetch_many([r["job_id"] for r in completed], connection=connection, serializer=serializer)
+    for record, job in zip(completed, jobs, strict=True):
+        if job is None or not (job.enqueued_at and job.started_at and job.ended_at):
+            continue
+        record["queue_wait"] = max(0.0, (job.started_at - job.enqueued_at).total_seconds())
+        record["execution"] = max(0.0, (job.ended_at - job.started_at).total_seconds())
+
+
+def build_report(records: list[dict], args, mock: MockOpenRouter) -> dict:
+    counts = dict.fromkeys(("completed", "failed", "timeout"), 0)
+    for record in records:
+        counts[record["status"]] = counts.get(record["status"], 0) + 1
+    completed = [r for r in records if r["status"] == "completed"]
+    throughput = None
+    if completed:
+        elapsed = max(r["finished"] for r in completed) - min(r["submitted"] for r in records)
+        throughput = round(len(completed) / elapsed, 3) if elapsed > 0 else None
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "parameters": {name: value for name, value in vars(args).items() if name not in ("output", "baseline")},
+        "jobs": {"submitted": len(records), **counts},
+        "throughput_jobs_per_second": throughput,
+        "stages": {stage: summarize([r[stage] for r in completed if stage in r]) for stage in STAGES},
+        "mock_provider": dict(mock.counts),
+    }
+
+
+def measure_import(module: str, repeats: int) -> dict:
+    """Times `import module` in fresh interpreters that cannot reach Redis."""
+    probe = _IMPORT_PROBE.format(module=module, worker_only=WORKER_ONLY_MODULES)
+    env = dict(os.environ, REDIS_URL=UNREACHABLE_REDIS_URL)
+    samples, loaded = [], []
+    for _ in range(repeats):
+        done = subprocess.run([sys.executable, "-c", probe], env=env, capture_output=True, text=True, timeout=120)
+        if done.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{done.stderr}")
+        result = json.loads(done.stdout.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        loaded = result["loaded"]
+    return {**summarize(samples), "worker_only_modules_loaded": loaded}
+
+
+def run_startup(args) -> dict:
+    """Measures the cold import time of every STARTUP_MODULES entry."""
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "parameters": {"repeats": args.repeats},
+        "imports": {module: measure_import(module, args.repeats) for module in STARTUP_MODULES},
+    }
+
+
+def compare(report: dict, baseline: dict) -> str:
+    """A text table of throughput and stage (or import) percentiles against a baseline run."""
+
+    def delta(new, old) -> str:
+        if new is None or old is None:
+            return f"{old} -> {new}"
+        change = f" ({(new - old) / old * 100:+.1f}%)" if old else ""
+        return f"{old} -> {new}{change}"
+
+    if "imports" in report:
+        lines = []
+        for module, new in report["imports"].items():
+            old = baseline.get("imports", {}).get(module, {})
+            for key in ("p50_ms", "p95_ms"):
+                lines.append(f"{module}.{key}: {delta(new.get(key), old.get(key))}")
+        return "\n".join(lines)
+
+    lines = [f"throughput_jobs_per_second: {delta(report['throughput_jobs_per_second'], baseline.get('throughput_jobs_per_second'))}"]
+    for stage in STAGES:
+        new, old = report["stages"].get(stage, {}), baseline.get("stages", {}).get(stage, {})
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            lines.append(f"{stage}.{key}: {delta(new.get(key), old.get(key))}")
+    return "\n".join(lines)
+
+
+async def run(args) -> dict:
+    """Starts the mock provider and workers, drives the load and returns the report."""
+    mock = MockOpenRouter(
+        latency_ms=args.latency_ms,
+        distribution=args.latency_distribution,
+        sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed,
+    ).start()
+
+    os.environ["PROVIDER"] = "openrouter"
+    os.environ["PROVIDER_BACKENDS"] = "[]"
+    os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+    if args.redis_url:
+        os.environ["REDIS_URL"] = args.redis_url
+    else:
+        _use_fakeredis()
+
+    # Imported only now so configuration and Redis connections see the settings above.
+    from mcp_waifu_queue import main, task_queue
+    from mcp_waifu_queue.providers import openrouter
+
+    openrouter.OPENROUTER_API_URL = mock.url
+    queues = list(task_queue.queues.values())
+    if not args.redis_url:
+        for queue in queues:
+            queue.redis_server_version = (7, 0, 0)  # fakeredis has no INFO command
+
+    worker_task = None
+    rq_workers = []
+    if args.worker == "async":
+        from mcp_waifu_queue.async_worker import AsyncWorker
+
+        async_worker = AsyncWorker(queues, connection=task_queue.conn, concurrency=args.concurrency)
+        worker_task = asyncio.create_task(async_worker.run())
+    elif args.worker == "rq":
+        rq_workers = _start_rq_workers(queues, task_queue.conn, args.concurrency, args.log_level)
+
+    try:
+        records = await _generate_load(main.app, args)
+    finally:
+        if worker_task is not None:
+            async_worker.request_stop()
+            await worker_task
+        for worker, _ in rq_workers:
+            worker._stop_requested = True
+        for _, thread in rq_workers:
+            await asyncio.to_thread(thread.join, 5)
+        mock.stop()
+
+    await asyncio.to_thread(_stage_timings, records, task_queue.conn, task_queue.serializer)
+    return build_report(records, args, mock)
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the enqueue -> worker -> result path.")
+    parser.add_argument("--jobs", type=int, default=200, help="Number of prompts to submit")
+    parser.add_argument("--rate", type=float, default=20.0, help="Submissions per second")
+    parser.add_argument("--arrival", choices=("fixed", "poisson"), default="fixed", help="Inter-arrival times")
+    parser.add_argument("--lane", default=None, help="Lane to submit to (default lane if omitted)")
+    parser.add_argument("--worker", choices=("async", "rq", "none"), default="async", help="Worker engine to run in process")
+    parser.add_argument("--concurrency", type=int, default=16, help="Async worker concurrency, or number of RQ worker threads")
+    parser.add_argument("--redis-url", default=None, help="Real Redis to use instead of fakeredis")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mean mock provider latency")
+    parser.add_argument("--latency-distribution", choices=("fixed", "uniform", "lognormal"), default="lognormal")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Lognormal shape parameter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of mock responses that are 503s")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of mock responses that are 429s")
+    parser.add_argument("--poll-interval", type=float, default=0.02, help="Seconds between job:// polls")
+    parser.add_argument("--job-timeout", type=float, default=60.0, help="Seconds before a job counts as timed out")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for arrivals and the mock provider")
+    parser.add_argument("--output", default=None, help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", default=None, help="Earlier JSON report to compare against")
+    parser.add_argument("--startup", action="store_true", help="Measure cold import time instead of the queue")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh-interpreter imports per module (--startup)")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+    if args.repeats <= 0:
+        parser.error("--repeats must be positive")
+    if args.rate <= 0 or args.jobs <= 0:
+        parser.error("--rate and --jobs must be positive")
+    if args.worker == "none" and not args.redis_url:
+        parser.error("--worker none needs --redis-url so external workers can reach the queue")
+    return args
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(levelname)s - %(message)s")
+    report = run_startup(args) if args.startup else asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Benchmark report written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            print(compare(report, json.load(f)), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
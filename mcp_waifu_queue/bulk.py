@@ -0,0 +1,346 @@
+"""
+Bulk JSONL Generation.
+
+This module streams a JSONL file of prompts through the queue and writes the
+completions to an output JSONL file, for offline dataset generation without
+scripting thousands of generate_text calls and job:// polls.
+
+Key Features:
+- Streaming input: the file is read one line at a time, so memory stays
+  constant however large it is
+- Bounded concurrency: at most --concurrency jobs are queued or running at
+  once; prompts are enqueued in pipelined chunks of up to --chunk-size through
+  the batch enqueue path (response cache and admission control included)
+- Completion by push: jobs are awaited through the workers' completion
+  notifications (notifications.py) instead of polling
+- Results are written as they complete, in completion order, each row
+  carrying the input line's index
+- Checkpoint and resume: progress is saved to <output>.checkpoint every few
+  seconds. A rerun with the same arguments truncates the output to the last
+  checkpoint, skips finished rows and reattaches to jobs that were still in
+  flight, so nothing already generated is generated again (as long as their
+  results are still in Redis; expired ones are enqueued again). The
+  checkpoint is removed once every row is written. A row whose job could not
+  be tracked (e.g. Redis went away) is logged and counted under "errors";
+  the run then stops reading, waits for the jobs in flight and exits
+  non-zero, keeping the checkpoint with the row still in flight so a rerun
+  picks it up again
+- Admission rejections are retried after the server's retry-after hint
+- --cache-namespace sends the jobs to a near-duplicate cache namespace
+  (similarity_cache.py), so datasets full of near-identical prompts reuse
+  completions when the workers opted that namespace in
+
+Input Rows:
+- {"prompt": "...", "id": "optional, copied to the output"}
+- Blank lines are skipped; unparseable lines produce a row with status
+  "invalid"
+
+Output Rows:
+- {"index": 0, "id": "...", "job_id": "...", "status": "completed", "result": "..."}
+- status is "completed", "failed" or "invalid"
+
+Checkpoint:
+Every row before the watermark is finished, so the checkpoint holds only the
+watermark, the finished rows after it and the jobs in flight. Reading runs at
+most --window rows ahead of the watermark, which bounds all three however
+long a single slow job holds the watermark back.
+
+Usage:
+    python -m mcp_waifu_queue.bulk prompts.jsonl results.jsonl --concurrency 256 --lane bulk
+
+Dependencies:
+- task_queue: Batch enqueue and status reads (async API)
+- notifications: Completion listener
+- admission: Rejections to back off on
+- config: Redis URL and batch size limit
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Iterator, Optional
+
+from mcp_waifu_queue.admission import AdmissionRejectedError
+from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.notifications import TERMINAL_STATUSES, CompletionListener
+from mcp_waifu_queue.task_queue import (
+    aadd_batch_to_queue,
+    aget_job_status_from_queue,
+    aget_job_statuses_from_queue,
+)
+
+logger = logging.getLogger(__name__)
+
+# Longest single wait on the completion listener before the job is re-checked.
+WAIT_SLICE_SECONDS = 60.0
+
+
+def read_rows(path: str) -> Iterator[tuple[int, Optional[dict], Optional[str]]]:
+    """Yields (index, row, error) per non-blank input line; index is the 0-based line number."""
+    with open(path, encoding="utf-8") as f:
+        for index, line in enumerate(f):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                if not isinstance(row, dict) or not isinstance(row.get("prompt"), str):
+                    raise ValueError('expected an object with a string "prompt"')
+            except ValueError as e:
+                yield index, None, f"line {index + 1}: {e}"
+                continue
+            yield index, row, None
+
+
+class Checkpoint:
+    """Finished rows (watermark plus finished rows after it) and jobs in flight."""
+
+    def __init__(self, path: str, input_path: str):
+        self.path = path
+        self.input_path = input_path
+        self.watermark = 0
+        self.done: set[int] = set()
+        # None until the row's job is enqueued.
+        self.inflight: dict[int, Optional[str]] = {}
+        self.output_bytes = 0
+
+    def is_done(self, index: int) -> bool:
+        return index < self.watermark or index in self.done
+
+    def finish(self, index: int) -> None:
+        self.inflight.pop(index, None)
+        self.done.add(index)
+
+    def advance(self, next_index: int) -> None:
+        """Moves the watermark past finished rows and the blank lines between them, up to next_index."""
+        while self.watermark < next_index and self.watermark not in self.inflight:
+            self.done.discard(self.watermark)
+            self.watermark += 1
+
+    def save(self, output_bytes: int) -> None:
+        self.output_bytes = output_bytes
+        state = {
+            "input": os.path.abspath(self.input_path),
+            "watermark": self.watermark,
+            "done": sorted(self.done),
+            "inflight": {str(index): job_id for index, job_id in self.inflight.items() if job_id},
+            "output_bytes": output_bytes,
+        }
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    @classmethod
+    def load(cls, path: str, input_path: str) -> "Checkpoint":
+        checkpoint = cls(path, input_path)
+        if not os.path.exists(path):
+            return checkpoint
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state["input"] != os.path.abspath(input_path):
+            raise ValueError(f"Checkpoint {path} belongs to input {state['input']}")
+        checkpoint.watermark = state["watermark"]
+        checkpoint.done = set(state["done"])
+        checkpoint.inflight = {int(index): job_id for index, job_id in state["inflight"].items()}
+        checkpoint.output_bytes = state["output_bytes"]
+        return checkpoint
+
+
+class BulkRun:
+    """Feeds input rows to the queue and writes results as jobs finish."""
+
+    def __init__(self, args, checkpoint: Checkpoint, output, listener: CompletionListener):
+        self.args = args
+        self.checkpoint = checkpoint
+        self.output = output
+        self.listener = listener
+        self.slots = asyncio.Semaphore(args.concurrency)
+        self.progress = asyncio.Condition()
+        self.tasks: set[asyncio.Task] = set()
+        self.counts = {"completed": 0, "failed": 0, "invalid": 0, "errors": 0}
+        self._saved_at = time.monotonic()
+        # Reattached on resume: index -> job id of a job enqueued by the previous run.
+        self.resumed = dict(checkpoint.inflight)
+
+    def _write(self, index: int, row: dict) -> None:
+        self.output.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.counts[row["status"]] += 1
+        self.checkpoint.finish(index)
+
+    def _maybe_save(self, next_index: int, force: bool = False) -> None:
+        self.checkpoint.advance(next_index)
+        if force or time.monotonic() - self._saved_at >= self.args.checkpoint_interval:
+            self.output.flush()
+            os.fsync(self.output.fileno())
+            self.checkpoint.save(self.output.tell())
+            self._saved_at = time.monotonic()
+            logger.info(
+                f"Checkpoint at row {self.checkpoint.watermark}: {self.counts}, {len(self.checkpoint.inflight)} in flight"
+            )
+
+    async def _track(self, index: int, extra: dict, job_id: str) -> None:
+        try:
+            status = None
+            while status not in TERMINAL_STATUSES:
+                status = await self.listener.wait(job_id, timeout=WAIT_SLICE_SECONDS)
+                if status == "unknown":
+                    break
+            if status == "unknown":
+                row = {"index": index, **extra, "job_id": job_id, "status": "failed", "result": None}
+                logger.warning(f"Row {index}: job {job_id} no longer exists")
+            else:
+                status, result = await aget_job_status_from_queue(job_id)
+                row = {"index": index, **extra, "job_id": job_id, "status": status, "result": result}
+            self._write(index, row)
+        except Exception as e:
+            # The row stays in flight, so the checkpoint keeps it for a rerun.
+            logger.error(f"Row {index}: tracking job {job_id} failed: {e!r}")
+            self.counts["errors"] += 1
+        finally:
+            self.slots.release()
+            async with self.progress:
+                self.progress.notify_all()
+
+    def _start_tracking(self, index: int, extra: dict, job_id: str) -> None:
+        self.checkpoint.inflight[index] = job_id
+        task = asyncio.create_task(self._track(index, extra, job_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _enqueue(self, chunk: list[tuple[int, dict]]) -> None:
+        prompts = [row["prompt"] for _, row in chunk]
+        while True:
+            try:
+                _, job_ids = await aadd_batch_to_queue(
+                    prompts, self.args.lane, self.args.result_ttl, self.args.client_id, self.args.cache_namespace
+                )
+                break
+            except AdmissionRejectedError as e:
+                logger.warning(f"Enqueue rejected ({e.scope} budget); retrying in {e.retry_after:g}s")
+                await asyncio.sleep(e.retry_after)
+        for (index, row), job_id in zip(chunk, job_ids, strict=True):
+            self._start_tracking(index, _extra(row), job_id)
+
+    async def _resume(self, index: int, row: dict) -> bool:
+        """Reattaches to the previous run's job for this row; False if it has to be enqueued again."""
+        job_id = self.resumed.pop(index)
+        (status,) = await aget_job_statuses_from_queue([job_id])
+        if status == "unknown":
+            logger.info(f"Row {index}: job {job_id} has expired; enqueueing it again")
+            return False
+        self._start_tracking(index, _extra(row), job_id)
+        return True
+
+    async def _wait_for_window(self, index: int) -> None:
+        async with self.progress:
+            while index - self.checkpoint.watermark >= self.args.window and not self.counts["errors"]:
+                self.checkpoint.advance(index)
+                if index - self.checkpoint.watermark < self.args.window:
+                    break
+                await self.progress.wait()
+
+    async def run(self) -> dict:
+        chunk: list[tuple[int, dict]] = []
+        next_index = 0
+        for index, row, error in read_rows(self.args.input):
+            if self.counts["errors"]:
+                # An unfinished row holds the watermark back for good; stop and let a rerun resume.
+                chunk = []
+                break
+            next_index = index + 1
+            if self.checkpoint.is_done(index):
+                continue
+            if chunk and (self.slots.locked() or index - self.checkpoint.watermark >= self.args.window):
+                await self._enqueue(chunk)
+                chunk = []
+            await self._wait_for_window(index)
+            if error is not None:
+                self._write(index, {"index": index, "status": "invalid", "error": error})
+                self._maybe_save(index)
+                continue
+            self.checkpoint.inflight.setdefault(index, None)
+            await self.slots.acquire()
+            if index in self.resumed and await self._resume(index, row):
+                continue
+            chunk.append((index, row))
+            if len(chunk) >= self.args.chunk_size:
+                await self._enqueue(chunk)
+                chunk = []
+            self._maybe_save(index)
+        if chunk:
+            await self._enqueue(chunk)
+        while self.tasks:
+            await asyncio.wait(set(self.tasks), timeout=self.args.checkpoint_interval)
+            self._maybe_save(next_index)
+        self._maybe_save(next_index, force=True)
+        return self.counts
+
+
+def _extra(row: dict) -> dict:
+    return {"id": row["id"]} if "id" in row else {}
+
+
+async def run(args) -> dict:
+    checkpoint_path = args.checkpoint or args.output + ".checkpoint"
+    checkpoint = Checkpoint.load(checkpoint_path, args.input)
+    resuming = os.path.exists(checkpoint_path)
+    if resuming:
+        logger.info(f"Resuming from row {checkpoint.watermark} ({len(checkpoint.inflight)} jobs in flight)")
+        with open(args.output, "r+b") as f:
+            f.truncate(checkpoint.output_bytes)
+    listener = CompletionListener(Config.load().redis_url, aget_job_statuses_from_queue)
+    try:
+        with open(args.output, "a" if resuming else "w", encoding="utf-8") as output:
+            counts = await BulkRun(args, checkpoint, output, listener).run()
+    finally:
+        await listener.close()
+    if checkpoint.inflight:
+        logger.error(f"{len(checkpoint.inflight)} row(s) unfinished; keeping {checkpoint_path} for a rerun")
+    else:
+        os.remove(checkpoint_path)
+    return counts
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    config = Config.load()
+    parser = argparse.ArgumentParser(description="Generate completions for a JSONL file of prompts.")
+    parser.add_argument("input", help="JSONL file of {\"prompt\": ...} rows")
+    parser.add_argument("output", help="JSONL file the results are written to")
+    parser.add_argument("--concurrency", type=int, default=256, help="Jobs queued or running at once")
+    parser.add_argument("--chunk-size", type=int, default=64, help="Prompts per pipelined enqueue")
+    parser.add_argument("--window", type=int, default=0,
+                        help="Rows read ahead of the oldest unfinished row (default: 16 x concurrency)")
+    parser.add_argument("--lane", default=None, help="Priority lane (default: bulk, if configured)")
+    parser.add_argument("--result-ttl", type=int, default=None, help="Seconds to keep each result in Redis")
+    parser.add_argument("--client-id", default="bulk", help="Admission control budget to charge")
+    parser.add_argument("--cache-namespace", default=None, help="Near-duplicate cache namespace of the jobs")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--checkpoint-interval", type=float, default=5.0, help="Seconds between checkpoints")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be positive")
+    if not 1 <= args.chunk_size <= config.max_batch_size:
+        parser.error(f"--chunk-size must be between 1 and {config.max_batch_size}")
+    if args.lane is None and "bulk" in config.lanes:
+        args.lane = "bulk"
+    args.window = args.window or 16 * args.concurrency
+    if args.window < args.concurrency:
+        parser.error("--window must be at least --concurrency")
+    return args
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(levelname)s - %(message)s")
+    counts = asyncio.run(run(args))
+    print(json.dumps(counts), file=sys.stderr)
+    return 0 if counts["failed"] == 0 and counts["invalid"] == 0 and counts["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,209 @@
+"""
+Content-Addressed Response Cache.
+
+This module implements an optional Redis-backed cache of generated responses.
+Entries are keyed on a hash of everything that determines the completion
+(prompt, model, temperature, max tokens and stop sequences), so repeated
+prompts can be served without a provider round trip.
+
+Key Features:
+- SHA-256 content addressing of generation inputs
+- Per-entry TTL, renewed on every hit, so an entry expires after going
+  unread for that long
+- Entries are keyed on the model that produced them, which after a failover
+  is not the requested one (see respond.served_params)
+- Memory bounds: entry-count cap with least-recently-used eviction, and a
+  maximum stored size per entry
+- Hit/miss counters kept in Redis so every server and worker shares them,
+  and mirrored in the process's waifu_cache_lookups_total metric
+- Async lookups (aget/aget_many/astats) over redis.asyncio for the MCP server
+
+Redis Layout:
+- waifu:cache:resp:<sha256>: Cached completion text (string, with TTL)
+- waifu:cache:lru: Sorted set of cache keys scored by last access time
+- waifu:cache:stats: Hash of hits/misses/stores/evictions counters
+
+Usage:
+    cache = get_response_cache()
+    if cache is not None:
+        key = cache_key(prompt, **generation_params())
+        cached = cache.get(key)
+
+Dependencies:
+- redis: Storage backend
+- config: Enablement, TTL and size limits
+- metrics: Hit/miss counter
+"""
+
+import hashlib
+import json
+import logging
+import time
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from mcp_waifu_queue import metrics
+from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.settings import on_reload
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "waifu:cache:resp:"
+LRU_KEY = "waifu:cache:lru"
+STATS_KEY = "waifu:cache:stats"
+
+
+def fingerprint(
+    prompt: str, model: str, temperature: float, max_tokens: int, stop: Optional[list[str]] = None
+) -> str:
+    """Returns a SHA-256 hex digest of the inputs that determine a completion."""
+    inputs = [prompt, model, temperature, max_tokens]
+    if stop:
+        inputs.append(stop)
+    material = json.dumps(inputs, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def cache_key(
+    prompt: str, model: str, temperature: float, max_tokens: int, stop: Optional[list[str]] = None
+) -> str:
+    """Returns the Redis key addressing a completion for these inputs."""
+    return KEY_PREFIX + fingerprint(prompt, model, temperature, max_tokens, stop)
+
+
+class ResponseCache:
+    """Redis-backed, TTL- and size-bounded cache of completions."""
+
+    def __init__(
+        self,
+        connection: redis.Redis,
+        ttl_seconds: int = 3600,
+        max_entries: int = 10000,
+        max_entry_bytes: int = 65536,
+        async_connection: Optional[aioredis.Redis] = None,
+    ):
+        self.connection = connection
+        self.async_connection = async_connection
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached completion for key, counting the hit or miss."""
+        return self.get_many([key])[0]
+
+    def get_many(self, keys: list[str]) -> list[Optional[str]]:
+        """Bulk get: one MGET for all keys, with hits and misses counted."""
+        if not keys:
+            return []
+        values = self.connection.mget(keys)
+        with self.connection.pipeline(transaction=False) as pipe:
+            self._count_lookups(pipe, keys, values)
+            pipe.execute()
+        return [value.decode("utf-8") if value is not None else None for value in values]
+
+    async def aget(self, key: str) -> Optional[str]:
+        """Async get, using the cache's redis.asyncio connection."""
+        return (await self.aget_many([key]))[0]
+
+    async def aget_many(self, keys: list[str]) -> list[Optional[str]]:
+        """Async bulk get, using the cache's redis.asyncio connection."""
+        if not keys:
+            return []
+        values = await self.async_connection.mget(keys)
+        async with self.async_connection.pipeline(transaction=False) as pipe:
+            self._count_lookups(pipe, keys, values)
+            await pipe.execute()
+        return [value.decode("utf-8") if value is not None else None for value in values]
+
+    def _count_lookups(self, pipe, keys: list[str], values: list) -> None:
+        hits = {key: time.time() for key, value in zip(keys, values, strict=True) if value is not None}
+        metrics.CACHE_LOOKUPS_TOTAL.labels(result="hit").inc(len(hits))
+        metrics.CACHE_LOOKUPS_TOTAL.labels(result="miss").inc(len(keys) - len(hits))
+        if hits:
+            pipe.hincrby(STATS_KEY, "hits", len(hits))
+            pipe.zadd(LRU_KEY, hits)
+            for key in hits:
+                pipe.expire(key, self.ttl_seconds)
+        if len(keys) > len(hits):
+            pipe.hincrby(STATS_KEY, "misses", len(keys) - len(hits))
+
+    def set(self, key: str, value: str) -> bool:
+        """Stores a completion, evicting least-recently-used entries over the cap."""
+        data = value.encode("utf-8")
+        if len(data) > self.max_entry_bytes:
+            logger.debug(f"Not caching {len(data)} byte response (limit {self.max_entry_bytes})")
+            return False
+        now = time.time()
+        with self.connection.pipeline(transaction=False) as pipe:
+            pipe.set(key, data, ex=self.ttl_seconds)
+            pipe.zadd(LRU_KEY, {key: now})
+            # Entries idle for longer than the TTL have already expired.
+            pipe.zremrangebyscore(LRU_KEY, "-inf", now - self.ttl_seconds)
+            pipe.hincrby(STATS_KEY, "stores", 1)
+            pipe.zcard(LRU_KEY)
+            size = pipe.execute()[-1]
+        if size > self.max_entries:
+            self._evict(size - self.max_entries)
+        return True
+
+    def _evict(self, count: int) -> None:
+        evicted = [member for member, _ in self.connection.zpopmin(LRU_KEY, count)]
+        if evicted:
+            with self.connection.pipeline(transaction=False) as pipe:
+                pipe.delete(*evicted)
+                pipe.hincrby(STATS_KEY, "evictions", len(evicted))
+                pipe.execute()
+
+    def stats(self) -> dict[str, int]:
+        """Returns the shared hit/miss/store/eviction counters and current size."""
+        with self.connection.pipeline(transaction=False) as pipe:
+            pipe.hgetall(STATS_KEY)
+            pipe.zcard(LRU_KEY)
+            raw, size = pipe.execute()
+        return self._format_stats(raw, size)
+
+    async def astats(self) -> dict[str, int]:
+        """Async stats, using the cache's redis.asyncio connection."""
+        async with self.async_connection.pipeline(transaction=False) as pipe:
+            pipe.hgetall(STATS_KEY)
+            pipe.zcard(LRU_KEY)
+            raw, size = await pipe.execute()
+        return self._format_stats(raw, size)
+
+    @staticmethod
+    def _format_stats(raw: dict, size: int) -> dict[str, int]:
+        counters = {k.decode(): int(v) for k, v in raw.items()}
+        stats = {name: counters.get(name, 0) for name in ("hits", "misses", "stores", "evictions")}
+        stats["entries"] = size
+        return stats
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Returns the process-wide cache, or None when caching is disabled."""
+    global _cache
+    config = Config.load()
+    if not config.response_cache_enabled:
+        return None
+    if _cache is None:
+        _cache = ResponseCache(
+            redis.from_url(config.redis_url),
+            ttl_seconds=config.response_cache_ttl_seconds,
+            max_entries=config.response_cache_max_entries,
+            max_entry_bytes=config.response_cache_max_entry_bytes,
+            async_connection=aioredis.from_url(config.redis_url),
+        )
+    return _cache
+
+
+def _reset_cache() -> None:
+    global _cache
+    _cache = None
+
+
+on_reload(_reset_cache)
@@ -13,18 +13,54 @@ Key Features:
 - Comprehensive field descriptions for documentation
 
 Configuration Fields:
-- max_new_tokens: Maximum tokens for AI generation (default: 2048)
+- max_new_tokens: Maximum tokens for AI generation (default: 2048); sent to the
+  provider with every request that does not ask for its own max_tokens
+- max_tokens_limit / max_stop_sequences / allowed_models: Caps on the
+  per-request generation parameters of generate_text
 - redis_url: Redis server connection URL (default: redis://localhost:6379)
 - default_provider: Default AI provider (default: openrouter)
 - request_timeout_seconds: HTTP request timeout (default: 60)
+- http_*: Pool size, connect timeout and HTTP/2 for the shared provider client
+- worker_fork_per_job: Fork a work-horse per RQ job (default: False)
+- worker_mode: "rq" for the RQ worker, "async" for the asyncio worker
+- worker_metrics_port: Port on which workers serve /metrics (default: 0, off)
+- async_worker_*: Concurrency, timeout and shutdown settings for the async worker
+- response_cache_*: Optional Redis response cache (enablement, TTL, size bounds)
+- similarity_cache_*: Near-duplicate cache (opted-in namespaces, similarity
+  threshold, LSH shape, candidate limit, TTL)
+- request_coalescing_*: Attach identical in-flight prompts to a single job
+- max_batch_size: Maximum number of prompts accepted by generate_text_batch
+- streaming_enabled / stream_*: Stream partial completions through Redis
+- wait_max_timeout_seconds: Longest wait_for_job call the server accepts
+- lanes / default_lane: Priority lanes (one RQ queue each) and their scheduling weights
+- rate_limit_* / provider_concurrency_*: Fleet-wide provider rate limits and AIMD concurrency bounds
+- provider_retry_* / hedge_* / circuit_breaker_*: Retries, hedged requests and circuit breaker for provider calls
+- provider_backends / router_*: Provider/model backends and latency-aware routing between them
+- local_provider_*: Latency and failure rate of the offline stub provider
+- job_serializer / job_compression*: Compact JSON job payloads and their compression
+- result_ttl_seconds / result_ttl_max_seconds: Default and largest per-request result retention
+- admission_*: Token-budget admission control on enqueue (global and per-client limits)
+- session_*: History window and lifetime of multi-turn sessions
+- supervisor_*: Worker pool bounds, queue-wait target and timing of the autoscaling supervisor
+- profile_*: Sampled stack profiles of worker jobs (sample rate, slow-job
+  threshold, sampling interval and output directory)
 
 Provider Support:
 - OpenRouter (default)
-- Google Gemini (fallback/override)
+- Local stub (offline testing)
 
 The load() classmethod allows runtime provider override via the PROVIDER
 environment variable while maintaining Pydantic's immutability guarantees.
 
+Caching:
+load() is called on the hot path of every job, so it returns one cached,
+process-wide instance instead of re-parsing the environment and .env each
+time. The cache is rebuilt when the .env file's modification time changes
+(checked at most once per second) or after Config.invalidate(), which the
+SIGHUP handler in settings.py calls. Code that calls load() where it uses a
+setting follows either change; the clients built from Config (caches, rate
+limiters, the provider router...) are rebuilt only by settings.reload().
+
 Usage:
     config = Config.load()  # Load with optional PROVIDER override
     redis_url = config.redis_url
@@ -32,10 +68,23 @@ Usage:
 """
 
 import os
+import threading
+import time
+from typing import Optional
 
-from pydantic import Field
+from pydantic import Field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# Seconds between checks of the .env file's modification time in Config.load().
+RECHECK_SECONDS = 1.0
+
+_lock = threading.Lock()
+_cached: Optional["Config"] = None
+_cached_mtime: Optional[float] = None
+_checked_at = 0.0
+# Bumped by invalidate(), so a load() that read the old settings does not cache them.
+_generation = 0
+
 
 class Config(BaseSettings):
     """Configuration for the Waifu Queue API."""
@@ -46,7 +95,22 @@ class Config(BaseSettings):
 
     max_new_tokens: int = Field(
         default=2048,
-        description="Maximum number of new tokens to generate (used for provider config if needed).",
+        description="Maximum number of new tokens to generate when a request does not set max_tokens.",
+    )
+    max_tokens_limit: int = Field(
+        default=4096,
+        description="Largest max_tokens a request may ask for.",
+    )
+    max_stop_sequences: int = Field(
+        default=4,
+        description="Largest number of stop sequences a request may set.",
+    )
+    allowed_models: list[str] = Field(
+        default=[],
+        description=(
+            "Models a request may select, as a JSON list. The models of the configured backends "
+            "(and the primary backend's default model) are always allowed."
+        ),
     )
     redis_url: str = Field(
         default="redis://localhost:6379", description="URL of the Redis server."
@@ -59,19 +123,389 @@ class Config(BaseSettings):
         default=60,
         description="HTTP request timeout for providers that use HTTP clients.",
     )
+    http_connect_timeout_seconds: float = Field(
+        default=10.0,
+        description="Connect timeout for the shared provider HTTP client.",
+    )
+    http_max_connections: int = Field(
+        default=20,
+        description="Maximum number of concurrent connections in the provider HTTP pool.",
+    )
+    http_max_keepalive_connections: int = Field(
+        default=10,
+        description="Maximum number of idle keep-alive connections kept in the pool.",
+    )
+    http_keepalive_expiry_seconds: float = Field(
+        default=30.0,
+        description="Seconds an idle keep-alive connection is kept before being closed.",
+    )
+    http2_enabled: bool = Field(
+        default=True,
+        description="Negotiate HTTP/2 with providers when the 'h2' package is installed.",
+    )
+    worker_fork_per_job: bool = Field(
+        default=False,
+        description="Fork a fresh RQ work-horse per job. Disabling this keeps provider connections alive across jobs.",
+    )
+    worker_mode: str = Field(
+        default="rq",
+        description="Worker engine started by mcp_waifu_queue.worker: 'rq' or 'async'.",
+    )
+    worker_metrics_port: int = Field(
+        default=0,
+        description="Port on which a worker serves Prometheus metrics at /metrics (0 disables it).",
+    )
+    async_worker_concurrency: int = Field(
+        default=16,
+        description="Maximum number of jobs the async worker runs concurrently.",
+    )
+    async_worker_default_timeout_seconds: int = Field(
+        default=180,
+        description="Job timeout applied by the async worker when a job has none of its own.",
+    )
+    async_worker_shutdown_grace_seconds: int = Field(
+        default=30,
+        description="Seconds the async worker waits for in-flight jobs on shutdown before requeueing them.",
+    )
+    response_cache_enabled: bool = Field(
+        default=False,
+        description="Serve repeated (prompt, model, temperature, max tokens) requests from a Redis cache.",
+    )
+    response_cache_ttl_seconds: int = Field(
+        default=3600,
+        description="Seconds a cached response stays valid.",
+    )
+    response_cache_max_entries: int = Field(
+        default=10000,
+        description="Maximum number of cached responses; least recently used entries are evicted first.",
+    )
+    response_cache_max_entry_bytes: int = Field(
+        default=65536,
+        description="Responses larger than this many bytes are not cached.",
+    )
+    similarity_cache_namespaces: list[str] = Field(
+        default=[],
+        description=(
+            "Cache namespaces whose prompts are looked up in and stored to the near-duplicate cache. Requests "
+            "name theirs with cache_namespace ('default' when they do not); empty disables the cache."
+        ),
+    )
+    similarity_cache_threshold: float = Field(
+        default=0.9,
+        gt=0.0,
+        le=1.0,
+        description="Estimated Jaccard similarity of normalized prompts at which a stored completion is served.",
+    )
+    similarity_cache_bands: int = Field(default=16, ge=1, description="LSH bands the MinHash signature is cut into.")
+    similarity_cache_rows: int = Field(default=8, ge=1, description="MinHash values per LSH band.")
+    similarity_cache_max_candidates: int = Field(
+        default=32, ge=1, description="Most stored prompts compared against a lookup."
+    )
+    similarity_cache_ttl_seconds: int = Field(
+        default=3600, description="Seconds a near-duplicate cache entry is kept after it was stored."
+    )
+    request_coalescing_enabled: bool = Field(
+        default=False,
+        description="Attach identical prompts to a job that is already queued or running instead of enqueueing duplicates.",
+    )
+    request_coalescing_ttl_seconds: int = Field(
+        default=600,
+        description="Upper bound on how long an in-flight marker is kept for coalescing.",
+    )
+    max_batch_size: int = Field(
+        default=1000,
+        description="Maximum number of prompts accepted in one generate_text_batch call.",
+    )
+    streaming_enabled: bool = Field(
+        default=False,
+        description="Stream completions from the provider and publish partial text to a Redis stream per job.",
+    )
+    stream_ttl_seconds: int = Field(
+        default=3600,
+        description="Seconds a job's Redis stream of partial text is kept.",
+    )
+    stream_max_wait_ms: int = Field(
+        default=10000,
+        description="Upper bound on how long read_stream may block waiting for new text.",
+    )
+    wait_max_timeout_seconds: int = Field(
+        default=60,
+        description="Upper bound on the timeout accepted by the wait_for_job tool.",
+    )
+    lanes: dict[str, int] = Field(
+        default={"interactive": 8, "default": 3, "bulk": 1},
+        description="Priority lanes (RQ queue names) mapped to scheduling weights; set LANES as a JSON object.",
+    )
+    default_lane: str = Field(
+        default="default",
+        description="Lane used when a request does not name one.",
+    )
+
+    rate_limit_enabled: bool = Field(
+        default=False,
+        description="Admit provider calls through the Redis-shared rate limiter and adaptive concurrency limit.",
+    )
+    rate_limit_requests_per_minute: int = Field(
+        default=60,
+        description="Provider requests per minute across all workers (0 disables this bucket).",
+    )
+    rate_limit_tokens_per_minute: int = Field(
+        default=0,
+        description="Estimated provider tokens per minute across all workers (0 disables this bucket).",
+    )
+    rate_limit_max_wait_seconds: float = Field(
+        default=30.0,
+        description="Longest a job waits for admission before it is requeued as throttled.",
+    )
+    rate_limit_max_requeues: int = Field(
+        default=20,
+        description="Times a throttled job is requeued before it is marked failed.",
+    )
+    provider_concurrency_min: int = Field(
+        default=1,
+        description="Lower bound of the adaptive limit on concurrent provider calls.",
+    )
+    provider_concurrency_max: int = Field(
+        default=32,
+        description="Upper bound (and starting value) of the adaptive limit on concurrent provider calls.",
+    )
+
+    provider_retry_max_attempts: int = Field(
+        default=3,
+        description="Attempts per provider call, including the first, for transport errors, timeouts and 5xx responses.",
+    )
+    provider_retry_base_delay_seconds: float = Field(
+        default=0.5,
+        description="Base of the jittered exponential backoff between provider retries.",
+    )
+    provider_retry_max_delay_seconds: float = Field(
+        default=8.0,
+        description="Upper bound on a single backoff delay between provider retries.",
+    )
+    hedge_enabled: bool = Field(
+        default=False,
+        description="Send a second request when a non-streaming provider call runs longer than the recent p95 latency.",
+    )
+    hedge_min_samples: int = Field(
+        default=20,
+        description="Successful calls observed before hedging starts.",
+    )
+    hedge_min_delay_seconds: float = Field(
+        default=0.5,
+        description="Lower bound on the delay before a hedged request is sent.",
+    )
+    circuit_breaker_failure_threshold: int = Field(
+        default=5,
+        description="Consecutive retryable provider failures that open the circuit breaker (0 disables it).",
+    )
+    circuit_breaker_reset_seconds: float = Field(
+        default=30.0,
+        description="Seconds the circuit stays open before a trial call is allowed.",
+    )
+
+    provider_backends: list[str] = Field(
+        default=[],
+        description="Backends to route between, as 'provider' or 'provider:model' (JSON list); empty uses default_provider.",
+    )
+    router_ewma_alpha: float = Field(
+        default=0.2,
+        description="Weight of the newest sample in each backend's latency and error-rate EWMA.",
+    )
+    router_max_error_rate: float = Field(
+        default=0.5,
+        description="Backends whose error-rate EWMA exceeds this are skipped while alternatives exist.",
+    )
+    router_unhealthy_cooldown_seconds: float = Field(
+        default=30.0,
+        description="Seconds after its last failure before an unhealthy backend is tried again.",
+    )
+    router_explore_ratio: float = Field(
+        default=0.05,
+        description="Share of calls sent to a random healthy backend to keep latency estimates fresh.",
+    )
+    local_provider_latency_seconds: float = Field(
+        default=0.0,
+        description="Artificial delay of the local stub provider.",
+    )
+    local_provider_failure_rate: float = Field(
+        default=0.0,
+        description="Fraction of local stub provider calls that fail with a simulated 503.",
+    )
+    job_serializer: str = Field(
+        default="compact",
+        description="Job payload and result encoding: 'compact' (tagged JSON) or 'pickle' (RQ's default).",
+    )
+    job_compression: str = Field(
+        default="zlib",
+        description="Compression of compact payloads above the threshold: 'zlib', 'zstd' or 'none'.",
+    )
+    job_compression_threshold_bytes: int = Field(
+        default=1024,
+        description="Compact payloads larger than this many bytes are compressed.",
+    )
+    result_ttl_seconds: int = Field(
+        default=3600,
+        description="Seconds a job's result is kept when the request does not choose a retention.",
+    )
+    result_ttl_max_seconds: int = Field(
+        default=86400,
+        description="Largest result retention a request may ask for.",
+    )
+    admission_enabled: bool = Field(
+        default=False,
+        description="Reject or defer new requests while too many estimated tokens are queued or running.",
+    )
+    admission_global_token_limit: int = Field(
+        default=2_000_000,
+        description="Outstanding estimated tokens (prompt plus max_new_tokens) across all clients (0 disables this limit).",
+    )
+    admission_client_token_limit: int = Field(
+        default=200_000,
+        description="Outstanding estimated tokens per client (0 disables this limit).",
+    )
+    admission_max_wait_seconds: float = Field(
+        default=0.0,
+        description="Longest an enqueue waits for budget to free up before it is rejected.",
+    )
+    admission_retry_after_seconds: float = Field(
+        default=5.0,
+        description="Retry-after hint returned with a rejection.",
+    )
+    admission_lease_seconds: float = Field(
+        default=3600.0,
+        description="Seconds after which a job's reserved tokens are returned even if no worker released them.",
+    )
+    session_ttl_seconds: int = Field(
+        default=86400,
+        description="Seconds a conversation session is kept after its last turn.",
+    )
+    session_max_messages: int = Field(
+        default=40,
+        ge=2,
+        description="Messages kept per session; beyond this the oldest half is dropped at once.",
+    )
+    supervisor_min_workers: int = Field(
+        default=1,
+        description="Fewest worker processes the supervisor keeps running.",
+    )
+    supervisor_max_workers: int = Field(
+        default=4,
+        description="Most worker processes the supervisor runs.",
+    )
+    supervisor_target_queue_wait_seconds: float = Field(
+        default=10.0,
+        description="Queue wait the supervisor aims for; older queued jobs make the pool grow.",
+    )
+    supervisor_backlog_per_worker: int = Field(
+        default=0,
+        description="Queued jobs per worker before another is started (0 uses the worker's concurrency).",
+    )
+    supervisor_interval_seconds: float = Field(
+        default=2.0,
+        description="Seconds between the supervisor's checks of queue depth and worker health.",
+    )
+    supervisor_scale_down_delay_seconds: float = Field(
+        default=60.0,
+        description="Seconds the backlog must stay low before the supervisor removes a worker.",
+    )
+    supervisor_drain_timeout_seconds: float = Field(
+        default=300.0,
+        description="Seconds a worker being removed may spend finishing its jobs before it is killed.",
+    )
+    profile_sample_rate: float = Field(
+        default=0.0,
+        ge=0.0,
+        le=1.0,
+        description="Fraction of RQ worker jobs whose stacks are sampled and written to profile_dir (0 disables).",
+    )
+    profile_slow_job_seconds: float = Field(
+        default=0.0,
+        ge=0.0,
+        description="Also write the profile of any RQ worker job running at least this long; every job is then sampled (0 disables).",
+    )
+    profile_interval_seconds: float = Field(
+        default=0.01, gt=0.0, description="Seconds between stack samples of a profiled job."
+    )
+    profile_dir: str = Field(default="profiles", description="Directory job profiles are written to.")
+
+    @model_validator(mode="after")
+    def _check_lanes(self) -> "Config":
+        if not self.lanes:
+            raise ValueError("At least one lane must be configured")
+        if any(weight <= 0 for weight in self.lanes.values()):
+            raise ValueError("Lane weights must be positive")
+        if self.default_lane not in self.lanes:
+            raise ValueError(f"default_lane '{self.default_lane}' is not one of the configured lanes")
+        return self
+
+    @model_validator(mode="after")
+    def _check_generation_caps(self) -> "Config":
+        if not 0 < self.max_new_tokens <= self.max_tokens_limit:
+            raise ValueError("max_new_tokens must be positive and at most max_tokens_limit")
+        return self
+
+    @model_validator(mode="after")
+    def _check_job_encoding(self) -> "Config":
+        if self.job_serializer not in ("compact", "pickle"):
+            raise ValueError("job_serializer must be 'compact' or 'pickle'")
+        if self.job_compression not in ("zlib", "zstd", "none"):
+            raise ValueError("job_compression must be 'zlib', 'zstd' or 'none'")
+        if not 0 < self.result_ttl_seconds <= self.result_ttl_max_seconds:
+            raise ValueError("result_ttl_seconds must be positive and at most result_ttl_max_seconds")
+        return self
+
+    @model_validator(mode="after")
+    def _check_supervisor(self) -> "Config":
+        if not 0 <= self.supervisor_min_workers <= self.supervisor_max_workers or self.supervisor_max_workers < 1:
+            raise ValueError("supervisor workers need 0 <= min <= max and max >= 1")
+        if self.supervisor_target_queue_wait_seconds <= 0:
+            raise ValueError("supervisor_target_queue_wait_seconds must be positive")
+        return self
 
     @classmethod
     def load(cls) -> "Config":
+        """Returns the cached configuration, reloading it if .env changed."""
+        global _cached, _cached_mtime, _checked_at
+        now = time.monotonic()
+        with _lock:
+            cached, cached_mtime, generation = _cached, _cached_mtime, _generation
+            if cached is not None and now - _checked_at < RECHECK_SECONDS:
+                return cached
+            _checked_at = now
+        # Stat and parse .env without the lock; only the swap below holds it.
+        mtime = cls._env_file_mtime()
+        if cached is not None and mtime == cached_mtime:
+            return cached
+        config = cls._read()
+        with _lock:
+            if generation == _generation:
+                _cached, _cached_mtime = config, mtime
+        return config
+
+    @classmethod
+    def invalidate(cls) -> None:
+        """Drops the cached configuration; the next load() re-reads it."""
+        global _cached, _generation
+        with _lock:
+            _cached = None
+            _generation += 1
+
+    @classmethod
+    def _env_file_mtime(cls) -> Optional[float]:
+        try:
+            return os.stat(cls.model_config["env_file"]).st_mtime
+        except (OSError, TypeError):
+            return None
+
+    @classmethod
+    def _read(cls) -> "Config":
         """Loads the configuration from environment variables and/or a .env file."""
         # Allow explicit override via PROVIDER env var while still keeping Pydantic immutability.
         cfg = cls()
         provider_env = os.getenv("PROVIDER")
         if provider_env and provider_env.strip():
             # Create a new instance with overridden provider to honor frozen dataclass
-            return cls.model_construct(
-                max_new_tokens=cfg.max_new_tokens,
-                redis_url=cfg.redis_url,
-                default_provider=provider_env.strip().lower(),
-                request_timeout_seconds=cfg.request_timeout_seconds,
+            return cfg.model_copy(
+                update={"default_provider": provider_env.strip().lower()}
             )
-        return cfg
\ No newline at end of file
+        return cfg
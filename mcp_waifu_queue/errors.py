@@ -0,0 +1,56 @@
+"""
+Provider Error Types.
+
+This module defines the exceptions raised for failed provider calls, so the
+rate limiter and the workers can tell a throttled request apart from a broken
+one instead of matching on RuntimeError messages.
+
+Key Features:
+- ProviderError: Non-200 provider response, carrying the HTTP status and any
+  Retry-After delay the provider asked for
+- ProviderThrottledError: The provider (HTTP 429) or the shared rate limiter refused
+  the request; the job should be requeued rather than failed
+- parse_retry_after(): Reads a Retry-After header in either of its HTTP forms
+
+Both exceptions subclass RuntimeError, so existing callers that catch
+RuntimeError keep working.
+
+Usage:
+    raise ProviderError("OpenRouter non-200: 502", status_code=502)
+    raise ProviderThrottledError("OpenRouter rate limited", retry_after=parse_retry_after(header))
+"""
+
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+class ProviderError(RuntimeError):
+    """A provider call failed with a non-200 response."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class ProviderThrottledError(ProviderError):
+    """The request was rate limited, by the provider or by the shared limiter."""
+
+    def __init__(self, message: str, status_code: Optional[int] = 429, retry_after: Optional[float] = None):
+        super().__init__(message, status_code=status_code, retry_after=retry_after)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Returns the delay in seconds from a Retry-After header (seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,139 @@
+"""
+Shared HTTP Client for Provider Calls.
+
+This module owns the pooled, keep-alive HTTP client used for every provider
+request made by the worker. Creating a client per request costs a fresh
+TCP+TLS handshake each time; holding one client for the lifetime of the
+process lets consecutive jobs reuse warm connections.
+
+Key Features:
+- Process-wide httpx.Client with a bounded connection pool
+- Separate connect and read timeouts driven by Config; request_timeout()
+  builds a per-request override that keeps the connect timeout
+- Optional HTTP/2 (enabled when the 'h2' package is installed)
+- Fork-safe: a child process never reuses its parent's sockets
+- An httpx.AsyncClient counterpart for the asyncio worker
+- Explicit close()/aclose() for clean shutdown
+
+Usage:
+    from mcp_waifu_queue.http_client import get_client
+
+    resp = get_client().post(url, headers=headers, json=payload)
+
+    # Inside a running event loop:
+    resp = await get_async_client().post(url, headers=headers, json=payload)
+
+Dependencies:
+- httpx: HTTP client with connection pooling and HTTP/2 support
+- config: For pool size, timeouts and HTTP/2 settings
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+from typing import Optional
+
+import httpx
+
+from mcp_waifu_queue.config import Config
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[httpx.Client] = None
+_client_pid: Optional[int] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _client_kwargs(cfg: Config) -> dict:
+    http2 = cfg.http2_enabled and _http2_available()
+    if cfg.http2_enabled and not http2:
+        logger.warning("HTTP/2 requested but 'h2' is not installed; using HTTP/1.1")
+    logger.info(
+        f"Creating provider HTTP client (http2={http2}, "
+        f"max_connections={cfg.http_max_connections})"
+    )
+    return {
+        "http2": http2,
+        "limits": httpx.Limits(
+            max_connections=cfg.http_max_connections,
+            max_keepalive_connections=cfg.http_max_keepalive_connections,
+            keepalive_expiry=cfg.http_keepalive_expiry_seconds,
+        ),
+        "timeout": httpx.Timeout(
+            cfg.request_timeout_seconds, connect=cfg.http_connect_timeout_seconds
+        ),
+    }
+
+
+def request_timeout(seconds: float) -> httpx.Timeout:
+    """Timeout for one request: seconds overall, keeping the configured connect timeout."""
+    return httpx.Timeout(seconds, connect=Config.load().http_connect_timeout_seconds)
+
+
+def build_client(cfg: Config) -> httpx.Client:
+    """Builds a pooled httpx.Client from the given configuration."""
+    return httpx.Client(**_client_kwargs(cfg))
+
+
+def build_async_client(cfg: Config) -> httpx.AsyncClient:
+    """Builds a pooled httpx.AsyncClient from the given configuration."""
+    return httpx.AsyncClient(**_client_kwargs(cfg))
+
+
+def get_client() -> httpx.Client:
+    """Returns the process-wide provider client, creating it on first use."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _lock:
+        if _client is None or _client_pid != pid:
+            # After a fork the inherited pool is shared with the parent; start fresh.
+            _client = build_client(Config.load())
+            _client_pid = pid
+    return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Returns the async provider client bound to the running event loop."""
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        _async_client = build_async_client(Config.load())
+        _async_client_loop = loop
+    return _async_client
+
+
+async def aclose() -> None:
+    """Closes the async provider client, if one was created on this loop."""
+    global _async_client, _async_client_loop
+    client = _async_client
+    _async_client = None
+    _async_client_loop = None
+    if client is not None:
+        await client.aclose()
+
+
+def close() -> None:
+    """Closes the process-wide client, if this process created one."""
+    global _client, _client_pid
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+atexit.register(close)
@@ -0,0 +1,52 @@
+"""
+Priority Lanes and Weighted Scheduling.
+
+This module defines how requests are split into priority lanes and how workers
+choose between lanes. Each lane is its own RQ queue, so a backlog of bulk
+prompts no longer sits in front of interactive chat turns.
+
+Key Features:
+- Lanes and their weights come from Config.lanes (lane name -> weight)
+- Lane validation with the configured default lane as fallback
+- Weighted queue ordering: before each dequeue, workers order their lanes by a
+  weighted random draw, so when every lane has work a lane is served first
+  with probability proportional to its weight, and a lane with work is never
+  starved while the others are empty
+
+Usage:
+    lane = resolve_lane(request.lane, config)
+    ordered = weighted_order(queues, [config.lanes[q.name] for q in queues])
+
+Dependencies:
+- config: Lane names, weights and the default lane
+"""
+
+import random
+from typing import Optional, Sequence, TypeVar
+
+from mcp_waifu_queue.config import Config
+
+T = TypeVar("T")
+
+
+def resolve_lane(lane: Optional[str], config: Config) -> str:
+    """Returns the lane to use for a request, rejecting unknown lanes."""
+    if lane is None:
+        return config.default_lane
+    if lane not in config.lanes:
+        raise ValueError(f"Unknown lane '{lane}'. Configured lanes: {', '.join(config.lanes)}")
+    return lane
+
+
+def weighted_order(items: Sequence[T], weights: Sequence[float], rng: random.Random = random) -> list[T]:
+    """Orders items by a weighted random draw without replacement.
+
+    Uses the Efraimidis-Spirakis key u ** (1 / w): the first item is item i with
+    probability weights[i] / sum(weights). Items with weight <= 0 go last.
+    """
+    keyed = [
+        (rng.random() ** (1.0 / weight) if weight > 0 else -1.0, index)
+        for index, weight in enumerate(weights)
+    ]
+    keyed.sort(reverse=True)
+    return [items[index] for _, index in keyed]
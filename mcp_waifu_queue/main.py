@@ -8,11 +8,38 @@ asynchronous AI text generation using Redis queues.
 The server provides:
 - generate_text tool: Accepts prompts and enqueues them for background processing
 - job status resource: Allows checking the status and results of submitted jobs
+- generate_text_batch tool: Enqueues many prompts in one Redis round trip
+- read_stream tool: Returns partial text of a streaming job from an offset
+- get_job_statuses tool: Resolves many job ids in one Redis round trip
+- wait_for_job tool: Blocks until a job finishes, woken by a shared pub/sub
+  listener instead of client polling
+- batch status resource: Reports aggregate progress and results of a batch
+- job debug resource: Lane, worker, retries, stage timings (enqueued,
+  started, executing, provider request sent, first byte, finished) and the
+  profile path of a job; the job status resource carries the timings too
+- session resource and end_session tool: Show or forget the server-side
+  history of a multi-turn conversation (generate_text with a session_id)
+- cache stats resources: Report response cache hit/miss counters, and the
+  near-duplicate cache's per-namespace hits and provider calls saved
+- /metrics HTTP route: Prometheus metrics (enqueue latency, queue depth,
+  request counts and cache lookups), served on the HTTP transports
 
 Architecture:
 - Uses FastMCP for MCP server implementation
-- Integrates with Redis queue system via task_queue module
-- Supports configuration loading and logging
+- Integrates with Redis queue system via task_queue module, using its async
+  (redis.asyncio) API so no handler blocks the event loop on Redis
+- Supports configuration loading and logging; SIGHUP reloads settings and
+  credentials. Handlers read Config when called, so limits such as
+  wait_max_timeout_seconds, max_batch_size and the lanes follow a reload;
+  the completion listener keeps the Redis URL it started with
+- Per-request generation params: generate_text's max_tokens, temperature,
+  stop and model are checked against the server's caps before the job is
+  enqueued, then sent to the provider by the worker
+- Admission control: generate_text and generate_text_batch charge the calling
+  MCP session's token budget and fail with a retry-after hint when it is full.
+  The budget is keyed on a server-side identity (the transport's session id,
+  else the peer address, else the stdio session); the client-supplied
+  _meta.client_id is only logged
 - Provides async endpoints for MCP client integration
 
 Usage:
@@ -20,14 +47,51 @@ Usage:
     uvicorn mcp_waifu_queue.main:app --reload --port 8000
 """
 
+import asyncio
 import logging
+import uuid
+import weakref
+from typing import Optional
 
-from mcp.server.fastmcp import FastMCP
-from mcp.server.fastmcp import Context
+from mcp.server.fastmcp import Context, FastMCP
+from starlette.requests import Request
+from starlette.responses import Response
 
+from mcp_waifu_queue import metrics, timing
+from mcp_waifu_queue.cache import get_response_cache
 from mcp_waifu_queue.config import Config
-from mcp_waifu_queue.models import GenerateTextRequest, JobStatusResponse
-from mcp_waifu_queue.task_queue import q, add_to_queue, get_job_status_from_queue
+from mcp_waifu_queue.lanes import resolve_lane
+from mcp_waifu_queue.models import (
+    BatchJobStatus,
+    BatchStatusResponse,
+    GenerateTextBatchRequest,
+    GenerateTextRequest,
+    JobDebugResponse,
+    JobStatusesRequest,
+    JobStatusesResponse,
+    JobStatusResponse,
+    JobTimings,
+    ReadStreamRequest,
+    SessionRequest,
+    SessionResponse,
+    StreamChunkResponse,
+    WaitForJobRequest,
+)
+from mcp_waifu_queue.notifications import CompletionListener
+from mcp_waifu_queue.respond import check_generation_params
+from mcp_waifu_queue.sessions import get_session_store
+from mcp_waifu_queue.settings import install_reload_signal, on_reload
+from mcp_waifu_queue.similarity_cache import get_similarity_cache
+from mcp_waifu_queue.task_queue import (
+    aadd_batch_to_queue,
+    aadd_to_queue,
+    aget_batch_status_from_queue,
+    aget_job_detail_from_queue,
+    aget_job_status_many_from_queue,
+    aget_job_statuses_from_queue,
+    aread_job_stream,
+    get_queues,
+)
 
 # --- Configuration and Logging ---
 app = FastMCP(name="WaifuQueue")
@@ -39,20 +103,209 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+install_reload_signal()
+
+completion_listener = CompletionListener(config.redis_url, aget_job_statuses_from_queue)
+
+
+def _track_queue_depth() -> None:
+    metrics.track_queue_depth(Config.load().lanes, get_queues)
+
+
+_track_queue_depth()
+on_reload(_track_queue_depth)
+
+
+# Ids of sessions without a transport session id (stdio), for as long as each is open.
+_session_ids: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _client_id(context: Context) -> Optional[str]:
+    """Server-side identity of the calling MCP session, used as its admission budget.
+
+    Never the client-supplied _meta.client_id, which any client could set to
+    another's budget. None outside a request.
+    """
+    try:
+        request_context = context.request_context
+    except ValueError:
+        return None
+    request = request_context.request
+    if request is not None:
+        # Issued by the server: streamable HTTP's Mcp-Session-Id, or the SSE session_id.
+        session_id = request.headers.get("mcp-session-id") or request.query_params.get("session_id")
+        if session_id:
+            return f"session:{session_id}"
+        if request.client is not None:
+            return f"addr:{request.client.host}"  # Stateless HTTP: every request is a new session.
+    session = request_context.session
+    if session not in _session_ids:
+        _session_ids[session] = uuid.uuid4().hex
+    return f"session:{_session_ids[session]}"
+
+
+def _client_label(context: Context) -> str:
+    """The client's self-reported _meta.client_id, for logs only."""
+    try:
+        return context.client_id or "-"
+    except ValueError:
+        return "-"
+
 
 # --- MCP Tools ---
 @app.tool()
 async def generate_text(request: GenerateTextRequest, context: Context) -> dict:
     """Generates text based on a prompt, using a Redis queue."""
-    job_id = add_to_queue(request.prompt)
-    logger.info(f"Enqueued job with ID: {job_id}")
+    config = Config.load()
+    lane = resolve_lane(request.lane, config)
+    params = request.generation_params()
+    check_generation_params(params, config)
+    with metrics.ENQUEUE_SECONDS.labels(lane, "single").time():
+        if request.system_prompt is not None:
+            await get_session_store().aset_system(request.session_id, request.system_prompt)
+        job_id = await aadd_to_queue(
+            request.prompt,
+            lane,
+            request.result_ttl_seconds,
+            _client_id(context),
+            request.session_id,
+            params,
+            request.cache_namespace,
+        )
+    metrics.REQUESTS_TOTAL.labels(lane, "single").inc()
+    logger.info(f"Enqueued job with ID: {job_id} (client {_client_label(context)})")
     return {"job_id": job_id}
 
 
+@app.tool()
+async def generate_text_batch(request: GenerateTextBatchRequest, context: Context) -> dict:
+    """Generates text for many prompts, enqueued in a single Redis round trip."""
+    lane = resolve_lane(request.lane, Config.load())
+    with metrics.ENQUEUE_SECONDS.labels(lane, "batch").time():
+        batch_id, job_ids = await aadd_batch_to_queue(
+            request.prompts, lane, request.result_ttl_seconds, _client_id(context), request.cache_namespace
+        )
+    metrics.REQUESTS_TOTAL.labels(lane, "batch").inc(len(job_ids))
+    logger.info(f"Enqueued batch {batch_id} with {len(job_ids)} jobs (client {_client_label(context)})")
+    return {"batch_id": batch_id, "job_ids": job_ids}
+
+
+@app.tool()
+async def read_stream(request: ReadStreamRequest, context: Context) -> StreamChunkResponse:
+    """Returns text generated so far by a job, starting after the given offset."""
+    text, offset, done, status = await aread_job_stream(request.job_id, request.offset, request.wait_ms)
+    return StreamChunkResponse(text=text, offset=offset, done=done, status=status)
+
+
+@app.tool()
+async def wait_for_job(request: WaitForJobRequest, context: Context) -> JobStatusResponse:
+    """Waits until a job completes or fails (or the timeout elapses) and returns its status and timings."""
+    timeout = min(request.timeout_seconds, Config.load().wait_max_timeout_seconds)
+    status = await completion_listener.wait(request.job_id, timeout=timeout)
+    if status == "unknown":
+        return JobStatusResponse(status=status, result=None)
+    detail = await aget_job_detail_from_queue(request.job_id)
+    return JobStatusResponse(
+        status=detail["status"], result=detail["result"], timings=_job_timings(detail["timestamps"])
+    )
+
+
+@app.tool()
+async def get_job_statuses(request: JobStatusesRequest, context: Context) -> JobStatusesResponse:
+    """Retrieves the status and result of many jobs in one round trip."""
+    max_batch_size = Config.load().max_batch_size
+    if len(request.job_ids) > max_batch_size:
+        raise ValueError(f"At most {max_batch_size} job ids can be looked up at once")
+    statuses = await aget_job_status_many_from_queue(request.job_ids)
+    return JobStatusesResponse(
+        jobs=[
+            BatchJobStatus(job_id=job_id, status=status, result=result)
+            for job_id, (status, result) in zip(request.job_ids, statuses, strict=True)
+        ]
+    )
+
+
+@app.tool()
+async def end_session(request: SessionRequest, context: Context) -> dict:
+    """Forgets the stored history of a conversation session."""
+    deleted = await get_session_store().adelete(request.session_id)
+    logger.info(f"Ended session {request.session_id} (existed: {deleted})")
+    return {"session_id": request.session_id, "deleted": deleted}
+
+
 # --- MCP Resources ---
+def _job_timings(timestamps: dict) -> JobTimings:
+    return JobTimings(**timestamps, durations=timing.durations(timestamps))
+
+
 @app.resource(uri="job://{job_id}")
 async def get_job_status(job_id: str) -> JobStatusResponse:
     """Retrieves the status of a job."""
-    status, result = get_job_status_from_queue(job_id)
-    logger.info(f"Job status for {job_id}: {status}")
-    return JobStatusResponse(status=status, result=result)
\ No newline at end of file
+    detail = await aget_job_detail_from_queue(job_id)
+    logger.info(f"Job status for {job_id}: {detail['status']}")
+    return JobStatusResponse(
+        status=detail["status"], result=detail["result"], timings=_job_timings(detail["timestamps"])
+    )
+
+
+@app.resource(uri="debug://job/{job_id}")
+async def get_job_debug(job_id: str) -> JobDebugResponse:
+    """Reports where a job spent its time: lane, worker, retries, stage timings and profile."""
+    detail = await aget_job_detail_from_queue(job_id)
+    return JobDebugResponse(
+        job_id=job_id,
+        status=detail["status"],
+        lane=detail["lane"],
+        worker_name=detail["worker_name"],
+        retries=detail["retries"],
+        timings=_job_timings(detail["timestamps"]),
+        profile=detail["profile"],
+    )
+
+
+@app.resource(uri="batch://{batch_id}")
+async def get_batch_status(batch_id: str) -> BatchStatusResponse:
+    """Retrieves aggregate progress and results of a batch."""
+    jobs = [
+        BatchJobStatus(job_id=job_id, status=status, result=result)
+        for job_id, status, result in await aget_batch_status_from_queue(batch_id)
+    ]
+    counts: dict[str, int] = {}
+    for job in jobs:
+        counts[job.status] = counts.get(job.status, 0) + 1
+    done = counts.get("completed", 0) + counts.get("failed", 0) == len(jobs)
+    logger.info(f"Batch status for {batch_id}: {counts}")
+    return BatchStatusResponse(batch_id=batch_id, total=len(jobs), counts=counts, done=done, jobs=jobs)
+
+
+@app.resource(uri="session://{session_id}")
+async def get_session(session_id: str) -> SessionResponse:
+    """Retrieves the stored history of a conversation session."""
+    messages = await get_session_store().ahistory(session_id)
+    return SessionResponse(session_id=session_id, messages=messages)
+
+
+@app.resource(uri="stats://cache")
+async def get_cache_stats() -> dict:
+    """Reports response cache hit/miss counters."""
+    cache = get_response_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **(await cache.astats())}
+
+
+@app.resource(uri="stats://similarity-cache")
+async def get_similarity_cache_stats() -> dict:
+    """Reports near-duplicate cache counters and provider calls saved, per namespace."""
+    cache = get_similarity_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, "threshold": cache.threshold, "namespaces": await cache.astats()}
+
+
+# --- HTTP Routes ---
+@app.custom_route("/metrics", methods=["GET"])
+async def get_metrics(request: Request) -> Response:
+    """Serves Prometheus metrics; queue depth gauges read Redis, so render off the event loop."""
+    body, content_type = await asyncio.to_thread(metrics.render)
+    return Response(body, media_type=content_type)
@@ -0,0 +1,264 @@
+"""
+Prometheus Metrics.
+
+This module defines the counters, histograms and gauges shared by the MCP
+server and the workers, and the helpers that expose them on /metrics.
+
+Key Features:
+- Enqueue: waifu_requests_total and waifu_enqueue_seconds by lane and kind
+  (single or batch), recorded by the MCP tools
+- Queue: waifu_queue_depth by lane (read from Redis at scrape time, server
+  only) and waifu_queue_wait_seconds by lane (enqueue to start of execution)
+- Jobs: waifu_jobs_total by lane and outcome (completed, failed, requeued) and
+  waifu_job_duration_seconds by lane, recorded by both worker engines
+- Provider: waifu_provider_requests_total by provider, model and outcome (ok,
+  throttled, error), waifu_provider_latency_seconds and
+  waifu_provider_ttft_seconds (time to first streamed chunk) by provider and
+  model, and waifu_provider_tokens_total by provider, model and kind (prompt or
+  completion; estimated at about four characters per token)
+- Cache: waifu_cache_lookups_total by result (hit or miss), and
+  waifu_similarity_cache_lookups_total by namespace and result (normalized,
+  similar or miss) for the near-duplicate cache, whose hits are provider
+  calls saved
+- Admission: waifu_admission_rejected_total by scope (global or client)
+- Supervisor: waifu_supervisor_workers by state (active or draining)
+- ProviderCall also marks the running job's provider_sent and first_byte
+  stages (timing.py)
+
+Exposition:
+- The MCP server serves /metrics on its HTTP transport (see main.py)
+- Workers serve /metrics on WORKER_METRICS_PORT when it is set (the
+  supervisor serves its own there and gives each worker a port above it)
+- Values are per process; Prometheus aggregates across processes. With
+  WORKER_FORK_PER_JOB=true, job outcome and provider metrics are recorded in
+  the forked work-horse and lost with it; only queue wait is kept
+
+prometheus_client is an optional dependency (pip install -e .[metrics]).
+Without it every metric is a no-op and /metrics reports that it is missing.
+
+Usage:
+    from mcp_waifu_queue import metrics
+
+    metrics.JOBS_TOTAL.labels(lane="default", outcome="completed").inc()
+    call = metrics.ProviderCall("openrouter", "openrouter/free")
+    text = provider.generate(prompt, model, timeout, on_chunk=call.wrap(on_chunk))
+    call.finish(prompt_tokens=12, completion_tokens=40)
+
+Dependencies:
+- prometheus_client (optional): Metric types and text exposition
+- errors: Provider outcome classification
+- timing: Per-job stage marks
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from rq.utils import now
+
+from mcp_waifu_queue import timing
+from mcp_waifu_queue.errors import ProviderThrottledError
+
+try:
+    import prometheus_client
+except ImportError:  # Optional dependency
+    prometheus_client = None
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans a cache hit through a slow long completion.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class _NoopMetric:
+    """Stands in for every metric type when prometheus_client is missing."""
+
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def observe(self, amount: float) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def set_function(self, f: Callable[[], float]) -> None:
+        pass
+
+    @contextmanager
+    def time(self):
+        yield
+
+
+def available() -> bool:
+    return prometheus_client is not None
+
+
+def _counter(name: str, documentation: str, labelnames: list[str]):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return prometheus_client.Counter(name, documentation, labelnames)
+
+
+def _histogram(name: str, documentation: str, labelnames: list[str]):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return prometheus_client.Histogram(name, documentation, labelnames, buckets=LATENCY_BUCKETS)
+
+
+def _gauge(name: str, documentation: str, labelnames: list[str]):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return prometheus_client.Gauge(name, documentation, labelnames)
+
+
+REQUESTS_TOTAL = _counter("waifu_requests_total", "Prompts submitted through the MCP tools", ["lane", "kind"])
+ENQUEUE_SECONDS = _histogram(
+    "waifu_enqueue_seconds", "Time to enqueue a request, including cache and coalescing checks", ["lane", "kind"]
+)
+QUEUE_DEPTH = _gauge("waifu_queue_depth", "Jobs waiting in each lane queue", ["lane"])
+QUEUE_WAIT_SECONDS = _histogram("waifu_queue_wait_seconds", "Time from enqueue to start of execution", ["lane"])
+JOBS_TOTAL = _counter("waifu_jobs_total", "Jobs executed by workers, by outcome", ["lane", "outcome"])
+JOB_DURATION_SECONDS = _histogram("waifu_job_duration_seconds", "Job execution time in the worker", ["lane"])
+PROVIDER_REQUESTS_TOTAL = _counter(
+    "waifu_provider_requests_total", "Provider requests, by outcome", ["provider", "model", "outcome"]
+)
+PROVIDER_LATENCY_SECONDS = _histogram(
+    "waifu_provider_latency_seconds", "Total latency of successful provider requests", ["provider", "model"]
+)
+PROVIDER_TTFT_SECONDS = _histogram(
+    "waifu_provider_ttft_seconds", "Time to the first streamed chunk of a provider response", ["provider", "model"]
+)
+PROVIDER_TOKENS_TOTAL = _counter(
+    "waifu_provider_tokens_total", "Estimated tokens sent to and received from providers", ["provider", "model", "kind"]
+)
+CACHE_LOOKUPS_TOTAL = _counter("waifu_cache_lookups_total", "Response cache lookups", ["result"])
+SIMILARITY_CACHE_LOOKUPS_TOTAL = _counter(
+    "waifu_similarity_cache_lookups_total",
+    "Near-duplicate cache lookups by workers; hits are provider calls saved",
+    ["namespace", "result"],
+)
+ADMISSION_REJECTED_TOTAL = _counter(
+    "waifu_admission_rejected_total", "Requests rejected by admission control, by full budget", ["scope"]
+)
+SUPERVISOR_WORKERS = _gauge("waifu_supervisor_workers", "Worker processes run by the supervisor", ["state"])
+
+
+def _seconds(start, end) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return max(0.0, (end - start).total_seconds())
+
+
+def observe_job_started(job) -> None:
+    """Records how long a job waited in its lane queue. Never raises."""
+    try:
+        wait = _seconds(job.enqueued_at, now())
+        if wait is not None:
+            QUEUE_WAIT_SECONDS.labels(lane=job.origin).observe(wait)
+    except Exception as e:
+        logger.warning(f"Failed to record queue wait: {e}")
+
+
+def observe_job(job, outcome: str) -> None:
+    """Records a finished job execution (completed, failed or requeued). Never raises."""
+    try:
+        JOBS_TOTAL.labels(lane=job.origin, outcome=outcome).inc()
+        duration = _seconds(job.started_at, job.ended_at)
+        if duration is not None:
+            JOB_DURATION_SECONDS.labels(lane=job.origin).observe(duration)
+    except Exception as e:
+        logger.warning(f"Failed to record job metrics: {e}")
+
+
+def track_queue_depth(lanes, get_queues: Callable[[], dict]) -> None:
+    """Reports the length of each lane queue at scrape time.
+
+    get_queues returns lane name -> rq.Queue; it is only called on a scrape,
+    so registering does not open a Redis connection. A lane dropped by a
+    settings reload reports 0.
+    """
+
+    def depth(lane: str) -> int:
+        queue = get_queues().get(lane)
+        return queue.count if queue is not None else 0
+
+    for lane in lanes:
+        QUEUE_DEPTH.labels(lane=lane).set_function(lambda lane=lane: depth(lane))
+
+
+class ProviderCall:
+    """Times one provider request; wrap its on_chunk callback to record TTFT."""
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self.started = time.monotonic()
+        self._first_chunk_seen = False
+        timing.mark("provider_sent")
+
+    def _chunk(self) -> None:
+        if not self._first_chunk_seen:
+            self._first_chunk_seen = True
+            timing.mark("first_byte")
+            PROVIDER_TTFT_SECONDS.labels(self.provider, self.model).observe(time.monotonic() - self.started)
+
+    def wrap(self, on_chunk):
+        if on_chunk is None:
+            return None
+
+        def timed(text: str) -> None:
+            self._chunk()
+            on_chunk(text)
+
+        return timed
+
+    def awrap(self, on_chunk):
+        if on_chunk is None:
+            return None
+
+        async def timed(text: str) -> None:
+            self._chunk()
+            await on_chunk(text)
+
+        return timed
+
+    def finish(self, exc: Optional[BaseException] = None, prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+        if exc is None:
+            outcome = "ok"
+        elif isinstance(exc, ProviderThrottledError):
+            outcome = "throttled"
+        else:
+            outcome = "error"
+        PROVIDER_REQUESTS_TOTAL.labels(self.provider, self.model, outcome).inc()
+        if exc is not None:
+            return
+        timing.mark("first_byte")
+        PROVIDER_LATENCY_SECONDS.labels(self.provider, self.model).observe(time.monotonic() - self.started)
+        PROVIDER_TOKENS_TOTAL.labels(self.provider, self.model, "prompt").inc(prompt_tokens)
+        PROVIDER_TOKENS_TOTAL.labels(self.provider, self.model, "completion").inc(completion_tokens)
+
+
+def render() -> tuple[bytes, str]:
+    """Returns the metrics exposition body and its content type."""
+    if prometheus_client is None:
+        return b"# prometheus_client is not installed; pip install -e .[metrics]\n", "text/plain; charset=utf-8"
+    return prometheus_client.generate_latest(), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int) -> bool:
+    """Serves /metrics on a background HTTP server. Returns False if it could not start."""
+    if prometheus_client is None:
+        logger.warning("Metrics port configured but prometheus_client is not installed")
+        return False
+    try:
+        prometheus_client.start_http_server(port)
+    except OSError as e:
+        logger.warning(f"Could not serve metrics on port {port}: {e}")
+        return False
+    logger.info(f"Serving metrics on port {port}")
+    return True
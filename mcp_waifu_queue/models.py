@@ -8,6 +8,17 @@ and provide clear interfaces for the MCP tools and resources.
 Models Defined:
 - GenerateTextRequest: Model for text generation tool requests
 - JobStatusResponse: Model for job status resource responses
+- JobTimings: Stage timestamps and durations of a job
+- JobDebugResponse: Model for the job debug resource
+- GenerateTextBatchRequest: Model for batch text generation tool requests
+- BatchJobStatus: Status of a single job in bulk responses
+- BatchStatusResponse: Model for batch status resource responses
+- ReadStreamRequest: Model for read_stream tool requests
+- StreamChunkResponse: Model for read_stream tool responses
+- WaitForJobRequest: Model for wait_for_job tool requests
+- JobStatusesRequest / JobStatusesResponse: Models for the bulk get_job_statuses tool
+- SessionRequest / SessionResponse: Models for the end_session tool and the
+  session resource
 
 Key Features:
 - Pydantic v2 BaseModel for validation and serialization
@@ -20,18 +31,181 @@ These models are automatically used by FastMCP when processing MCP tool calls
 and resource requests, providing validation and type conversion.
 """
 
-from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field, model_validator
+
+# Session ids and cache namespaces end up in Redis key names.
+SESSION_ID_PATTERN = r"^[A-Za-z0-9_.:-]{1,128}$"
+CACHE_NAMESPACE_PATTERN = r"^[A-Za-z0-9_.-]{1,64}$"
+CACHE_NAMESPACE_DESCRIPTION = (
+    "Near-duplicate cache namespace. Workers serve a stored completion of a similar prompt from the same "
+    "namespace, if the server opted it in. Defaults to 'default'."
+)
 
 
 class GenerateTextRequest(BaseModel):
     """Request model for the generate_text tool."""
 
     prompt: str = Field(..., description="The input text prompt.")
+    lane: Optional[str] = Field(
+        None, description="Priority lane, e.g. 'interactive' or 'bulk'. Defaults to the server's default lane."
+    )
+    result_ttl_seconds: Optional[int] = Field(
+        None, ge=1, description="Seconds to keep the result. Defaults to the server's retention, capped at its maximum."
+    )
+    session_id: Optional[str] = Field(
+        None,
+        pattern=SESSION_ID_PATTERN,
+        description="Conversation session; the prompt is the next user message and earlier turns are kept server-side.",
+    )
+    system_prompt: Optional[str] = Field(
+        None, description="Sets the session's system prompt, sent first in every turn. Requires session_id."
+    )
+    cache_namespace: Optional[str] = Field(
+        None, pattern=CACHE_NAMESPACE_PATTERN, description=CACHE_NAMESPACE_DESCRIPTION
+    )
+    max_tokens: Optional[int] = Field(
+        None, ge=1, description="Most tokens to generate. Defaults to the server's max_new_tokens, capped at its limit."
+    )
+    temperature: Optional[float] = Field(None, ge=0, le=2, description="Sampling temperature. Defaults to 0.2.")
+    stop: Optional[List[str]] = Field(
+        None, description="Sequences that end the completion (up to the server's limit)."
+    )
+    model: Optional[str] = Field(
+        None, description="Model to generate with. Must be one the server allows; defaults to its routing choice."
+    )
+
+    @model_validator(mode="after")
+    def _check_session(self) -> "GenerateTextRequest":
+        if self.system_prompt is not None and self.session_id is None:
+            raise ValueError("system_prompt requires session_id")
+        if self.stop is not None and not all(self.stop):
+            raise ValueError("stop sequences must not be empty")
+        return self
+
+    def generation_params(self) -> Dict[str, object]:
+        """The generation params this request sets, for the worker and the provider."""
+        params = {"max_tokens": self.max_tokens, "temperature": self.temperature, "stop": self.stop, "model": self.model}
+        return {name: value for name, value in params.items() if value is not None}
+
+
+class JobTimings(BaseModel):
+    """Stage timestamps (UTC, ISO 8601) and stage durations (seconds) of a job."""
+
+    enqueued_at: Optional[str] = Field(None, description="When the job was enqueued.")
+    started_at: Optional[str] = Field(None, description="When a worker picked the job up.")
+    executing_at: Optional[str] = Field(None, description="When the job function started running.")
+    provider_sent_at: Optional[str] = Field(None, description="When the first provider request was sent.")
+    first_byte_at: Optional[str] = Field(
+        None, description="When the first chunk (or, unstreamed, the whole completion) arrived."
+    )
+    finished_at: Optional[str] = Field(None, description="When the job completed or failed.")
+    durations: Dict[str, Optional[float]] = Field(
+        default_factory=dict,
+        description="Seconds per stage: queue_wait, startup, preparation, time_to_first_byte, generation and total.",
+    )
 
 
 class JobStatusResponse(BaseModel):
     """Response model for the get_job_status resource."""
 
     status: str = Field(..., description="The status of the job (queued, processing, completed, failed).")
-    result: Optional[str] = Field(None, description="The generated text, if the job is completed.")
\ No newline at end of file
+    result: Optional[str] = Field(None, description="The generated text, if the job is completed.")
+    timings: Optional[JobTimings] = Field(None, description="Stage timings, on the job status resource.")
+
+
+class JobDebugResponse(BaseModel):
+    """Response model for the job debug resource."""
+
+    job_id: str = Field(..., description="The job ID.")
+    status: str = Field(..., description="The status of the job (queued, processing, completed, failed).")
+    lane: Optional[str] = Field(None, description="The lane the job was enqueued on.")
+    worker_name: Optional[str] = Field(None, description="The worker that ran the job most recently.")
+    retries: int = Field(0, description="Times the job was requeued after being throttled.")
+    timings: JobTimings = Field(..., description="Stage timestamps and durations of the latest attempt.")
+    profile: Optional[str] = Field(None, description="Path of the job's stack profile on the worker, if one was written.")
+
+
+class GenerateTextBatchRequest(BaseModel):
+    """Request model for the generate_text_batch tool."""
+
+    prompts: List[str] = Field(..., min_length=1, description="The input text prompts.")
+    lane: Optional[str] = Field(
+        None, description="Priority lane for every job in the batch. Defaults to the server's default lane."
+    )
+    result_ttl_seconds: Optional[int] = Field(
+        None, ge=1, description="Seconds to keep the result. Defaults to the server's retention, capped at its maximum."
+    )
+    cache_namespace: Optional[str] = Field(
+        None, pattern=CACHE_NAMESPACE_PATTERN, description=CACHE_NAMESPACE_DESCRIPTION
+    )
+
+
+class BatchJobStatus(BaseModel):
+    """Status of one job within a batch or bulk status lookup."""
+
+    job_id: str = Field(..., description="The job ID.")
+    status: str = Field(..., description="The status of the job (queued, processing, completed, failed).")
+    result: Optional[str] = Field(None, description="The generated text, if the job is completed.")
+
+
+class BatchStatusResponse(BaseModel):
+    """Response model for the get_batch_status resource."""
+
+    batch_id: str = Field(..., description="The batch ID.")
+    total: int = Field(..., description="Number of jobs in the batch.")
+    counts: Dict[str, int] = Field(..., description="Number of jobs in each status.")
+    done: bool = Field(..., description="True once every job has completed or failed.")
+    jobs: List[BatchJobStatus] = Field(..., description="Per-job status and result, in submission order.")
+
+
+class ReadStreamRequest(BaseModel):
+    """Request model for the read_stream tool."""
+
+    job_id: str = Field(..., description="The job ID returned by generate_text.")
+    offset: str = Field("0", description="Offset returned by the previous read; '0' reads from the start.")
+    wait_ms: int = Field(0, ge=0, description="Milliseconds to wait for new text if none is available yet.")
+
+
+class StreamChunkResponse(BaseModel):
+    """Response model for the read_stream tool."""
+
+    text: str = Field(..., description="Text generated after the requested offset.")
+    offset: str = Field(..., description="Offset to pass to the next read.")
+    done: bool = Field(..., description="True once the job has finished producing text.")
+    status: str = Field(..., description="The status of the job (queued, processing, completed, failed).")
+
+
+class WaitForJobRequest(BaseModel):
+    """Request model for the wait_for_job tool."""
+
+    job_id: str = Field(..., description="The job ID returned by generate_text.")
+    timeout_seconds: float = Field(30, gt=0, description="Maximum number of seconds to wait.")
+
+
+class JobStatusesRequest(BaseModel):
+    """Request model for the get_job_statuses tool."""
+
+    job_ids: List[str] = Field(..., min_length=1, description="The job IDs to look up.")
+
+
+class JobStatusesResponse(BaseModel):
+    """Response model for the get_job_statuses tool."""
+
+    jobs: List[BatchJobStatus] = Field(..., description="Per-job status and result, in request order.")
+
+
+class SessionRequest(BaseModel):
+    """Request model for the end_session tool."""
+
+    session_id: str = Field(..., pattern=SESSION_ID_PATTERN, description="The session to forget.")
+
+
+class SessionResponse(BaseModel):
+    """Response model for the get_session resource."""
+
+    session_id: str = Field(..., description="The session ID.")
+    messages: List[Dict[str, str]] = Field(
+        ..., description="Stored conversation as role/content messages, system prompt first."
+    )
@@ -0,0 +1,153 @@
+"""
+Job Completion Notifications.
+
+This module replaces client-side polling of job://{job_id} with push-based
+completion notifications over Redis pub/sub.
+
+Key Features:
+- Workers publish {"job_id", "status"} on a single channel once a job's final
+  status and result have been written
+- One CompletionListener per server process holds a single subscription and
+  fans each notification out to every coroutine waiting on that job
+- Jobs that already finished, and unknown or expired job ids, return at once.
+  Other waiters register, then check the job's status again, so a job that
+  finishes between the check and the subscription is never missed
+- One timeout covers the whole wait, including the listener's subscription
+- After a dropped subscription the listener reconnects and re-checks every
+  outstanding job once
+
+Usage:
+    # Worker side (inside the pipeline that records the final status):
+    publish_completion(pipeline, job.id, "completed")
+
+    # Server side:
+    status = await listener.wait(job_id, timeout=30)
+
+Dependencies:
+- redis.asyncio: Pub/sub subscription for the server-side listener
+- An async bulk status lookup (task_queue.aget_job_statuses_from_queue), used when a
+  waiter registers and after reconnects
+"""
+
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Optional
+
+import redis
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+COMPLETION_CHANNEL = "waifu:jobs:done"
+TERMINAL_STATUSES = {"completed", "failed"}
+# Statuses wait() returns without waiting: final ones, and that of unknown or expired jobs.
+SETTLED_STATUSES = TERMINAL_STATUSES | {"unknown"}
+
+
+def publish_completion(connection, job_id: str, status: str) -> None:
+    """Publishes a job's final status. connection may be a client or a pipeline."""
+    connection.publish(COMPLETION_CHANNEL, json.dumps({"job_id": job_id, "status": status}))
+
+
+class CompletionListener:
+    """Single pub/sub subscription shared by every waiter in the process."""
+
+    def __init__(self, redis_url: str, status_lookup: Callable[[list[str]], Awaitable[list[str]]]):
+        self.redis_url = redis_url
+        # Async bulk status lookup; used on registration and after reconnects.
+        self.status_lookup = status_lookup
+        self._waiters: dict[str, set[asyncio.Future]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()
+
+    async def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._subscribed = asyncio.Event()
+            self._task = asyncio.create_task(self._listen())
+        await self._subscribed.wait()
+
+    def _resolve(self, job_id: str, status: str) -> None:
+        for future in self._waiters.pop(job_id, ()):
+            if not future.done():
+                future.set_result(status)
+
+    async def _recheck(self) -> None:
+        job_ids = list(self._waiters)
+        if not job_ids:
+            return
+        statuses = await self.status_lookup(job_ids)
+        for job_id, status in zip(job_ids, statuses, strict=True):
+            if status in TERMINAL_STATUSES:
+                self._resolve(job_id, status)
+
+    async def _listen(self) -> None:
+        reconnecting = False
+        while True:
+            client = aioredis.from_url(self.redis_url)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(COMPLETION_CHANNEL)
+                self._subscribed.set()
+                if reconnecting:
+                    await self._recheck()
+                async for message in pubsub.listen():
+                    try:
+                        event = json.loads(message["data"])
+                        job_id, status = event["job_id"], event["status"]
+                    except (ValueError, TypeError, KeyError) as e:
+                        logger.warning(f"Ignoring malformed completion message {message['data']!r}: {e}")
+                        continue
+                    self._resolve(job_id, status)
+            except asyncio.CancelledError:
+                raise
+            except (redis.RedisError, OSError) as e:
+                logger.warning(f"Completion listener lost its subscription: {e}; reconnecting")
+                reconnecting = True
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+                await client.aclose()
+
+    async def wait(self, job_id: str, timeout: float) -> str:
+        """Waits until job_id completes or fails; returns its status.
+
+        Returns the job's current status if the timeout elapses first, and
+        "unknown" at once for a job id that is unknown or expired.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        (status,) = await self.status_lookup([job_id])
+        if status in SETTLED_STATUSES:
+            return status
+        try:
+            await asyncio.wait_for(self._ensure_started(), timeout=max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            logger.warning("Completion listener not subscribed yet; returning current status")
+            (status,) = await self.status_lookup([job_id])
+            return status
+        future = loop.create_future()
+        self._waiters.setdefault(job_id, set()).add(future)
+        try:
+            # Checked again now the waiter is registered, in case the job finished meanwhile.
+            (status,) = await self.status_lookup([job_id])
+            if status in SETTLED_STATUSES:
+                return status
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout=max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                (status,) = await self.status_lookup([job_id])
+                return status
+        finally:
+            waiters = self._waiters.get(job_id)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[job_id]
+
+    async def close(self) -> None:
+        """Stops the listener task."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
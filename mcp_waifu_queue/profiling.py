@@ -0,0 +1,121 @@
+"""
+Sampled Job Profiling.
+
+This module samples the stacks of the worker while a job runs, so the jobs
+whose stage timings (timing.py) point at the worker itself can be looked at
+frame by frame.
+
+Key Features:
+- StackSampler: a background thread records the stack of every other
+  thread of the process every PROFILE_INTERVAL_SECONDS. It costs one
+  sys._current_frames() call per interval, so it can run for every job
+- profile_job(): context manager used by utils.call_predict_response. A job
+  is profiled when it is picked by PROFILE_SAMPLE_RATE (kept whatever its
+  duration), or, with PROFILE_SLOW_JOB_SECONDS set, every job is sampled and
+  kept only if it ran at least that long
+- Profiles are written to PROFILE_DIR as <job_id>.folded in the collapsed
+  stack format read by flamegraph.pl and speedscope ("thread;frame;frame N"),
+  and the path is recorded with the job's stage timings
+- Off by default: with neither setting, profile_job() does nothing
+
+The asyncio worker runs many jobs on one event loop thread, where per-job
+stacks cannot be told apart, so only the RQ worker's jobs are profiled.
+
+Usage:
+    with profile_job(job_id):
+        result = predict_response(prompt)
+
+Dependencies:
+- config: Sample rate, slow-job threshold, interval and output directory
+- timing: Records the profile path on the job
+"""
+
+import collections
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from types import FrameType
+from typing import Iterator, Optional
+
+from mcp_waifu_queue import timing
+from mcp_waifu_queue.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _collapse(thread_name: str, frame: Optional[FrameType]) -> str:
+    frames = []
+    while frame is not None:
+        frames.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join([thread_name, *reversed(frames)])
+
+
+class StackSampler:
+    """Samples the stacks of the process's other threads from a background thread."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = 0
+        self.stacks: collections.Counter[str] = collections.Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self.stacks[_collapse(names.get(ident, str(ident)), frame)] += 1
+            self.samples += 1
+
+    def dump(self, path: str) -> None:
+        """Writes the samples in collapsed stack format, most frequent first."""
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profile_job(job_id: Optional[str]) -> Iterator[None]:
+    """Samples the job's stacks when profiling picks it, and dumps them if they are kept."""
+    config = Config.load()
+    sampled = random.random() < config.profile_sample_rate
+    threshold = config.profile_slow_job_seconds
+    if job_id is None or not (sampled or threshold > 0):
+        yield
+        return
+    sampler = StackSampler(config.profile_interval_seconds)
+    started = time.monotonic()
+    sampler.start()
+    try:
+        yield
+    finally:
+        sampler.stop()
+        elapsed = time.monotonic() - started
+        if sampled or elapsed >= threshold:
+            reason = "sampled" if sampled else f"slower than {threshold}s"
+            try:
+                os.makedirs(config.profile_dir, exist_ok=True)
+                path = os.path.join(config.profile_dir, f"{job_id}.folded")
+                sampler.dump(path)
+                timing.record_profile(path)
+                logger.info(
+                    f"Job {job_id} took {elapsed:.2f}s ({reason}); {sampler.samples} stack samples written to {path}"
+                )
+            except OSError as e:
+                logger.warning(f"Failed to write profile of job {job_id}: {e}")
@@ -0,0 +1,53 @@
+"""
+Text Generation Providers.
+
+This package holds the provider registry, the provider implementations and
+the router that chooses between them.
+
+Modules:
+- base.py: Provider interface and registry
+- openrouter.py: OpenRouter chat completions (provider "openrouter")
+- local.py: Offline stub for tests and local runs (provider "local")
+- router.py: Latency-aware routing with failover across backends
+
+Importing the package is cheap: the built-in providers register on the
+first provider lookup, and the router (with the HTTP, rate limiting and
+resilience modules behind it) is imported on first access to ProviderRouter,
+get_router or served_model. The MCP server imports these types, and resolves
+the primary backend's model with primary_model(), without loading the
+provider stack, which only workers need.
+"""
+
+import importlib
+
+from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.providers.base import (
+    Provider,
+    default_model,
+    get_provider,
+    provider_names,
+    register_provider,
+)
+
+__all__ = [
+    "Provider",
+    "ProviderRouter",
+    "get_provider",
+    "get_router",
+    "primary_model",
+    "provider_names",
+    "register_provider",
+    "served_model",
+]
+
+
+def primary_model(config: Config) -> str:
+    """The model of the primary (first configured) backend, as the router would resolve it."""
+    name, _, model = (config.provider_backends or [config.default_provider])[0].strip().partition(":")
+    return model or default_model(name)
+
+
+def __getattr__(name: str):
+    if name in ("ProviderRouter", "get_router", "served_model"):
+        return getattr(importlib.import_module("mcp_waifu_queue.providers.router"), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
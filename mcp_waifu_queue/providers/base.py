@@ -0,0 +1,161 @@
+"""
+Provider Interface and Registry.
+
+This module defines the interface every text generation provider implements
+and the registry the router uses to look providers up by name.
+
+Key Features:
+- Provider: sync generate() and async agenerate(), both with optional
+  streaming through an on_chunk callback
+- default_model(): the model a provider uses when a backend names none.
+  The module-level default_model(name) resolves it for the built-in
+  providers without importing them, so the MCP server can key cache lookups
+  on it without loading provider code
+- rate_limited: whether calls go through the shared Redis rate limiter
+  (remote APIs do; the local stub does not)
+- register_provider(): class decorator adding a provider under its name
+- get_provider(): one cached instance per provider name. The built-in
+  providers are imported on the first lookup, so importing this module (for
+  the Prompt types, say) does not pull in the HTTP client
+- Prompt: a single user prompt string, or a chat message list (sessions);
+  as_messages() and prompt_text() normalize either form
+- GenerationOptions: the sampling options of one request (max_tokens,
+  temperature and optional stop sequences), which providers send upstream
+
+Usage:
+    @register_provider
+    class MyProvider(Provider):
+        name = "mine"
+        ...
+
+    provider = get_provider("mine")
+    text = provider.generate(prompt, provider.default_model(), timeout=60)
+"""
+
+import importlib
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional, Union
+
+from mcp_waifu_queue.settings import read_file_value
+
+DEFAULT_TEMPERATURE = 0.2
+DEFAULT_OPENROUTER_MODEL = "openrouter/free"
+OPENROUTER_MODEL_FILE_PATH = Path.home() / ".model-openrouter"
+DEFAULT_LOCAL_MODEL = "stub"
+
+ChunkCallback = Callable[[str], None]
+AsyncChunkCallback = Callable[[str], Awaitable[None]]
+# {"role": "system" | "user" | "assistant", "content": text}
+Message = dict[str, str]
+Prompt = Union[str, list[Message]]
+# {"max_tokens": int, "temperature": float, "stop": [str, ...] (optional)}
+GenerationOptions = dict[str, Any]
+
+
+def as_messages(prompt: Prompt) -> list[Message]:
+    """Returns prompt as a chat message list; a string becomes one user message."""
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return prompt
+
+
+def prompt_text(prompt: Prompt) -> str:
+    """Returns all text of a prompt, for token estimates."""
+    if isinstance(prompt, str):
+        return prompt
+    return "\n".join(message["content"] for message in prompt)
+
+
+class Provider(ABC):
+    """A text generation backend."""
+
+    name: str = ""
+    rate_limited: bool = True
+
+    @abstractmethod
+    def default_model(self) -> str:
+        """Returns the model used when a backend does not name one."""
+
+    @abstractmethod
+    def generate(
+        self,
+        prompt: Prompt,
+        model: str,
+        timeout: float,
+        on_chunk: Optional[ChunkCallback] = None,
+        options: Optional[GenerationOptions] = None,
+    ) -> str:
+        """Returns the completion; streams deltas to on_chunk when given.
+
+        options bound the completion; providers fall back to their own
+        defaults for anything it leaves out.
+        """
+
+    @abstractmethod
+    async def agenerate(
+        self,
+        prompt: Prompt,
+        model: str,
+        timeout: float,
+        on_chunk: Optional[AsyncChunkCallback] = None,
+        options: Optional[GenerationOptions] = None,
+    ) -> str:
+        """Async generate; on_chunk, when given, is awaited with each delta."""
+
+
+_REGISTRY: dict[str, type[Provider]] = {}
+_INSTANCES: dict[str, Provider] = {}
+# Modules whose providers register themselves on import; loaded on the first lookup.
+BUILTIN_PROVIDER_MODULES = ("mcp_waifu_queue.providers.local", "mcp_waifu_queue.providers.openrouter")
+_builtins_loaded = False
+
+
+def _load_builtin_providers() -> None:
+    global _builtins_loaded
+    if not _builtins_loaded:
+        _builtins_loaded = True
+        for module in BUILTIN_PROVIDER_MODULES:
+            importlib.import_module(module)
+
+
+def openrouter_model() -> str:
+    """The OpenRouter model: the first line of ~/.model-openrouter, or DEFAULT_OPENROUTER_MODEL."""
+    return read_file_value(OPENROUTER_MODEL_FILE_PATH) or DEFAULT_OPENROUTER_MODEL
+
+
+# Default models of the built-in providers, resolved without importing their modules.
+BUILTIN_DEFAULT_MODELS: dict[str, Callable[[], str]] = {
+    "openrouter": openrouter_model,
+    "local": lambda: DEFAULT_LOCAL_MODEL,
+}
+
+
+def default_model(name: str) -> str:
+    """Returns the named provider's default model; only other providers are loaded for it."""
+    resolve = BUILTIN_DEFAULT_MODELS.get(name)
+    return resolve() if resolve is not None else get_provider(name).default_model()
+
+
+def register_provider(cls: type[Provider]) -> type[Provider]:
+    """Class decorator registering a provider under cls.name."""
+    if not cls.name:
+        raise ValueError(f"{cls.__name__} needs a name to be registered")
+    _REGISTRY[cls.name] = cls
+    return cls
+
+
+def provider_names() -> list[str]:
+    """Returns the names of all registered providers."""
+    _load_builtin_providers()
+    return sorted(_REGISTRY)
+
+
+def get_provider(name: str) -> Provider:
+    """Returns the shared instance of the named provider."""
+    _load_builtin_providers()
+    if name not in _REGISTRY:
+        raise ValueError(f"Unknown provider '{name}'. Registered providers: {', '.join(provider_names())}")
+    if name not in _INSTANCES:
+        _INSTANCES[name] = _REGISTRY[name]()
+    return _INSTANCES[name]
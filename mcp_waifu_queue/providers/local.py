@@ -0,0 +1,93 @@
+"""
+Local Stub Provider.
+
+This module provides an offline provider that answers without any network
+call, so routing, failover, streaming and the workers can be exercised
+without an API key.
+
+Key Features:
+- Deterministic completion: "[<model>] " followed by the prompt (for a
+  message list, the last message) echoed back
+- Streams the completion word by word when a chunk callback is given
+- Honours the request's generation options like a real model would: the
+  completion ends at the first stop sequence and after max_tokens words
+- Configurable artificial latency and failure rate, to simulate a slow or
+  flaky upstream (a failure raises ProviderError with status 503)
+- Not rate limited, since it consumes no provider quota
+
+Configuration:
+- local_provider_latency_seconds: Delay before answering (default: 0)
+- local_provider_failure_rate: Fraction of calls that fail (default: 0)
+
+Usage:
+    PROVIDER=local python -m mcp_waifu_queue.worker
+    # or mix it into routing: PROVIDER_BACKENDS='["openrouter", "local:stub-b"]'
+
+Dependencies:
+- config: Latency and failure rate
+"""
+
+import asyncio
+import random
+import time
+from typing import Optional
+
+from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.errors import ProviderError
+from mcp_waifu_queue.providers.base import (
+    DEFAULT_LOCAL_MODEL,
+    GenerationOptions,
+    Prompt,
+    Provider,
+    as_messages,
+    register_provider,
+)
+
+
+def _completion(prompt: Prompt, model: str, options: Optional[GenerationOptions] = None) -> str:
+    text = f"[{model}] {as_messages(prompt)[-1]['content']}".strip()
+    options = options or {}
+    for stop in options.get("stop") or ():
+        text = text.split(stop, 1)[0]
+    if options.get("max_tokens"):
+        text = " ".join(text.split(" ")[: options["max_tokens"]])
+    return text
+
+
+def _should_fail(config: Config) -> bool:
+    return config.local_provider_failure_rate > 0 and random.random() < config.local_provider_failure_rate
+
+
+@register_provider
+class LocalStubProvider(Provider):
+    """Echoes the prompt back after an optional delay."""
+
+    name = "local"
+    rate_limited = False
+
+    def default_model(self) -> str:
+        return DEFAULT_LOCAL_MODEL
+
+    def generate(self, prompt: Prompt, model: str, timeout: float, on_chunk=None, options=None) -> str:
+        config = Config.load()
+        if config.local_provider_latency_seconds > 0:
+            time.sleep(min(config.local_provider_latency_seconds, timeout))
+        if _should_fail(config):
+            raise ProviderError("Local stub provider simulated failure", status_code=503)
+        text = _completion(prompt, model, options)
+        if on_chunk is not None:
+            for word in text.split(" "):
+                on_chunk(word + " ")
+        return text
+
+    async def agenerate(self, prompt: Prompt, model: str, timeout: float, on_chunk=None, options=None) -> str:
+        config = Config.load()
+        if config.local_provider_latency_seconds > 0:
+            await asyncio.sleep(min(config.local_provider_latency_seconds, timeout))
+        if _should_fail(config):
+            raise ProviderError("Local stub provider simulated failure", status_code=503)
+        text = _completion(prompt, model, options)
+        if on_chunk is not None:
+            for word in text.split(" "):
+                await on_chunk(word + " ")
+        return text
@@ -9,14 +9,20 @@ Key Features:
 - OpenRouter API integration for text generation
 - Flexible API key resolution (environment variables or files)
 - Model selection via files or defaults
-- Error handling for API failures and missing keys
+- Error handling for API failures and missing keys: non-200 responses raise
+  ProviderError, 429s raise ProviderThrottledError with the Retry-After delay
 - Configurable request timeouts
-- JSON payload construction and response parsing
+- Pooled keep-alive connections through the shared http_client
+- JSON payload construction and response parsing; a session's message list
+  is sent as is, so its stable prefix can hit the upstream prompt cache
+- Optional SSE streaming, sync and async
+- Registered as provider "openrouter" for the provider router
 
 API Configuration:
 - API URL: https://openrouter.ai/api/v1/chat/completions
 - Default Model: openrouter/free
-- Temperature: 0.2 (for consistent responses)
+- Temperature: 0.2 (for consistent responses) unless the request sets one
+- max_tokens and stop sequences: sent from the request's generation options
 - Timeout: 60 seconds (configurable)
 
 Authentication:
@@ -29,65 +35,88 @@ Models can be configured via:
 1. ~/.model-openrouter file containing the model name
 2. Default model fallback: openrouter/free
 
+Both files are read through the settings cache: they are re-read only when
+their modification time changes (or on SIGHUP), not on every request.
+
 Usage:
-This module is typically used through the respond.py module, which provides
-the main interface for text generation with provider fallback logic.
+This module is typically used through the provider router (providers/router.py),
+which respond.py calls for every generation.
 
 Dependencies:
-- requests: For HTTP API calls
+- http_client: Shared pooled HTTP clients (sync and async) for API calls
+- errors: Provider error types
+- settings: mtime-cached reads of the key and model files
 - os, pathlib: For file system and environment operations
 - typing: For type hints
 """
 
 # mcp_waifu_queue/providers/openrouter.py
-# Minimal OpenRouter client kept separate for potential direct imports if needed.
 
 from __future__ import annotations
 
+import json
+import logging
 import os
 from pathlib import Path
-from typing import Optional
-
-import requests
-
+from typing import Iterable, Optional
+
+from mcp_waifu_queue.errors import (
+    ProviderError,
+    ProviderThrottledError,
+    parse_retry_after,
+)
+from mcp_waifu_queue.http_client import get_async_client, get_client, request_timeout
+from mcp_waifu_queue.providers.base import (
+    DEFAULT_TEMPERATURE,
+    OPENROUTER_MODEL_FILE_PATH,
+    GenerationOptions,
+    Prompt,
+    Provider,
+    as_messages,
+    openrouter_model,
+    register_provider,
+)
+from mcp_waifu_queue.settings import read_file_value
+
+logger = logging.getLogger(__name__)
 
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
-DEFAULT_OPENROUTER_MODEL = "openrouter/free"
 OPENROUTER_API_KEY_FILE_PATH = Path.home() / ".api-openrouter"
-MODEL_FILE_PATH = Path.home() / ".model-openrouter"
-
-
-def _read_single_line(path: Path) -> Optional[str]:
-    try:
-        if path.is_file():
-            val = path.read_text(encoding="utf-8").strip()
-            return val or None
-    except Exception:
-        return None
-    return None
+# The model file is also read by the MCP server, through base.default_model.
+MODEL_FILE_PATH = OPENROUTER_MODEL_FILE_PATH
 
 
 def resolve_model() -> str:
-    return _read_single_line(MODEL_FILE_PATH) or DEFAULT_OPENROUTER_MODEL
+    return openrouter_model()
 
 
 def resolve_api_key() -> Optional[str]:
     env_key = os.getenv("OPENROUTER_API_KEY")
     if env_key and env_key.strip():
         return env_key.strip()
-    return _read_single_line(OPENROUTER_API_KEY_FILE_PATH)
+    return read_file_value(OPENROUTER_API_KEY_FILE_PATH)
 
 
-def generate(prompt: str, model: Optional[str] = None, timeout: int = 60) -> str:
+def _request(
+    prompt: Prompt, model: str, stream: bool = False, options: Optional[GenerationOptions] = None
+) -> tuple[dict, dict]:
+    """Builds the (headers, payload) pair for an OpenRouter chat completion."""
     api_key = resolve_api_key()
     if not api_key:
         raise RuntimeError("OpenRouter API key not available via env or ~/.api-openrouter")
 
+    options = options or {}
     payload = {
-        "model": model or resolve_model(),
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.2,
+        "model": model,
+        "messages": as_messages(prompt),
+        "temperature": options.get("temperature", DEFAULT_TEMPERATURE),
     }
+    if options.get("max_tokens"):
+        payload["max_tokens"] = options["max_tokens"]
+    if options.get("stop"):
+        payload["stop"] = options["stop"]
+    if stream:
+        payload["stream"] = True
     headers = {
         "Authorization": f"Bearer {api_key}",
         "HTTP-Referer": "https://waifuai.com",
@@ -96,10 +125,17 @@ def generate(prompt: str, model: Optional[str] = None, timeout: int = 60) -> str
         "X-OpenRouter-Categories": "character-chat",
         "Content-Type": "application/json",
     }
+    return headers, payload
+
 
-    resp = requests.post(OPENROUTER_API_URL, headers=headers, json=payload, timeout=timeout)
+def _parse_response(resp) -> str:
     if resp.status_code != 200:
-        raise RuntimeError(f"OpenRouter non-200: {resp.status_code} body: {resp.text[:500]}")
+        body = resp.text[:500]
+        message = f"OpenRouter non-200: {resp.status_code} body: {body}"
+        retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+        if resp.status_code == 429:
+            raise ProviderThrottledError(message, retry_after=retry_after)
+        raise ProviderError(message, status_code=resp.status_code, retry_after=retry_after)
 
     data = resp.json()
     choices = data.get("choices", [])
@@ -108,4 +144,93 @@ def generate(prompt: str, model: Optional[str] = None, timeout: int = 60) -> str
     content = (choices[0].get("message", {}).get("content") or "").strip()
     if not content:
         raise RuntimeError("OpenRouter response empty content")
-    return content
\ No newline at end of file
+    return content
+
+
+def _sse_content(line: str) -> Optional[str]:
+    """Returns the content delta carried by one SSE line, if any.
+
+    Comment lines (": OPENROUTER PROCESSING") and the final "[DONE]" carry none.
+    """
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if not data or data == "[DONE]":
+        return None
+    event = json.loads(data)
+    if "error" in event:
+        raise RuntimeError(f"OpenRouter stream error: {event['error']}")
+    choices = event.get("choices", [])
+    if not choices:
+        return None
+    return choices[0].get("delta", {}).get("content") or None
+
+
+def _join_stream(chunks: Iterable[str]) -> str:
+    content = "".join(chunks).strip()
+    if not content:
+        raise RuntimeError("OpenRouter response empty content")
+    return content
+
+
+@register_provider
+class OpenRouterProvider(Provider):
+    """OpenRouter chat completions over the shared pooled HTTP clients."""
+
+    name = "openrouter"
+
+    def default_model(self) -> str:
+        return resolve_model()
+
+    def generate(self, prompt: Prompt, model: str, timeout: float, on_chunk=None, options=None) -> str:
+        if on_chunk is None:
+            headers, payload = _request(prompt, model, options=options)
+            resp = get_client().post(OPENROUTER_API_URL, headers=headers, json=payload, timeout=request_timeout(timeout))
+            return _parse_response(resp)
+        headers, payload = _request(prompt, model, stream=True, options=options)
+        chunks = []
+        with get_client().stream("POST", OPENROUTER_API_URL, headers=headers, json=payload, timeout=request_timeout(timeout)) as resp:
+            if resp.status_code != 200:
+                resp.read()
+                return _parse_response(resp)
+            for line in resp.iter_lines():
+                content = _sse_content(line)
+                if content:
+                    chunks.append(content)
+                    on_chunk(content)
+        return _join_stream(chunks)
+
+    async def agenerate(self, prompt: Prompt, model: str, timeout: float, on_chunk=None, options=None) -> str:
+        client = get_async_client()
+        if on_chunk is None:
+            headers, payload = _request(prompt, model, options=options)
+            resp = await client.post(OPENROUTER_API_URL, headers=headers, json=payload, timeout=request_timeout(timeout))
+            return _parse_response(resp)
+        headers, payload = _request(prompt, model, stream=True, options=options)
+        chunks = []
+        async with client.stream("POST", OPENROUTER_API_URL, headers=headers, json=payload, timeout=request_timeout(timeout)) as resp:
+            if resp.status_code != 200:
+                await resp.aread()
+                return _parse_response(resp)
+            async for line in resp.aiter_lines():
+                content = _sse_content(line)
+                if content:
+                    chunks.append(content)
+                    await on_chunk(content)
+        return _join_stream(chunks)
+
+
+def generate(
+    prompt: str,
+    model: Optional[str] = None,
+    timeout: int = 60,
+    max_tokens: Optional[int] = None,
+    stop: Optional[list[str]] = None,
+    temperature: Optional[float] = None,
+) -> str:
+    """Generates one completion without the router; unset params take the server defaults."""
+    # respond loads the provider registry, which imports this module.
+    from mcp_waifu_queue.respond import sampling_options
+
+    options = sampling_options({"max_tokens": max_tokens, "stop": stop, "temperature": temperature})
+    return OpenRouterProvider().generate(prompt, model or resolve_model(), timeout, options=options)
@@ -0,0 +1,358 @@
+"""
+Latency-Aware Provider Router.
+
+This module sends each generation to the fastest healthy backend and fails
+over to the next one when a backend errors.
+
+Key Features:
+- A backend is a (provider, model) pair, configured as "provider" or
+  "provider:model" strings in Config.provider_backends. When none are
+  configured, the single backend is Config.default_provider with its default
+  model. A backend without a model follows its provider's default model, so
+  editing ~/.model-openrouter takes effect without a restart
+- Per-backend EWMA of latency and error rate
+- Ranking: healthy backends by EWMA latency (a backend with no samples yet
+  ranks first so it gets measured; ties keep the configured order), then
+  unhealthy backends as a last resort
+- A backend is unhealthy while its error EWMA is above router_max_error_rate;
+  after router_unhealthy_cooldown_seconds without a new failure it is probed
+  again
+- A small share of calls (router_explore_ratio) go to a random healthy
+  backend so latency estimates stay current
+- Per-request model: a call that names a model only goes to backends serving
+  that model. A model no configured backend serves runs on the primary
+  backend's provider, as an extra backend with its own statistics
+- Per-request generation options (max_tokens, temperature, stop) are passed
+  to the provider unchanged
+- Failover: on an error the next backend in rank order is tried, unless the
+  failed call had already streamed text. Each backend attempt goes through
+  that backend's retry/hedging/circuit breaker policy (resilience.py) and,
+  for remote providers, the shared rate limiter (ratelimit.py)
+
+Every provider request is recorded in the provider metrics (latency, time to
+first chunk, outcome and estimated tokens, by provider and model).
+
+served_model() returns the model of the backend that produced the last
+completion in the calling context, so callers can key cached completions on
+it rather than on the model they asked for.
+
+When every backend fails, a ProviderThrottledError is preferred over the
+others, so the job is requeued rather than failed.
+
+Statistics are per process, like the circuit breaker state. The router is
+rebuilt from Config on a settings reload (SIGHUP).
+
+Usage:
+    router = get_router()
+    text = router.call(prompt)
+    text = await router.acall(prompt, on_chunk=callback, model="openai/gpt-4o-mini", options={"max_tokens": 256})
+
+Dependencies:
+- providers.base: Provider registry
+- ratelimit / resilience: Per-attempt admission and retry policy
+- config: Backends, EWMA and health settings
+- metrics: Per-request provider metrics
+"""
+
+import contextvars
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+from mcp_waifu_queue import metrics
+from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.errors import ProviderThrottledError
+from mcp_waifu_queue.providers.base import (
+    AsyncChunkCallback,
+    ChunkCallback,
+    GenerationOptions,
+    Prompt,
+    Provider,
+    get_provider,
+    prompt_text,
+)
+from mcp_waifu_queue.ratelimit import estimate_tokens, get_rate_limiter
+from mcp_waifu_queue.resilience import get_resilient_caller
+from mcp_waifu_queue.settings import on_reload
+
+logger = logging.getLogger(__name__)
+
+_served_model: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("waifu_served_model", default=None)
+
+
+def served_model() -> Optional[str]:
+    """Model of the backend that produced the last completion in this context, if any."""
+    return _served_model.get()
+
+
+class Backend:
+    """One provider/model pair and its running statistics."""
+
+    def __init__(self, provider: Provider, model: Optional[str] = None):
+        self.provider = provider
+        self._model = model
+        self.key = f"{provider.name}:{model}" if model else provider.name
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.last_failure: Optional[float] = None
+        self.calls = 0
+
+    @property
+    def model(self) -> str:
+        return self._model or self.provider.default_model()
+
+    def snapshot(self) -> dict:
+        return {
+            "backend": self.key,
+            "model": self.model,
+            "latency_ewma_seconds": self.latency,
+            "error_rate_ewma": self.error_rate,
+            "calls": self.calls,
+        }
+
+
+def parse_backend(spec: str) -> Backend:
+    """Builds a Backend from "provider" or "provider:model"."""
+    name, _, model = spec.strip().partition(":")
+    return Backend(get_provider(name), model or None)
+
+
+class ProviderRouter:
+    """Ranks backends by EWMA latency and health, with failover."""
+
+    def __init__(
+        self,
+        backends: list[Backend],
+        timeout: float = 60,
+        alpha: float = 0.2,
+        max_error_rate: float = 0.5,
+        unhealthy_cooldown: float = 30.0,
+        explore_ratio: float = 0.05,
+    ):
+        if not backends:
+            raise ValueError("The provider router needs at least one backend")
+        self.backends = backends
+        self.timeout = timeout
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.unhealthy_cooldown = unhealthy_cooldown
+        self.explore_ratio = explore_ratio
+        # Requested models that no configured backend serves, by model.
+        self.extra_backends: dict[str, Backend] = {}
+        self._lock = threading.Lock()
+
+    def primary(self) -> Backend:
+        """The first configured backend."""
+        return self.backends[0]
+
+    def is_healthy(self, backend: Backend) -> bool:
+        if backend.error_rate <= self.max_error_rate:
+            return True
+        return time.monotonic() - (backend.last_failure or 0.0) >= self.unhealthy_cooldown
+
+    def ranked(self) -> list[Backend]:
+        """Backends in the order they should be tried for the next call."""
+        healthy = [b for b in self.backends if self.is_healthy(b)]
+        unhealthy = sorted((b for b in self.backends if not self.is_healthy(b)), key=lambda b: b.error_rate)
+        healthy.sort(key=lambda b: b.latency or 0.0)
+        if len(healthy) > 1 and random.random() < self.explore_ratio:
+            healthy.insert(0, healthy.pop(random.randrange(1, len(healthy))))
+        return healthy + unhealthy
+
+    def candidates(self, model: Optional[str] = None) -> list[Backend]:
+        """Backends to try for a call, in order; with model, only those serving it."""
+        ranked = self.ranked()
+        if model is None:
+            return ranked
+        serving = [b for b in ranked if b.model == model]
+        if serving:
+            return serving
+        with self._lock:
+            if model not in self.extra_backends:
+                self.extra_backends[model] = Backend(self.primary().provider, model)
+            return [self.extra_backends[model]]
+
+    def record(self, backend: Backend, latency: Optional[float] = None) -> None:
+        """Updates a backend's EWMAs; latency None records a failure."""
+        with self._lock:
+            backend.calls += 1
+            failed = latency is None
+            backend.error_rate += self.alpha * ((1.0 if failed else 0.0) - backend.error_rate)
+            if failed:
+                backend.last_failure = time.monotonic()
+            elif backend.latency is None:
+                backend.latency = latency
+            else:
+                backend.latency += self.alpha * (latency - backend.latency)
+
+    def snapshot(self) -> list[dict]:
+        """Current per-backend statistics, in configured order, then extra backends."""
+        backends = self.backends + list(self.extra_backends.values())
+        return [dict(b.snapshot(), healthy=self.is_healthy(b)) for b in backends]
+
+    @staticmethod
+    def _final_error(errors: list[Exception]) -> Exception:
+        for e in errors:
+            if isinstance(e, ProviderThrottledError):
+                return e
+        return errors[0]
+
+    def _generate(self, backend: Backend, prompt: Prompt, on_chunk, options) -> str:
+        model = backend.model
+        call = metrics.ProviderCall(backend.provider.name, model)
+        try:
+            result = backend.provider.generate(
+                prompt, model, self.timeout, on_chunk=call.wrap(on_chunk), options=options
+            )
+        except Exception as e:
+            call.finish(e)
+            raise
+        call.finish(prompt_tokens=estimate_tokens(prompt_text(prompt)), completion_tokens=estimate_tokens(result))
+        return result
+
+    def _attempt(self, backend: Backend, prompt: Prompt, on_chunk, can_retry, options) -> str:
+        limiter = get_rate_limiter(backend.provider.name) if backend.provider.rate_limited else None
+
+        def once() -> str:
+            if limiter is None:
+                return self._generate(backend, prompt, on_chunk, options)
+            with limiter.slot(estimate_tokens(prompt_text(prompt))) as slot:
+                result = self._generate(backend, prompt, on_chunk, options)
+                slot.charge(estimate_tokens(result))
+            return result
+
+        return get_resilient_caller(backend.key).call(once, hedge=on_chunk is None, can_retry=can_retry)
+
+    def call(
+        self,
+        prompt: Prompt,
+        on_chunk: Optional[ChunkCallback] = None,
+        model: Optional[str] = None,
+        options: Optional[GenerationOptions] = None,
+    ) -> str:
+        """Generates with the best-ranked backend, failing over on errors.
+
+        prompt is a single user prompt or a chat message list. model, when
+        given, restricts the call to backends serving that model.
+        """
+        streamed = False
+
+        def forward(text: str) -> None:
+            nonlocal streamed
+            streamed = True
+            on_chunk(text)
+
+        errors: list[Exception] = []
+        for backend in self.candidates(model):
+            if streamed:
+                break
+            if errors:
+                logger.warning(f"Failing over to provider backend {backend.key}")
+            started = time.monotonic()
+            try:
+                result = self._attempt(
+                    backend, prompt, forward if on_chunk is not None else None, lambda: not streamed, options
+                )
+            except Exception as e:
+                self.record(backend)
+                logger.warning(f"Provider backend {backend.key} failed: {e}")
+                errors.append(e)
+                continue
+            self.record(backend, time.monotonic() - started)
+            _served_model.set(backend.model)
+            logger.info(f"Generated with provider backend {backend.key}")
+            return result
+        raise self._final_error(errors)
+
+    async def _agenerate(self, backend: Backend, prompt: Prompt, on_chunk, options) -> str:
+        model = backend.model
+        call = metrics.ProviderCall(backend.provider.name, model)
+        try:
+            result = await backend.provider.agenerate(
+                prompt, model, self.timeout, on_chunk=call.awrap(on_chunk), options=options
+            )
+        except Exception as e:
+            call.finish(e)
+            raise
+        call.finish(prompt_tokens=estimate_tokens(prompt_text(prompt)), completion_tokens=estimate_tokens(result))
+        return result
+
+    async def _aattempt(self, backend: Backend, prompt: Prompt, on_chunk, can_retry, options) -> str:
+        limiter = get_rate_limiter(backend.provider.name) if backend.provider.rate_limited else None
+
+        async def once() -> str:
+            if limiter is None:
+                return await self._agenerate(backend, prompt, on_chunk, options)
+            async with limiter.aslot(estimate_tokens(prompt_text(prompt))) as slot:
+                result = await self._agenerate(backend, prompt, on_chunk, options)
+                slot.charge(estimate_tokens(result))
+            return result
+
+        return await get_resilient_caller(backend.key).acall(once, hedge=on_chunk is None, can_retry=can_retry)
+
+    async def acall(
+        self,
+        prompt: Prompt,
+        on_chunk: Optional[AsyncChunkCallback] = None,
+        model: Optional[str] = None,
+        options: Optional[GenerationOptions] = None,
+    ) -> str:
+        """Async call; on_chunk, when given, is awaited with each delta."""
+        streamed = False
+
+        async def forward(text: str) -> None:
+            nonlocal streamed
+            streamed = True
+            await on_chunk(text)
+
+        errors: list[Exception] = []
+        for backend in self.candidates(model):
+            if streamed:
+                break
+            if errors:
+                logger.warning(f"Failing over to provider backend {backend.key}")
+            started = time.monotonic()
+            try:
+                result = await self._aattempt(
+                    backend, prompt, forward if on_chunk is not None else None, lambda: not streamed, options
+                )
+            except Exception as e:
+                self.record(backend)
+                logger.warning(f"Provider backend {backend.key} failed: {e}")
+                errors.append(e)
+                continue
+            self.record(backend, time.monotonic() - started)
+            _served_model.set(backend.model)
+            logger.info(f"Generated with provider backend {backend.key}")
+            return result
+        raise self._final_error(errors)
+
+
+_router: Optional[ProviderRouter] = None
+
+
+def get_router() -> ProviderRouter:
+    """Returns the process-wide router built from Config."""
+    global _router
+    if _router is None:
+        config = Config.load()
+        specs = config.provider_backends or [config.default_provider]
+        _router = ProviderRouter(
+            [parse_backend(spec) for spec in specs],
+            timeout=config.request_timeout_seconds,
+            alpha=config.router_ewma_alpha,
+            max_error_rate=config.router_max_error_rate,
+            unhealthy_cooldown=config.router_unhealthy_cooldown_seconds,
+            explore_ratio=config.router_explore_ratio,
+        )
+    return _router
+
+
+def _reset_router() -> None:
+    global _router
+    _router = None
+
+
+on_reload(_reset_router)
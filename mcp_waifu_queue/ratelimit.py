@@ -0,0 +1,329 @@
+"""
+Shared Provider Rate Limiter and Adaptive Concurrency.
+
+This module keeps every worker process, RQ or asyncio, within the provider's
+rate limits. State lives in Redis so the limits hold for the fleet as a whole,
+not per process, and every admission decision is one atomic Lua script call.
+
+Key Features:
+- Token buckets on requests per minute and tokens per minute (either can be
+  disabled with 0). Prompt tokens are charged up front; completion tokens
+  are charged once the response is known, so the bucket may dip below zero
+  and later requests wait for it to refill
+- AIMD adaptive concurrency: a shared limit on in-flight provider calls grows
+  by about one per round of successful calls and halves on a 429 or 5xx (at
+  most once per second, so a burst of errors counts as one signal)
+- Retry-After: a 429 pauses admissions fleet-wide until the provider's
+  Retry-After delay (or a default) has passed
+- In-flight calls hold expiring leases, so a crashed worker cannot leak
+  concurrency
+- Sync (slot) and async (aslot) context managers
+
+Callers that cannot be admitted within rate_limit_max_wait_seconds get
+ProviderThrottledError, which the workers turn into a delayed retry of the job.
+
+Redis Layout (one set of keys per provider, e.g. <provider> = openrouter):
+- waifu:ratelimit:<provider>:rpm / :tpm: Bucket hashes (level, ts)
+- waifu:ratelimit:<provider>:inflight: Sorted set of lease ids scored by expiry time
+- waifu:ratelimit:<provider>:state: Hash of limit, paused_until and decreased_at
+
+Usage:
+    limiter = get_rate_limiter("openrouter")
+    with limiter.slot(estimate_tokens(prompt)) as slot:
+        text = call_provider(prompt)
+        slot.charge(estimate_tokens(text))
+
+Dependencies:
+- redis: Shared limiter state (sync and redis.asyncio)
+- errors: ProviderError classification and ProviderThrottledError
+- config: Limits and AIMD bounds
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+import uuid
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.errors import ProviderError, ProviderThrottledError
+from mcp_waifu_queue.settings import on_reload
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "waifu:ratelimit:"
+
+# Longest single sleep between admission attempts.
+MAX_POLL_SECONDS = 1.0
+# Pause applied after a 429 that carries no Retry-After header.
+DEFAULT_RETRY_AFTER_SECONDS = 5.0
+
+# KEYS: rpm bucket, tpm bucket, inflight leases, state
+# ARGV: now, rpm, tpm, token cost, lease id, lease expiry, initial limit
+# Returns {1, 0} when admitted, else {0, milliseconds to wait}.
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local function refill(key, rate)
+    local state = redis.call('HMGET', key, 'level', 'ts')
+    local level = tonumber(state[1]) or rate
+    local ts = tonumber(state[2]) or now
+    return math.min(rate, level + math.max(0, now - ts) * rate / 60)
+end
+
+local paused_until = tonumber(redis.call('HGET', KEYS[4], 'paused_until') or '0')
+if paused_until > now then
+    return {0, math.ceil((paused_until - now) * 1000)}
+end
+
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now)
+local limit = tonumber(redis.call('HGET', KEYS[4], 'limit') or ARGV[7])
+if redis.call('ZCARD', KEYS[3]) >= math.max(1, math.floor(limit)) then
+    return {0, 100}
+end
+
+local rpm = tonumber(ARGV[2])
+local tpm = tonumber(ARGV[3])
+local cost = math.min(tonumber(ARGV[4]), tpm)
+local wait = 0
+local requests, tokens
+if rpm > 0 then
+    requests = refill(KEYS[1], rpm)
+    if requests < 1 then wait = math.max(wait, (1 - requests) * 60 / rpm) end
+end
+if tpm > 0 then
+    tokens = refill(KEYS[2], tpm)
+    if tokens < cost then wait = math.max(wait, (cost - tokens) * 60 / tpm) end
+end
+if wait > 0 then
+    return {0, math.ceil(wait * 1000)}
+end
+
+if requests then
+    redis.call('HSET', KEYS[1], 'level', requests - 1, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], 120)
+end
+if tokens then
+    redis.call('HSET', KEYS[2], 'level', tokens - cost, 'ts', now)
+    redis.call('EXPIRE', KEYS[2], 120)
+end
+redis.call('ZADD', KEYS[3], tonumber(ARGV[6]), ARGV[5])
+return {1, 0}
+"""
+
+# KEYS: tpm bucket, inflight leases, state
+# ARGV: now, lease id, outcome, retry after, extra tokens, min limit, max limit, initial limit
+_RELEASE_SCRIPT = """
+local now = tonumber(ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[2])
+local extra = tonumber(ARGV[5])
+if extra > 0 and redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HINCRBYFLOAT', KEYS[1], 'level', -extra)
+end
+
+local outcome = ARGV[3]
+local min_limit = tonumber(ARGV[6])
+local max_limit = tonumber(ARGV[7])
+local limit = tonumber(redis.call('HGET', KEYS[3], 'limit') or ARGV[8])
+if outcome == 'ok' then
+    limit = math.min(max_limit, limit + 1 / math.max(1, limit))
+elseif outcome == 'throttled' or outcome == 'error' then
+    local decreased_at = tonumber(redis.call('HGET', KEYS[3], 'decreased_at') or '0')
+    if now - decreased_at >= 1 then
+        limit = math.max(min_limit, limit / 2)
+        redis.call('HSET', KEYS[3], 'decreased_at', now)
+    end
+    if outcome == 'throttled' then
+        local until_ts = now + tonumber(ARGV[4])
+        local paused_until = tonumber(redis.call('HGET', KEYS[3], 'paused_until') or '0')
+        if until_ts > paused_until then
+            redis.call('HSET', KEYS[3], 'paused_until', until_ts)
+        end
+    end
+end
+redis.call('HSET', KEYS[3], 'limit', limit)
+return tostring(limit)
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for rate limiting (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def _outcome(exc: Optional[BaseException]) -> tuple[str, float]:
+    """Classifies a call's result for AIMD: (outcome, retry_after)."""
+    if exc is None:
+        return "ok", 0.0
+    if isinstance(exc, ProviderThrottledError):
+        return "throttled", exc.retry_after if exc.retry_after is not None else DEFAULT_RETRY_AFTER_SECONDS
+    if isinstance(exc, ProviderError) and exc.status_code is not None and exc.status_code >= 500:
+        return "error", 0.0
+    # Timeouts, bad requests and local failures say nothing about upstream capacity.
+    return "neutral", 0.0
+
+
+class Slot:
+    """An admitted provider call; charge() records tokens used beyond the estimate."""
+
+    def __init__(self, lease_id: str):
+        self.lease_id = lease_id
+        self.extra_tokens = 0
+
+    def charge(self, tokens: int) -> None:
+        self.extra_tokens += tokens
+
+
+class RateLimiter:
+    """Fleet-wide token buckets and AIMD concurrency limit, kept in Redis."""
+
+    def __init__(
+        self,
+        connection: redis.Redis,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        min_concurrency: int = 1,
+        max_concurrency: int = 32,
+        max_wait_seconds: float = 30.0,
+        lease_seconds: float = 120.0,
+        async_connection: Optional[aioredis.Redis] = None,
+        namespace: str = "default",
+    ):
+        self.connection = connection
+        prefix = f"{KEY_PREFIX}{namespace}:"
+        self.rpm_key = prefix + "rpm"
+        self.tpm_key = prefix + "tpm"
+        self.inflight_key = prefix + "inflight"
+        self.state_key = prefix + "state"
+        self.async_connection = async_connection
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.max_wait_seconds = max_wait_seconds
+        self.lease_seconds = lease_seconds
+        self._acquire = connection.register_script(_ACQUIRE_SCRIPT)
+        self._release = connection.register_script(_RELEASE_SCRIPT)
+        if async_connection is not None:
+            self._aacquire = async_connection.register_script(_ACQUIRE_SCRIPT)
+            self._arelease = async_connection.register_script(_RELEASE_SCRIPT)
+
+    def _acquire_args(self, tokens: int, lease_id: str) -> dict:
+        now = time.time()
+        return {
+            "keys": [self.rpm_key, self.tpm_key, self.inflight_key, self.state_key],
+            "args": [
+                now, self.requests_per_minute, self.tokens_per_minute, tokens,
+                lease_id, now + self.lease_seconds, self.max_concurrency,
+            ],
+        }
+
+    def _release_args(self, slot: Slot, exc: Optional[BaseException]) -> dict:
+        outcome, retry_after = _outcome(exc)
+        if outcome == "throttled":
+            logger.warning(f"Provider throttled; pausing admissions for {retry_after:.1f}s")
+        return {
+            "keys": [self.tpm_key, self.inflight_key, self.state_key],
+            "args": [
+                time.time(), slot.lease_id, outcome, retry_after, slot.extra_tokens,
+                self.min_concurrency, self.max_concurrency, self.max_concurrency,
+            ],
+        }
+
+    def _throttled(self, wait: float) -> ProviderThrottledError:
+        return ProviderThrottledError(
+            f"Rate limiter did not admit the request within {self.max_wait_seconds}s",
+            status_code=None,
+            retry_after=wait,
+        )
+
+    def acquire(self, tokens: int = 1) -> Slot:
+        """Blocks until admitted; raises ProviderThrottledError after max_wait_seconds."""
+        slot = Slot(uuid.uuid4().hex)
+        deadline = time.monotonic() + self.max_wait_seconds
+        while True:
+            admitted, wait_ms = self._acquire(**self._acquire_args(tokens, slot.lease_id))
+            if admitted:
+                return slot
+            wait = wait_ms / 1000
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise self._throttled(wait)
+            time.sleep(min(wait, MAX_POLL_SECONDS, remaining))
+
+    def release(self, slot: Slot, exc: Optional[BaseException] = None) -> None:
+        """Frees the slot and feeds the call's outcome into the AIMD limit."""
+        self._release(**self._release_args(slot, exc))
+
+    async def aacquire(self, tokens: int = 1) -> Slot:
+        """Async acquire, using the limiter's redis.asyncio connection."""
+        slot = Slot(uuid.uuid4().hex)
+        deadline = time.monotonic() + self.max_wait_seconds
+        while True:
+            admitted, wait_ms = await self._aacquire(**self._acquire_args(tokens, slot.lease_id))
+            if admitted:
+                return slot
+            wait = wait_ms / 1000
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise self._throttled(wait)
+            await asyncio.sleep(min(wait, MAX_POLL_SECONDS, remaining))
+
+    async def arelease(self, slot: Slot, exc: Optional[BaseException] = None) -> None:
+        """Async release, using the limiter's redis.asyncio connection."""
+        await self._arelease(**self._release_args(slot, exc))
+
+    @contextlib.contextmanager
+    def slot(self, tokens: int = 1):
+        """Holds an admitted slot for the duration of one provider call."""
+        slot = self.acquire(tokens)
+        try:
+            yield slot
+        except BaseException as e:
+            self.release(slot, e)
+            raise
+        self.release(slot)
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, tokens: int = 1):
+        """Async slot, using the limiter's redis.asyncio connection."""
+        slot = await self.aacquire(tokens)
+        try:
+            yield slot
+        except BaseException as e:
+            await self.arelease(slot, e)
+            raise
+        await self.arelease(slot)
+
+
+_limiters: dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(namespace: str = "default") -> Optional[RateLimiter]:
+    """Returns the process-wide limiter for a provider, or None when rate limiting is disabled."""
+    config = Config.load()
+    if not config.rate_limit_enabled:
+        return None
+    if namespace not in _limiters:
+        _limiters[namespace] = RateLimiter(
+            redis.from_url(config.redis_url),
+            requests_per_minute=config.rate_limit_requests_per_minute,
+            tokens_per_minute=config.rate_limit_tokens_per_minute,
+            min_concurrency=config.provider_concurrency_min,
+            max_concurrency=config.provider_concurrency_max,
+            max_wait_seconds=config.rate_limit_max_wait_seconds,
+            lease_seconds=config.request_timeout_seconds + 30,
+            async_connection=aioredis.from_url(config.redis_url),
+            namespace=namespace,
+        )
+    return _limiters[namespace]
+
+
+def _reset_limiters() -> None:
+    _limiters.clear()
+
+
+on_reload(_reset_limiters)
@@ -0,0 +1,327 @@
+"""
+Resilience Layer for Provider Calls.
+
+This module wraps each provider call so that one slow or failed upstream
+response no longer fails the whole job.
+
+Key Features:
+- Classified retries: transport errors, timeouts and 5xx/408 responses are
+  retried; 4xx responses, missing credentials and malformed responses are not.
+  Throttling (ProviderThrottledError) is left to the rate limiter and the job
+  requeue path
+- Exponential backoff with full jitter, honoring a provider's Retry-After
+- Hedged requests: when a call has not answered within the p95 of recent
+  latencies, a second identical request is sent and whichever succeeds first
+  wins (non-streaming calls only, since a stream cannot be deduplicated)
+- Circuit breaker: after a run of consecutive retryable failures, calls fail
+  fast with CircuitOpenError until a cool-down passes; then a single trial
+  call decides whether the circuit closes again
+
+Breaker and latency state are per process and per backend (provider and
+model): every worker process judges each upstream on its own calls.
+
+Usage:
+    caller = get_resilient_caller("openrouter:openrouter/free")
+    text = caller.call(lambda: post_to_provider(prompt), hedge=True)
+    text = await caller.acall(lambda: apost_to_provider(prompt), hedge=True)
+
+Dependencies:
+- httpx: Transport error types
+- errors: ProviderError classification
+- config: Retry, hedging and circuit breaker settings
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import contextvars
+import logging
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.errors import ProviderError, ProviderThrottledError
+from mcp_waifu_queue.settings import on_reload
+
+logger = logging.getLogger(__name__)
+
+# Recent successful call latencies kept for the hedging quantile.
+LATENCY_WINDOW = 200
+HEDGE_QUANTILE = 0.95
+RETRYABLE_STATUS_CODES = {408, 500, 502, 503, 504}
+
+
+class CircuitOpenError(ProviderError):
+    """Raised without calling the provider while the circuit breaker is open."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """True for failures that another attempt may fix."""
+    if isinstance(exc, (ProviderThrottledError, CircuitOpenError)):
+        return False
+    if isinstance(exc, ProviderError):
+        return exc.status_code is not None and (
+            exc.status_code in RETRYABLE_STATUS_CODES or exc.status_code >= 500
+        )
+    return isinstance(exc, httpx.TransportError)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a half-open trial call."""
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_seconds:
+            return "open"
+        return "half-open"
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError unless a call may go through now."""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+        raise CircuitOpenError("Provider circuit breaker is open; failing fast")
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Provider circuit breaker closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            trial_failed = self._trial_in_flight
+            self._trial_in_flight = False
+            if trial_failed or (self._opened_at is None and 0 < self.failure_threshold <= self._failures):
+                logger.warning(f"Provider circuit breaker opened after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+
+    def record_ignored(self) -> None:
+        """Ends a trial call whose outcome says nothing about upstream health."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples: collections.deque[float] = collections.deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        if len(self._samples) < max(1, min_samples):
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ResilientCaller:
+    """Retries, hedges and circuit-breaks calls to one provider."""
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        hedge_enabled: bool = False,
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 0.5,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker(failure_threshold=0)
+        self.latency = LatencyTracker()
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    def backoff(self, attempt: int, exc: BaseException) -> float:
+        """Full-jitter delay before retry number attempt (1-based)."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        retry_after = getattr(exc, "retry_after", None)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there is too little history."""
+        if not self.hedge_enabled:
+            return None
+        p95 = self.latency.quantile(HEDGE_QUANTILE, self.hedge_min_samples)
+        return None if p95 is None else max(self.hedge_min_delay, p95)
+
+    def _record(self, exc: Optional[BaseException]) -> None:
+        if exc is None:
+            self.breaker.record_success()
+        elif is_retryable(exc):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_ignored()
+
+    def _should_retry(self, exc: BaseException, attempt: int, can_retry: Callable[[], bool]) -> bool:
+        return is_retryable(exc) and attempt < self.max_attempts and can_retry()
+
+    # --- sync ---
+
+    def _timed(self, func: Callable[[], str]) -> str:
+        started = time.monotonic()
+        result = func()
+        self.latency.record(time.monotonic() - started)
+        return result
+
+    def _hedged(self, func: Callable[[], str]) -> str:
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._timed(func)
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="hedge")
+        # Run in copies of the caller's context so the job's stage marks (timing.py) see the call.
+        primary = self._executor.submit(contextvars.copy_context().run, self._timed, func)
+        try:
+            return primary.result(timeout=delay)
+        except concurrent.futures.TimeoutError:
+            pass
+        logger.info(f"Provider call slower than {delay:.2f}s; sending hedged request")
+        pending = {primary, self._executor.submit(contextvars.copy_context().run, self._timed, func)}
+        errors = []
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The slower request finishes in the background; its result is dropped.
+                    return future.result()
+                errors.append(future.exception())
+        raise errors[0]
+
+    def call(self, func: Callable[[], str], hedge: bool = False, can_retry: Callable[[], bool] = lambda: True) -> str:
+        """Runs func with retries, optional hedging and the circuit breaker."""
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            try:
+                result = self._hedged(func) if hedge else self._timed(func)
+            except Exception as e:
+                self._record(e)
+                if not self._should_retry(e, attempt, can_retry):
+                    raise
+                delay = self.backoff(attempt, e)
+                logger.warning(f"Provider call failed ({e}); retry {attempt}/{self.max_attempts - 1} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            self._record(None)
+            return result
+
+    # --- async ---
+
+    async def _atimed(self, func: Callable[[], Awaitable[str]]) -> str:
+        started = time.monotonic()
+        result = await func()
+        self.latency.record(time.monotonic() - started)
+        return result
+
+    async def _ahedged(self, func: Callable[[], Awaitable[str]]) -> str:
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._atimed(func)
+        primary = asyncio.ensure_future(self._atimed(func))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+            logger.info(f"Provider call slower than {delay:.2f}s; sending hedged request")
+            pending.add(asyncio.ensure_future(self._atimed(func)))
+            errors = []
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+            raise errors[0]
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def acall(
+        self,
+        func: Callable[[], Awaitable[str]],
+        hedge: bool = False,
+        can_retry: Callable[[], bool] = lambda: True,
+    ) -> str:
+        """Async call: the losing hedged request is cancelled."""
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            try:
+                result = await (self._ahedged(func) if hedge else self._atimed(func))
+            except Exception as e:
+                self._record(e)
+                if not self._should_retry(e, attempt, can_retry):
+                    raise
+                delay = self.backoff(attempt, e)
+                logger.warning(f"Provider call failed ({e}); retry {attempt}/{self.max_attempts - 1} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            self._record(None)
+            return result
+
+
+_callers: dict[str, ResilientCaller] = {}
+
+
+def get_resilient_caller(key: str = "default") -> ResilientCaller:
+    """Returns the process-wide ResilientCaller for a backend, built from Config."""
+    if key not in _callers:
+        config = Config.load()
+        _callers[key] = ResilientCaller(
+            max_attempts=config.provider_retry_max_attempts,
+            base_delay=config.provider_retry_base_delay_seconds,
+            max_delay=config.provider_retry_max_delay_seconds,
+            hedge_enabled=config.hedge_enabled,
+            hedge_min_samples=config.hedge_min_samples,
+            hedge_min_delay=config.hedge_min_delay_seconds,
+            breaker=CircuitBreaker(
+                failure_threshold=config.circuit_breaker_failure_threshold,
+                reset_seconds=config.circuit_breaker_reset_seconds,
+            ),
+        )
+    return _callers[key]
+
+
+def _reset_callers() -> None:
+    _callers.clear()
+
+
+on_reload(_reset_callers)
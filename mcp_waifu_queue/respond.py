@@ -1,103 +1,134 @@
 """
 AI Provider Dispatch and Text Generation.
 
-This module implements the core text generation functionality for the MCP Waifu Queue
-system, providing OpenRouter-based text generation.
+This module implements the core text generation entry points for the MCP Waifu
+Queue system. It hands every generation to the provider router, which picks a
+backend (provider and model) and fails over between backends.
 
 Key Features:
-- OpenRouter text generation via HTTP API
-- Centralized text generation dispatch
-- Error handling and logging
-- Configuration-driven model selection
+- Centralized text generation dispatch through providers/router.py
+- Latency- and error-aware backend selection with failover
+- Optional SSE streaming: chunks are handed to a callback as they arrive
+- Per-backend retries, hedging and circuit breaking (resilience.py) and
+  optional fleet-wide rate limiting (ratelimit.py)
+- Configuration-driven provider and model selection
+- Per-request generation params (model, max_tokens, temperature, stop),
+  checked against the server's caps at enqueue time and forwarded to the
+  provider. max_tokens always reaches the provider: Config.max_new_tokens
+  when the request does not set it, so every completion is bounded
 
 Model Configuration:
+- Backends: Config.provider_backends, or Config.default_provider (PROVIDER env)
 - OpenRouter models: Configured via ~/.model-openrouter or default 'openrouter/free'
 
 Usage:
 This module is used by the RQ worker process through utils.py. The main
 entry point is the predict_response() function which handles provider
-logic and returns generated text.
+logic and returns generated text. apredict_response() is the coroutine
+equivalent used by the asyncio worker.
 
 Dependencies:
-- requests: For OpenRouter API calls
+- providers: Provider registry and router
 - logging: For operation logging and debugging
-- config: For configuration management
 """
 
 # mcp_waifu_queue/respond.py
-# OpenRouter-only text generation.
 
 import logging
-import os
-from pathlib import Path
 from typing import Optional
 
+from mcp_waifu_queue import providers
 from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.providers.base import (
+    DEFAULT_TEMPERATURE,
+    ChunkCallback,
+    GenerationOptions,
+    Prompt,
+)
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# Model config file locations
-MODEL_FILE_OPENROUTER = Path.home() / ".model-openrouter"
-
-def _read_single_line(path: Path) -> Optional[str]:
-    try:
-        if path.is_file():
-            val = path.read_text(encoding="utf-8").strip()
-            return val or None
-    except Exception as e:
-        logger.warning(f"Failed reading {path}: {e}")
-    return None
-
-def _resolve_model() -> str:
-    return _read_single_line(MODEL_FILE_OPENROUTER) or "openrouter/free"
-
-def _predict_with_openrouter(prompt: str, model: str, timeout: int) -> str:
-    import requests
-
-    OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
-
-    # Key resolution precedence:
-    # 1) OPENROUTER_API_KEY env
-    # 2) ~/.api-openrouter single line
-    key = os.getenv("OPENROUTER_API_KEY")
-    if not key or not key.strip():
-        key_file = Path.home() / ".api-openrouter"
-        key = _read_single_line(key_file)
-
-    if not key:
-        raise RuntimeError("OpenRouter API key not available via env or ~/.api-openrouter")
-
-    payload = {
-        "model": model,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.2,
+def sampling_options(params: Optional[dict] = None) -> GenerationOptions:
+    """Returns the provider options for a request's params, with server defaults filled in."""
+    params = params or {}
+    options = {
+        "max_tokens": params.get("max_tokens") or Config.load().max_new_tokens,
+        "temperature": DEFAULT_TEMPERATURE if params.get("temperature") is None else params["temperature"],
     }
-    headers = {
-        "Authorization": f"Bearer {key}",
-        "Content-Type": "application/json",
-    }
-    resp = requests.post(OPENROUTER_API_URL, headers=headers, json=payload, timeout=timeout)
-    if resp.status_code != 200:
-        body = resp.text[:500]
-        raise RuntimeError(f"OpenRouter non-200: {resp.status_code} body: {body}")
-
-    data = resp.json()
-    choices = data.get("choices", [])
-    if not choices:
-        raise RuntimeError("OpenRouter response missing choices")
-    content = (choices[0].get("message", {}).get("content") or "").strip()
-    if not content:
-        raise RuntimeError("OpenRouter response empty content")
-    return content
-
-def predict_response(prompt: str) -> str:
+    if params.get("stop"):
+        options["stop"] = list(params["stop"])
+    return options
+
+def generation_params(params: Optional[dict] = None) -> dict:
+    """Returns the parameters that, with the prompt, determine a completion.
+
+    params are the request's own choices; unset ones take the server
+    defaults, and the default model is that of the primary (first
+    configured) backend.
+    """
+    params = params or {}
+    return {"model": params.get("model") or providers.primary_model(Config.load()), **sampling_options(params)}
+
+def served_params(params: Optional[dict] = None) -> dict:
+    """Returns params naming the model that generated the last completion in this context.
+
+    After a failover that is not the model the request asked for (or the
+    primary backend's), and a cached completion must be keyed on the model
+    that produced it.
     """
-    Generates a response for a given prompt using OpenRouter.
+    params = dict(params or {})
+    model = providers.served_model()
+    if model:
+        params["model"] = model
+    return params
+
+def _allowed_model(model: str, config: Config) -> bool:
+    if model in config.allowed_models:
+        return True
+    if any(spec.partition(":")[2].strip() == model for spec in config.provider_backends):
+        return True
+    return model == providers.primary_model(config)
+
+def check_generation_params(params: dict, config: Config) -> None:
+    """Raises ValueError when a request's generation params exceed the server's caps."""
+    max_tokens = params.get("max_tokens")
+    if max_tokens is not None and max_tokens > config.max_tokens_limit:
+        raise ValueError(f"max_tokens {max_tokens} exceeds the server limit of {config.max_tokens_limit}")
+    stop = params.get("stop") or []
+    if len(stop) > config.max_stop_sequences:
+        raise ValueError(f"At most {config.max_stop_sequences} stop sequences are allowed, got {len(stop)}")
+    model = params.get("model")
+    if model is not None and not _allowed_model(model, config):
+        raise ValueError(f"Model '{model}' is not allowed on this server")
+
+def predict_response(prompt: Prompt, on_chunk: Optional[ChunkCallback] = None, params: Optional[dict] = None) -> str:
     """
-    cfg = Config.load()
-    model = _resolve_model()
+    Generates a response for a given prompt using the best available backend.
 
-    logger.info(f"Using OpenRouter with model '{model}'")
+    prompt is either a single user prompt or, for a session turn, the full
+    chat message list.
 
-    return _predict_with_openrouter(prompt, model=model or "openrouter/free", timeout=cfg.request_timeout_seconds)
+    When on_chunk is given the completion is streamed and each content
+    delta is passed to it as it arrives; the full text is still returned.
+    A streamed call is only retried or failed over if it failed before its
+    first delta.
+
+    params are the request's generation params (model, max_tokens,
+    temperature, stop); see generation_params for the defaults.
+    """
+    params = params or {}
+    return providers.get_router().call(
+        prompt, on_chunk=on_chunk, model=params.get("model"), options=sampling_options(params)
+    )
+
+async def apredict_response(prompt: Prompt, on_chunk=None, params: Optional[dict] = None) -> str:
+    """
+    Async variant of predict_response, used by the asyncio worker.
+
+    on_chunk, when given, is a coroutine function awaited with each delta.
+    """
+    params = params or {}
+    return await providers.get_router().acall(
+        prompt, on_chunk=on_chunk, model=params.get("model"), options=sampling_options(params)
+    )
@@ -4,12 +4,13 @@
 # =============================================================================
 #
 # This script initializes and starts the required services for the MCP Waifu
-# Queue system, including Redis and the RQ worker process.
+# Queue system, including Redis and the worker supervisor.
 #
 # Features:
 # - Activates Python virtual environment
 # - Checks if Redis is already running and starts it if needed
-# - Starts the RQ worker process in the background
+# - Starts the worker supervisor in the background, which scales the worker
+#   pool between SUPERVISOR_MIN_WORKERS and SUPERVISOR_MAX_WORKERS
 # - Provides status messages for each step
 #
 # Usage:
@@ -23,7 +24,7 @@
 #
 # Services Started:
 # - Redis server (daemonized)
-# - RQ worker (background process)
+# - Worker supervisor and its workers (background processes)
 #
 # Note:
 # This script is primarily designed for Linux/macOS environments.
@@ -44,11 +45,11 @@ else
   redis-server --daemonize yes
 fi
 
-# Start worker.py
-echo "Starting worker.py"
-nohup python3 -m mcp_waifu_queue.worker & # Use python -m for module execution
+# Start the worker supervisor
+echo "Starting worker supervisor"
+nohup python3 -m mcp_waifu_queue.supervisor & # Use python -m for module execution
 
 # Removed queue service start
 # Removed response service start
 
-echo "Worker service started."
+echo "Worker supervisor started."
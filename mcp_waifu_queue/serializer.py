@@ -0,0 +1,137 @@
+"""
+Compact Job Serializer.
+
+This module replaces RQ's default pickle serialization of job payloads and
+results with compact JSON, compressing payloads above a size threshold, so
+large prompts and completions cost less Redis memory and no pickling.
+
+Key Features:
+- JSON encoding of job data (function name, args, kwargs), results and meta
+- zlib (standard library) or zstd (the optional 'zstandard' package)
+  compression of encodings larger than job_compression_threshold_bytes.
+  This matters most for results, which RQ stores base64-encoded but
+  otherwise as written; RQ already zlib-compresses the job data field
+- A one-byte tag in front of each encoding records how it was written, so
+  settings can change without breaking jobs already in Redis
+- Values JSON cannot represent faithfully (bytes, non-string dict keys,
+  arbitrary objects returned by foreign jobs) fall back to pickle
+- Pickled payloads written by RQ's default serializer, e.g. jobs enqueued
+  before an upgrade, are still read
+
+Encoding Tags:
+- j: JSON
+- z: zlib-compressed JSON
+- s: zstd-compressed JSON
+- pickle data is recognized by its protocol header and passed to pickle
+
+Every process that touches the queues (server and workers) must run a version
+that has this module; set JOB_SERIALIZER=pickle while older workers are still
+draining their queues.
+
+Usage:
+    serializer = get_serializer()
+    queue = Queue("default", connection=conn, serializer=serializer)
+
+Dependencies:
+- zstandard (optional): zstd compression
+- config: Serializer choice, codec and compression threshold
+"""
+
+import json
+import logging
+import pickle
+import zlib
+from typing import Any, Optional
+
+from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.settings import on_reload
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+JSON_TAG = b"j"
+ZLIB_TAG = b"z"
+ZSTD_TAG = b"s"
+PICKLE_PROTOCOL_HEADER = 0x80
+
+
+def _json_safe(value: Any) -> bool:
+    """True if value survives a JSON round trip (tuples come back as lists)."""
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(_json_safe(item) for item in value)
+    if isinstance(value, dict):
+        return all(isinstance(key, str) and _json_safe(item) for key, item in value.items())
+    return False
+
+
+class CompactSerializer:
+    """RQ serializer: tagged, optionally compressed JSON with a pickle fallback."""
+
+    def __init__(self, compression: str = "zlib", threshold_bytes: int = 1024):
+        if compression == "zstd" and zstandard is None:
+            logger.warning("zstd job compression requested but 'zstandard' is not installed; using zlib")
+            compression = "zlib"
+        self.compression = compression
+        self.threshold_bytes = threshold_bytes
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == "zstd":
+            return ZSTD_TAG + zstandard.ZstdCompressor().compress(data)
+        return ZLIB_TAG + zlib.compress(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        if not _json_safe(obj):
+            return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        data = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if self.compression != "none" and len(data) > self.threshold_bytes:
+            compressed = self._compress(data)
+            if len(compressed) < len(data):
+                return compressed
+        return JSON_TAG + data
+
+    def loads(self, data: bytes) -> Any:
+        if not data:
+            raise ValueError("Cannot deserialize an empty job payload")
+        if data[0] == PICKLE_PROTOCOL_HEADER:
+            return pickle.loads(data)
+        tag, body = data[:1], data[1:]
+        if tag == ZLIB_TAG:
+            body = zlib.decompress(body)
+        elif tag == ZSTD_TAG:
+            if zstandard is None:
+                raise RuntimeError("Job payload is zstd-compressed but 'zstandard' is not installed")
+            body = zstandard.ZstdDecompressor().decompress(body)
+        elif tag != JSON_TAG:
+            raise ValueError(f"Unknown job payload encoding: {tag!r}")
+        return json.loads(body)
+
+
+_serializer: Optional[CompactSerializer] = None
+
+
+def get_serializer() -> Optional[CompactSerializer]:
+    """Returns the process-wide job serializer, or None for RQ's default pickle."""
+    global _serializer
+    config = Config.load()
+    if config.job_serializer == "pickle":
+        return None
+    if _serializer is None:
+        _serializer = CompactSerializer(
+            compression=config.job_compression,
+            threshold_bytes=config.job_compression_threshold_bytes,
+        )
+    return _serializer
+
+
+def _reset_serializer() -> None:
+    global _serializer
+    _serializer = None
+
+
+on_reload(_reset_serializer)
@@ -0,0 +1,161 @@
+"""
+Multi-Turn Conversation Sessions.
+
+This module keeps the history of a conversation in Redis, so a client doing
+character chat sends only its new message each turn instead of the whole
+conversation, and the worker assembles the provider's message list.
+
+Key Features:
+- Compact storage: one Redis list entry per message, a one-byte role code
+  followed by the message text (no JSON, no per-message metadata)
+- Optional per-session system prompt, sent first in every request
+- Stable prefix: messages are always assembled the same way (system prompt,
+  stored turns in order, new user message) and stored text is never
+  rewritten, so consecutive turns share a byte-identical prefix that the
+  provider's prompt cache can reuse
+- Bounded window with block eviction: when a session exceeds
+  session_max_messages, the oldest half is dropped in one step rather than
+  one message per turn. The prefix therefore changes only once every
+  session_max_messages / 2 turns instead of on every turn
+- Sessions expire session_ttl_seconds after their last write
+- Async reads and writes (redis.asyncio) for the MCP server
+
+A turn is appended only when its job completes, so a message submitted before
+the previous turn finished is answered without that turn's exchange.
+
+Redis Layout:
+- waifu:session:<id>:messages: List of "<role code><text>" entries
+- waifu:session:<id>:system: System prompt (string)
+
+Usage:
+    store = get_session_store()
+    messages = store.messages(session_id, prompt)
+    reply = predict_response(messages)
+    store.append_turn(session_id, prompt, reply)
+
+Dependencies:
+- redis: Session storage (sync and redis.asyncio)
+- config: Window size and TTL
+"""
+
+import logging
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.providers.base import Message
+from mcp_waifu_queue.settings import on_reload
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "waifu:session:"
+ROLE_CODES = {"user": "u", "assistant": "a"}
+ROLES = {code: role for role, code in ROLE_CODES.items()}
+
+
+def messages_key(session_id: str) -> str:
+    return f"{KEY_PREFIX}{session_id}:messages"
+
+
+def system_key(session_id: str) -> str:
+    return f"{KEY_PREFIX}{session_id}:system"
+
+
+def _encode(role: str, content: str) -> str:
+    return ROLE_CODES[role] + content
+
+
+def _decode(entry: bytes) -> Message:
+    text = entry.decode("utf-8")
+    return {"role": ROLES[text[:1]], "content": text[1:]}
+
+
+def _assemble(system: Optional[bytes], entries: list[bytes]) -> list[Message]:
+    messages = [{"role": "system", "content": system.decode("utf-8")}] if system else []
+    messages.extend(_decode(entry) for entry in entries)
+    return messages
+
+
+class SessionStore:
+    """Redis-backed conversation histories with a bounded, block-evicted window."""
+
+    def __init__(
+        self,
+        connection: redis.Redis,
+        ttl_seconds: int = 86400,
+        max_messages: int = 40,
+        async_connection: Optional[aioredis.Redis] = None,
+    ):
+        self.connection = connection
+        self.async_connection = async_connection
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        # Whole exchanges are kept so the window never starts with a reply.
+        self.keep_messages = max(2, max_messages // 4 * 2)
+
+    def history(self, session_id: str) -> list[Message]:
+        """Returns the stored conversation, system prompt first."""
+        with self.connection.pipeline(transaction=False) as pipe:
+            pipe.get(system_key(session_id))
+            pipe.lrange(messages_key(session_id), 0, -1)
+            system, entries = pipe.execute()
+        return _assemble(system, entries)
+
+    async def ahistory(self, session_id: str) -> list[Message]:
+        """Async history, using the store's redis.asyncio connection."""
+        async with self.async_connection.pipeline(transaction=False) as pipe:
+            pipe.get(system_key(session_id))
+            pipe.lrange(messages_key(session_id), 0, -1)
+            system, entries = await pipe.execute()
+        return _assemble(system, entries)
+
+    def messages(self, session_id: str, prompt: str) -> list[Message]:
+        """Returns the provider messages for a new user prompt in the session."""
+        return [*self.history(session_id), {"role": "user", "content": prompt}]
+
+    def append_turn(self, session_id: str, prompt: str, reply: str) -> None:
+        """Records a completed exchange, dropping the oldest half once the window is full."""
+        key = messages_key(session_id)
+        with self.connection.pipeline(transaction=False) as pipe:
+            pipe.rpush(key, _encode("user", prompt), _encode("assistant", reply))
+            pipe.expire(key, self.ttl_seconds)
+            pipe.expire(system_key(session_id), self.ttl_seconds)
+            length = pipe.execute()[0]
+        if length > self.max_messages:
+            logger.info(f"Session {session_id}: trimming history to the last {self.keep_messages} messages")
+            self.connection.ltrim(key, -self.keep_messages, -1)
+
+    async def aset_system(self, session_id: str, system_prompt: str) -> None:
+        """Sets the session's system prompt (the start of every request's prefix)."""
+        await self.async_connection.set(system_key(session_id), system_prompt, ex=self.ttl_seconds)
+
+    async def adelete(self, session_id: str) -> bool:
+        """Forgets a session; returns False if it did not exist."""
+        return bool(await self.async_connection.delete(messages_key(session_id), system_key(session_id)))
+
+
+_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    """Returns the process-wide session store."""
+    global _store
+    if _store is None:
+        config = Config.load()
+        _store = SessionStore(
+            redis.from_url(config.redis_url),
+            ttl_seconds=config.session_ttl_seconds,
+            max_messages=config.session_max_messages,
+            async_connection=aioredis.from_url(config.redis_url),
+        )
+    return _store
+
+
+def _reset_store() -> None:
+    global _store
+    _store = None
+
+
+on_reload(_reset_store)
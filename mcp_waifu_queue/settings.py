@@ -0,0 +1,139 @@
+"""
+Process-Level Settings and Credential Cache.
+
+This module keeps the small files read on every generation, the OpenRouter
+API key and model files in the user's home directory, in memory, so a job
+no longer costs filesystem reads. Rotation still works without a restart.
+
+Key Features:
+- read_file_value(): First line of a file, cached per path. The file is
+  re-read only when its modification time changes, and the mtime is checked
+  at most once per second per path
+- reload(): Drops the cached files and the cached Config (see Config.load)
+  and runs the registered reload hooks, which drop the clients built from
+  Config (provider router, retry policies, rate limiters, caches, admission,
+  sessions, serializer and the server's queues) so they are rebuilt on next
+  use. Settings read once at process start still need a restart: the
+  Redis URL of a running worker, the lanes it listens to, the worker mode
+  and concurrency, and the HTTP connection pool
+- install_reload_signal(): Runs reload() after SIGHUP, so
+  `kill -HUP <pid>` applies edited settings and credentials immediately.
+  The handler only wakes a reload thread: it interrupts the main thread
+  wherever it is, possibly inside read_file_value or Config.load, and must
+  not wait on their locks
+
+Usage:
+    key = read_file_value(Path.home() / ".api-openrouter")
+
+    on_reload(lambda: print("settings reloaded"))
+    install_reload_signal()
+
+Dependencies:
+- config: The cached Config to invalidate on reload
+"""
+
+import contextlib
+import logging
+import os
+import signal
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from mcp_waifu_queue.config import RECHECK_SECONDS, Config
+
+logger = logging.getLogger(__name__)
+
+
+class _FileEntry:
+    __slots__ = ("checked_at", "mtime", "value")
+
+    def __init__(self, value: Optional[str], mtime: Optional[float], checked_at: float):
+        self.value = value
+        self.mtime = mtime
+        self.checked_at = checked_at
+
+
+_files: dict[Path, _FileEntry] = {}
+_hooks: list[Callable[[], None]] = []
+_lock = threading.Lock()
+# Write end of the pipe that wakes the reload thread, once the SIGHUP handler is installed.
+_wakeup_fd: Optional[int] = None
+
+
+def _mtime(path: Path) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _read_single_line(path: Path) -> Optional[str]:
+    try:
+        if path.is_file():
+            val = path.read_text(encoding="utf-8").strip()
+            return val or None
+    except Exception as e:
+        logger.warning(f"Failed reading {path}: {e}")
+    return None
+
+
+def read_file_value(path: Path) -> Optional[str]:
+    """Returns the stripped contents of path (None if missing or empty), cached by mtime."""
+    now = time.monotonic()
+    with _lock:
+        entry = _files.get(path)
+        if entry is not None and now - entry.checked_at < RECHECK_SECONDS:
+            return entry.value
+    mtime = _mtime(path)
+    if entry is not None and mtime == entry.mtime:
+        entry.checked_at = now
+        return entry.value
+    value = _read_single_line(path) if mtime is not None else None
+    with _lock:
+        _files[path] = _FileEntry(value, mtime, now)
+    return value
+
+
+def on_reload(hook: Callable[[], None]) -> None:
+    """Registers a callback run by reload()."""
+    _hooks.append(hook)
+
+
+def reload() -> None:
+    """Drops cached settings and credentials and runs the reload hooks."""
+    with _lock:
+        _files.clear()
+    Config.invalidate()
+    for hook in list(_hooks):
+        try:
+            hook()
+        except Exception:
+            logger.exception("Settings reload hook failed")
+    logger.info("Settings and credentials reloaded")
+
+
+def _reload_on_wakeup(read_fd: int) -> None:
+    while True:
+        os.read(read_fd, 4096)  # Signals that arrived meanwhile are applied by one reload.
+        reload()
+
+
+def _wake_reload_thread(signum, frame) -> None:
+    # A full pipe means a reload is already pending.
+    with contextlib.suppress(BlockingIOError):
+        os.write(_wakeup_fd, b"\0")
+
+
+def install_reload_signal() -> bool:
+    """Reloads settings after SIGHUP. Returns False where that is not possible."""
+    global _wakeup_fd
+    if not hasattr(signal, "SIGHUP") or threading.current_thread() is not threading.main_thread():
+        return False
+    if _wakeup_fd is None:
+        read_fd, _wakeup_fd = os.pipe()
+        os.set_blocking(_wakeup_fd, False)
+        threading.Thread(target=_reload_on_wakeup, args=(read_fd,), name="settings-reload", daemon=True).start()
+    signal.signal(signal.SIGHUP, _wake_reload_thread)
+    return True
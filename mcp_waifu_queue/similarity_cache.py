@@ -0,0 +1,322 @@
+"""
+Near-Duplicate Response Cache.
+
+This module implements an optional cache that serves a stored completion for
+prompts that are nearly, not exactly, the same as one already answered:
+prompts differing in whitespace, casing, punctuation or a trailing
+timestamp, or in a few words. Workers consult it in front of
+predict_response, so a hit saves the provider call.
+
+Key Features:
+- normalize(): Unicode NFKC, case folding, a date or datetime ending the
+  prompt removed, punctuation and runs of whitespace collapsed to single
+  spaces. Operator and symbol characters (+-*/=<>% ...) are kept, so
+  "2+2" and "2*2" stay apart
+- Normalized fingerprints: prompts that normalize to the same text hit the
+  stored entry directly, without comparing signatures
+- MinHash signatures over 5-byte shingles of the normalized text (at most
+  MAX_SHINGLES of them), indexed by LSH: the signature is cut into bands and each band is a Redis
+  set of entry ids. Entries sharing a band are candidates, and a candidate
+  hits when its estimated Jaccard similarity reaches the threshold. The
+  signature computed by a lookup that missed is reused by the store that
+  follows it
+- Entries are partitioned by cache namespace and by generation params
+  (model, temperature, max tokens, stop), so a completion is only served
+  for the same settings and within the namespace that produced it
+- Per-namespace opt-in: only namespaces listed in
+  SIMILARITY_CACHE_NAMESPACES are looked up or stored
+- Entries and bands expire after a TTL; completions over the response
+  cache's entry size limit are not stored
+- Lookup counters kept in Redis per namespace (normalized and similar hits,
+  misses, stores), and mirrored in waifu_similarity_cache_lookups_total
+
+Redis Layout:
+- waifu:simcache:<namespace>:e:<sha256>: Hash of an entry (signature and
+  completion), addressed by the fingerprint of its normalized prompt
+- waifu:simcache:<namespace>:b:<params>:<band>:<hash>: Set of entry ids
+  sharing one LSH band
+- waifu:simcache:stats: Hash of <namespace>:<counter> counters
+
+Usage:
+    cache = get_similarity_cache()
+    if cache is not None and cache.enabled_for(namespace):
+        cached = cache.lookup(namespace, prompt, generation_params())
+        ...
+        cache.store(namespace, prompt, generation_params(), completion)
+
+Dependencies:
+- redis: Storage backend
+- config: Namespaces, threshold, LSH shape and TTL
+- cache: Fingerprints of generation inputs
+- metrics: Lookup counter
+"""
+
+import array
+import collections
+import hashlib
+import heapq
+import logging
+import random
+import re
+import threading
+import unicodedata
+import zlib
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from mcp_waifu_queue import metrics
+from mcp_waifu_queue.cache import fingerprint
+from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.settings import on_reload
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "waifu:simcache:"
+STATS_KEY = "waifu:simcache:stats"
+# Namespace of requests that do not name one.
+DEFAULT_NAMESPACE = "default"
+COUNTERS = ("normalized_hits", "similar_hits", "misses", "stores")
+
+SHINGLE_CHARS = 5
+# Longer prompts are signed over a consistent sample of their shingles (the
+# ones with the smallest hashes), which bounds the cost of a signature to
+# MAX_SHINGLES modular hashes per permutation.
+MAX_SHINGLES = 256
+# Signatures of recent missed lookups, kept for the store that follows them.
+SIGNATURE_MEMO_SIZE = 64
+_PRIME = (1 << 61) - 1
+_MASK = 0xFFFFFFFF
+
+# Only a full ISO date or datetime that ends the prompt (a request stamp) is
+# dropped; times and dates elsewhere ("John 3:16", "due 2024-05-01 or later")
+# are content.
+_TIMESTAMP = re.compile(
+    r"(?:^|\s)[\[(]?\d{4}-\d{2}-\d{2}"
+    r"(?:[t ]\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:z|[+-]\d{2}:?\d{2})?)?[\])]?\s*$"
+)
+# Apostrophes inside words are dropped ("what's" -> "whats"); other punctuation separates words.
+_APOSTROPHE = re.compile(r"(?<=\w)['\u2019](?=\w)")
+_PUNCTUATION = re.compile(r"[^\w\s+\-*/=<>%^&|~]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(prompt: str) -> str:
+    """Returns prompt without the differences the cache ignores."""
+    text = unicodedata.normalize("NFKC", prompt).casefold()
+    text = _TIMESTAMP.sub(" ", text)
+    text = _APOSTROPHE.sub("", text)
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _permutations(count: int) -> list[tuple[int, int]]:
+    # Fixed seed: every process must compute the same signature for a prompt.
+    rng = random.Random(0x5EED)
+    return [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(count)]
+
+
+def shingles(text: str) -> list[int]:
+    """Returns the distinct 32-bit hashes of the shingles of text's UTF-8 bytes."""
+    data = text.encode("utf-8")
+    if len(data) <= SHINGLE_CHARS:
+        return [zlib.crc32(data)]
+    hashes = set(map(zlib.crc32, [data[i:i + SHINGLE_CHARS] for i in range(len(data) - SHINGLE_CHARS + 1)]))
+    if len(hashes) > MAX_SHINGLES:
+        return heapq.nsmallest(MAX_SHINGLES, hashes)
+    return list(hashes)
+
+
+class MinHasher:
+    """Computes fixed-length MinHash signatures, cut into LSH bands."""
+
+    def __init__(self, bands: int, rows: int):
+        self.bands = bands
+        self.rows = rows
+        self._permutations = _permutations(bands * rows)
+
+    def signature(self, text: str) -> array.array:
+        hashes = shingles(text)
+        return array.array("I", [min([(a * h + b) % _PRIME for h in hashes]) & _MASK for a, b in self._permutations])
+
+    def band_hashes(self, signature: array.array) -> list[str]:
+        data = signature.tobytes()
+        width = self.rows * signature.itemsize
+        return [
+            hashlib.blake2b(data[i * width:(i + 1) * width], digest_size=8).hexdigest() for i in range(self.bands)
+        ]
+
+    @staticmethod
+    def similarity(a: array.array, b: array.array) -> float:
+        """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+        if len(a) != len(b):
+            return 0.0
+        return sum(x == y for x, y in zip(a, b, strict=True)) / len(a)
+
+
+class SimilarityCache:
+    """Redis-backed MinHash/LSH cache of completions for near-duplicate prompts."""
+
+    def __init__(
+        self,
+        connection: redis.Redis,
+        namespaces: list[str],
+        threshold: float = 0.9,
+        bands: int = 16,
+        rows: int = 8,
+        ttl_seconds: int = 3600,
+        max_candidates: int = 32,
+        max_entry_bytes: int = 65536,
+        async_connection: Optional[aioredis.Redis] = None,
+    ):
+        self.connection = connection
+        self.async_connection = async_connection
+        self.namespaces = set(namespaces)
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_candidates = max_candidates
+        self.max_entry_bytes = max_entry_bytes
+        self.hasher = MinHasher(bands, rows)
+        self._signatures: collections.OrderedDict[bytes, array.array] = collections.OrderedDict()
+        self._signatures_lock = threading.Lock()
+
+    def enabled_for(self, namespace: Optional[str]) -> bool:
+        """Whether namespace (DEFAULT_NAMESPACE when None) opted in to the cache."""
+        return (namespace or DEFAULT_NAMESPACE) in self.namespaces
+
+    @staticmethod
+    def _entry_key(namespace: str, entry_id: str) -> str:
+        return f"{KEY_PREFIX}{namespace}:e:{entry_id}"
+
+    def _band_keys(self, namespace: str, params: dict, signature: array.array) -> list[str]:
+        scope = fingerprint("", **params)[:16]
+        return [
+            f"{KEY_PREFIX}{namespace}:b:{scope}:{band}:{digest}"
+            for band, digest in enumerate(self.hasher.band_hashes(signature))
+        ]
+
+    @staticmethod
+    def _text_key(normalized: str) -> bytes:
+        return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+
+    def _remember_signature(self, normalized: str, signature: array.array) -> None:
+        with self._signatures_lock:
+            self._signatures[self._text_key(normalized)] = signature
+            while len(self._signatures) > SIGNATURE_MEMO_SIZE:
+                self._signatures.popitem(last=False)
+
+    def _signature(self, normalized: str) -> array.array:
+        """The signature remembered by a missed lookup of normalized, else a new one."""
+        with self._signatures_lock:
+            signature = self._signatures.pop(self._text_key(normalized), None)
+        return signature if signature is not None else self.hasher.signature(normalized)
+
+    def _count_lookup(self, namespace: str, counter: str) -> None:
+        result = "miss" if counter == "misses" else counter.removesuffix("_hits")
+        metrics.SIMILARITY_CACHE_LOOKUPS_TOTAL.labels(namespace=namespace, result=result).inc()
+        self.connection.hincrby(STATS_KEY, f"{namespace}:{counter}", 1)
+
+    def lookup(self, namespace: Optional[str], prompt: str, params: dict) -> Optional[str]:
+        """Returns the stored completion of the most similar prompt over the threshold, if any."""
+        namespace = namespace or DEFAULT_NAMESPACE
+        normalized = normalize(prompt)
+        entry_key = self._entry_key(namespace, fingerprint(normalized, **params))
+        signature = self.hasher.signature(normalized)
+        with self.connection.pipeline(transaction=False) as pipe:
+            pipe.hget(entry_key, "completion")
+            for band_key in self._band_keys(namespace, params, signature):
+                pipe.srandmember(band_key, self.max_candidates)
+            exact, *bands = pipe.execute()
+        if exact is not None:
+            self._count_lookup(namespace, "normalized_hits")
+            return exact.decode("utf-8")
+        candidates = list(dict.fromkeys(member for members in bands for member in members))[:self.max_candidates]
+        best, best_score = None, self.threshold
+        if candidates:
+            with self.connection.pipeline(transaction=False) as pipe:
+                for entry_id in candidates:
+                    pipe.hmget(self._entry_key(namespace, entry_id.decode()), "signature", "completion")
+                for stored, completion in pipe.execute():
+                    if stored is None or completion is None:
+                        continue  # Expired since it was indexed.
+                    score = self.hasher.similarity(signature, array.array("I", stored))
+                    if score >= best_score:
+                        best, best_score = completion, score
+        if best is None:
+            self._remember_signature(normalized, signature)
+            self._count_lookup(namespace, "misses")
+            return None
+        logger.info(f"Similarity cache hit in namespace '{namespace}' (estimated similarity {best_score:.2f})")
+        self._count_lookup(namespace, "similar_hits")
+        return best.decode("utf-8")
+
+    def store(self, namespace: Optional[str], prompt: str, params: dict, completion: str) -> bool:
+        """Indexes prompt's completion; returns False when it is too large to store."""
+        namespace = namespace or DEFAULT_NAMESPACE
+        data = completion.encode("utf-8")
+        if len(data) > self.max_entry_bytes:
+            logger.debug(f"Not indexing {len(data)} byte response (limit {self.max_entry_bytes})")
+            return False
+        normalized = normalize(prompt)
+        entry_id = fingerprint(normalized, **params)
+        entry_key = self._entry_key(namespace, entry_id)
+        signature = self._signature(normalized)
+        with self.connection.pipeline(transaction=False) as pipe:
+            pipe.hset(entry_key, mapping={"signature": signature.tobytes(), "completion": data})
+            pipe.expire(entry_key, self.ttl_seconds)
+            for band_key in self._band_keys(namespace, params, signature):
+                pipe.sadd(band_key, entry_id)
+                pipe.expire(band_key, self.ttl_seconds)
+            pipe.hincrby(STATS_KEY, f"{namespace}:stores", 1)
+            pipe.execute()
+        return True
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """Returns the shared counters of every namespace, with the provider calls saved."""
+        return self._format_stats(self.connection.hgetall(STATS_KEY))
+
+    async def astats(self) -> dict[str, dict[str, int]]:
+        """Async stats, using the cache's redis.asyncio connection."""
+        return self._format_stats(await self.async_connection.hgetall(STATS_KEY))
+
+    def _format_stats(self, raw: dict) -> dict[str, dict[str, int]]:
+        stats = {namespace: dict.fromkeys(COUNTERS, 0) for namespace in sorted(self.namespaces)}
+        for field, value in raw.items():
+            namespace, counter = field.decode().rsplit(":", 1)
+            stats.setdefault(namespace, dict.fromkeys(COUNTERS, 0))[counter] = int(value)
+        for counters in stats.values():
+            counters["provider_calls_saved"] = counters["normalized_hits"] + counters["similar_hits"]
+        return stats
+
+
+_cache: Optional[SimilarityCache] = None
+
+
+def get_similarity_cache() -> Optional[SimilarityCache]:
+    """Returns the process-wide cache, or None when no namespace opted in."""
+    global _cache
+    config = Config.load()
+    if not config.similarity_cache_namespaces:
+        return None
+    if _cache is None:
+        _cache = SimilarityCache(
+            redis.from_url(config.redis_url),
+            config.similarity_cache_namespaces,
+            threshold=config.similarity_cache_threshold,
+            bands=config.similarity_cache_bands,
+            rows=config.similarity_cache_rows,
+            ttl_seconds=config.similarity_cache_ttl_seconds,
+            max_candidates=config.similarity_cache_max_candidates,
+            max_entry_bytes=config.response_cache_max_entry_bytes,
+            async_connection=aioredis.from_url(config.redis_url),
+        )
+    return _cache
+
+
+def _reset_cache() -> None:
+    global _cache
+    _cache = None
+
+
+on_reload(_reset_cache)
@@ -0,0 +1,144 @@
+"""
+Streaming Token Delivery.
+
+This module stores partial completions in Redis streams so clients can read
+text while a generation is still running, instead of waiting for the whole
+completion and then polling job://{job_id}.
+
+Key Features:
+- One Redis stream per job: waifu:stream:<job_id>
+- Worker side: StreamWriter appends each content delta as it arrives from the
+  provider and a final entry marking completion or failure
+- Client side: read_stream() (or aread_stream() on redis.asyncio) returns the
+  text after a given offset, optionally blocking briefly for new chunks
+- Stream keys expire after a configurable TTL
+
+Offsets:
+Offsets are Redis stream entry ids. "0" reads from the beginning; each read
+returns the offset to pass on the next call.
+
+Usage:
+    writer = open_writer(job_id)  # None when streaming is disabled
+    predict_response(prompt, on_chunk=writer.append)
+    writer.finish("completed")
+
+    text, offset, done = read_stream(conn, job_id, "0", wait_ms=1000)
+
+Dependencies:
+- redis: Stream storage (XADD/XREAD)
+- config: Streaming enablement and TTL (open_writer)
+"""
+
+import logging
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from mcp_waifu_queue.config import Config
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY_PREFIX = "waifu:stream:"
+
+
+def stream_key(job_id: str) -> str:
+    """Returns the Redis stream key holding chunks for a job."""
+    return STREAM_KEY_PREFIX + job_id
+
+
+class StreamWriter:
+    """Appends the chunks of one job's completion to its Redis stream."""
+
+    def __init__(self, connection: redis.Redis, job_id: str, ttl_seconds: int = 3600):
+        self.connection = connection
+        self.key = stream_key(job_id)
+        self.ttl_seconds = ttl_seconds
+        self._expiry_set = False
+
+    def append(self, text: str) -> None:
+        """Appends one content delta."""
+        with self.connection.pipeline(transaction=False) as pipe:
+            pipe.xadd(self.key, {"text": text})
+            if not self._expiry_set:
+                pipe.expire(self.key, self.ttl_seconds)
+            pipe.execute()
+        self._expiry_set = True
+
+    def finish(self, status: str) -> None:
+        """Appends the terminal entry; status is 'completed' or 'failed'."""
+        with self.connection.pipeline(transaction=False) as pipe:
+            pipe.xadd(self.key, {"done": status})
+            pipe.expire(self.key, self.ttl_seconds)
+            pipe.execute()
+
+
+def _collect(entries: list, offset: str) -> tuple[str, str, Optional[str]]:
+    parts = []
+    done = None
+    next_offset = offset
+    for entry_id, fields in entries:
+        next_offset = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+        if b"text" in fields:
+            parts.append(fields[b"text"].decode("utf-8"))
+        if b"done" in fields:
+            done = fields[b"done"].decode()
+    return "".join(parts), next_offset, done
+
+
+def _done_marker(last: list) -> Optional[str]:
+    if last and b"done" in last[0][1]:
+        return last[0][1][b"done"].decode()
+    return None
+
+
+def read_stream(
+    connection: redis.Redis, job_id: str, offset: str = "0", wait_ms: int = 0
+) -> tuple[str, str, Optional[str]]:
+    """Reads the text appended after offset.
+
+    Returns (text, next_offset, done_status). done_status is None while the
+    job is still producing output. When wait_ms > 0 and nothing new is
+    available, blocks up to wait_ms for the next chunk.
+    """
+    key = stream_key(job_id)
+    if wait_ms > 0:
+        response = connection.xread({key: offset}, block=wait_ms)
+        entries = response[0][1] if response else []
+    else:
+        entries = connection.xrange(key, min=f"({offset}" if offset != "0" else "-")
+    text, next_offset, done = _collect(entries, offset)
+    if not entries and offset != "0":
+        # Reading past the end of a finished stream still reports it as done.
+        done = _done_marker(connection.xrevrange(key, count=1))
+    return text, next_offset, done
+
+
+async def aread_stream(
+    connection: aioredis.Redis, job_id: str, offset: str = "0", wait_ms: int = 0
+) -> tuple[str, str, Optional[str]]:
+    """Async read_stream over a redis.asyncio connection."""
+    key = stream_key(job_id)
+    if wait_ms > 0:
+        response = await connection.xread({key: offset}, block=wait_ms)
+        entries = response[0][1] if response else []
+    else:
+        entries = await connection.xrange(key, min=f"({offset}" if offset != "0" else "-")
+    text, next_offset, done = _collect(entries, offset)
+    if not entries and offset != "0":
+        done = _done_marker(await connection.xrevrange(key, count=1))
+    return text, next_offset, done
+
+
+_connection: Optional[redis.Redis] = None
+
+
+def open_writer(job_id: Optional[str]) -> Optional[StreamWriter]:
+    """Returns a StreamWriter for job_id, or None when streaming is disabled."""
+    global _connection
+    config = Config.load()
+    if not config.streaming_enabled or job_id is None:
+        return None
+    if _connection is None:
+        _connection = redis.from_url(config.redis_url)
+    return StreamWriter(_connection, job_id, ttl_seconds=config.stream_ttl_seconds)
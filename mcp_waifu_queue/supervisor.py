@@ -0,0 +1,310 @@
+"""
+Worker Pool Supervisor.
+
+This module runs a pool of worker processes and sizes it to the backlog, so
+capacity follows demand instead of being fixed at one worker.
+
+Key Features:
+- Starts each worker as `python -m mcp_waifu_queue.worker`, so WORKER_MODE
+  selects RQ or asyncio workers as usual
+- Scales between supervisor_min_workers and supervisor_max_workers from three
+  signals read from Redis on every tick: queue depth across all lanes, the
+  age of the oldest queued job, and the queue-wait target
+  (supervisor_target_queue_wait_seconds)
+- Scale-up is immediate. Scale-down removes one worker at a time, only after
+  the backlog has stayed low for supervisor_scale_down_delay_seconds
+- Graceful drain: a worker being removed gets SIGTERM (RQ warm shutdown, or the
+  async worker's drain) and is killed only after
+  supervisor_drain_timeout_seconds
+- Crashed workers are replaced, with exponential backoff when they keep
+  crashing right after start
+- SIGHUP is forwarded to every worker; SIGINT/SIGTERM drain the whole pool
+  and exit
+- With WORKER_METRICS_PORT set, the supervisor serves its own pool metrics
+  on that port and worker slot n serves on port + n
+
+Scaling Policy:
+The pool wants enough workers for the backlog, ceil(depth / backlog per
+worker), where a worker's backlog is its concurrency (1 for RQ workers,
+ASYNC_WORKER_CONCURRENCY for async workers) unless
+supervisor_backlog_per_worker is set. When the oldest job has waited longer
+than the target, the pool also grows in proportion to how far the target is
+exceeded.
+
+Usage:
+    python -m mcp_waifu_queue.supervisor
+
+Dependencies:
+- redis, rq: Queue depth and oldest-job age
+- metrics: Pool size gauges
+- config: Pool bounds, queue-wait target and timing
+"""
+
+import logging
+import math
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Optional
+
+import redis
+from rq import Queue
+from rq.job import Job
+from rq.utils import now, utcparse
+
+from mcp_waifu_queue import metrics
+from mcp_waifu_queue.config import Config
+
+logger = logging.getLogger(__name__)
+
+WORKER_COMMAND = [sys.executable, "-m", "mcp_waifu_queue.worker"]
+# A worker that exits sooner than this after start counts as a crash loop.
+MIN_HEALTHY_SECONDS = 30.0
+MAX_RESTART_BACKOFF_SECONDS = 60.0
+
+
+class Autoscaler:
+    """Decides the pool size from queue depth, oldest-job age and the queue-wait target."""
+
+    def __init__(
+        self,
+        min_workers: int,
+        max_workers: int,
+        target_wait_seconds: float,
+        backlog_per_worker: int,
+        scale_down_delay_seconds: float,
+    ):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.target_wait_seconds = target_wait_seconds
+        self.backlog_per_worker = max(1, backlog_per_worker)
+        self.scale_down_delay_seconds = scale_down_delay_seconds
+        self._low_since: Optional[float] = None
+
+    def desired(self, current: int, depth: int, oldest_age: float, at: float) -> int:
+        """Returns the number of workers to run, given the current pool and backlog."""
+        wanted = math.ceil(depth / self.backlog_per_worker)
+        if oldest_age > self.target_wait_seconds:
+            wanted = max(wanted, math.ceil(max(current, 1) * oldest_age / self.target_wait_seconds))
+        wanted = min(self.max_workers, max(self.min_workers, wanted))
+        if wanted >= current:
+            self._low_since = None
+            return wanted
+        # Queue waits near the target mean the pool is barely keeping up.
+        if oldest_age > self.target_wait_seconds / 2:
+            self._low_since = None
+            return current
+        if self._low_since is None:
+            self._low_since = at
+        if at - self._low_since < self.scale_down_delay_seconds:
+            return current
+        self._low_since = at
+        return current - 1
+
+
+class WorkerProcess:
+    """A worker started by the supervisor."""
+
+    def __init__(self, slot: int, process: subprocess.Popen):
+        self.slot = slot
+        self.process = process
+        self.started_at = time.monotonic()
+        self.draining_since: Optional[float] = None
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+
+class Supervisor:
+    """Keeps a pool of worker processes sized to the queue backlog."""
+
+    def __init__(
+        self,
+        queues: list[Queue],
+        connection: redis.Redis,
+        autoscaler: Autoscaler,
+        interval_seconds: float = 2.0,
+        drain_timeout_seconds: float = 300.0,
+        metrics_port: int = 0,
+        command: Optional[list[str]] = None,
+    ):
+        self.queues = queues
+        self.connection = connection
+        self.autoscaler = autoscaler
+        self.interval_seconds = interval_seconds
+        self.drain_timeout_seconds = drain_timeout_seconds
+        self.metrics_port = metrics_port
+        self.command = command or WORKER_COMMAND
+        self.workers: list[WorkerProcess] = []
+        self._stop = False
+        self._restart_backoff = 0.0
+        self._next_start_at = 0.0
+
+    def active(self) -> list[WorkerProcess]:
+        return [worker for worker in self.workers if worker.draining_since is None]
+
+    def sample(self) -> tuple[int, float]:
+        """Returns (jobs queued across all lanes, seconds the oldest of them has waited)."""
+        with self.connection.pipeline(transaction=False) as pipeline:
+            for queue in self.queues:
+                pipeline.llen(queue.key)
+                pipeline.lindex(queue.key, 0)
+            raw = pipeline.execute()
+        depth = sum(raw[0::2])
+        heads = [job_id.decode() for job_id in raw[1::2] if job_id is not None]
+        if not heads:
+            return depth, 0.0
+        with self.connection.pipeline(transaction=False) as pipeline:
+            for job_id in heads:
+                pipeline.hget(Job.key_for(job_id), "enqueued_at")
+            stamps = pipeline.execute()
+        current = now()
+        ages = [(current - utcparse(stamp.decode())).total_seconds() for stamp in stamps if stamp]
+        return depth, max(ages, default=0.0)
+
+    def _env(self, slot: int) -> dict:
+        env = dict(os.environ)
+        if self.metrics_port:
+            env["WORKER_METRICS_PORT"] = str(self.metrics_port + slot)
+        return env
+
+    def _start(self) -> None:
+        taken = {worker.slot for worker in self.workers}
+        slot = next(n for n in range(1, len(taken) + 2) if n not in taken)
+        process = subprocess.Popen(self.command, env=self._env(slot))
+        self.workers.append(WorkerProcess(slot, process))
+        logger.info(f"Started worker {process.pid} in slot {slot}")
+
+    def _drain(self, worker: WorkerProcess) -> None:
+        worker.draining_since = time.monotonic()
+        logger.info(f"Draining worker {worker.pid}")
+        worker.process.send_signal(signal.SIGTERM)
+
+    def reap(self) -> None:
+        """Forgets exited workers; unexpected exits schedule a (backed-off) replacement."""
+        at = time.monotonic()
+        for worker in list(self.workers):
+            code = worker.process.poll()
+            if code is None:
+                if worker.draining_since is not None and at - worker.draining_since > self.drain_timeout_seconds:
+                    logger.warning(f"Worker {worker.pid} did not drain in {self.drain_timeout_seconds}s; killing it")
+                    worker.process.kill()
+                continue
+            self.workers.remove(worker)
+            if worker.draining_since is not None:
+                logger.info(f"Worker {worker.pid} drained (exit code {code})")
+                continue
+            logger.warning(f"Worker {worker.pid} exited unexpectedly with code {code}; replacing it")
+            if at - worker.started_at < MIN_HEALTHY_SECONDS:
+                self._restart_backoff = min(MAX_RESTART_BACKOFF_SECONDS, max(1.0, self._restart_backoff * 2))
+                self._next_start_at = at + self._restart_backoff
+                logger.warning(f"Worker crashed soon after start; next start in {self._restart_backoff:.0f}s")
+            else:
+                self._restart_backoff = 0.0
+
+    def scale(self) -> None:
+        """Starts or drains workers to match the autoscaler's target."""
+        active = self.active()
+        try:
+            depth, oldest_age = self.sample()
+        except redis.RedisError as e:
+            # Without a reading, keep the pool as it is but still honour its bounds.
+            logger.warning(f"Could not read queue depth: {e}")
+            depth, oldest_age = 0, 0.0
+            target = min(self.autoscaler.max_workers, max(self.autoscaler.min_workers, len(active)))
+        else:
+            target = self.autoscaler.desired(len(active), depth, oldest_age, time.monotonic())
+        reading = f"queued={depth}, oldest wait={oldest_age:.1f}s"
+        if target > len(active) and time.monotonic() >= self._next_start_at:
+            logger.info(f"Scaling workers up {len(active)} -> {target} ({reading})")
+            for _ in range(target - len(active)):
+                self._start()
+        elif target < len(active):
+            logger.info(f"Scaling workers down {len(active)} -> {target} ({reading})")
+            # Newest first: older workers have warmer connections.
+            for worker in sorted(active, key=lambda w: w.started_at, reverse=True)[: len(active) - target]:
+                self._drain(worker)
+        self._report()
+
+    def _report(self) -> None:
+        active = len(self.active())
+        metrics.SUPERVISOR_WORKERS.labels(state="active").set(active)
+        metrics.SUPERVISOR_WORKERS.labels(state="draining").set(len(self.workers) - active)
+
+    def request_stop(self) -> None:
+        if not self._stop:
+            logger.info("Supervisor shutdown requested")
+            self._stop = True
+
+    def _forward(self, signum: int) -> None:
+        for worker in self.workers:
+            worker.process.send_signal(signum)
+
+    def _install_signal_handlers(self) -> None:
+        signal.signal(signal.SIGINT, lambda signum, frame: self.request_stop())
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.request_stop())
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda signum, frame: self._forward(signal.SIGHUP))
+
+    def shutdown(self) -> None:
+        """Drains every worker, killing those still running after the drain timeout."""
+        for worker in self.active():
+            self._drain(worker)
+        while self.workers:
+            self.reap()
+            time.sleep(0.2)
+        self._report()
+
+    def run(self) -> None:
+        """Supervises the pool until SIGINT/SIGTERM, then drains it."""
+        self._install_signal_handlers()
+        if self.metrics_port:
+            metrics.start_metrics_server(self.metrics_port)
+        logger.info(
+            f"Supervising {self.autoscaler.min_workers}-{self.autoscaler.max_workers} workers "
+            f"on {', '.join(queue.name for queue in self.queues)}"
+        )
+        try:
+            while not self._stop:
+                self.reap()
+                self.scale()
+                deadline = time.monotonic() + self.interval_seconds
+                while not self._stop and time.monotonic() < deadline:
+                    time.sleep(min(0.2, self.interval_seconds))
+        finally:
+            self.shutdown()
+
+
+def backlog_per_worker(config: Config) -> int:
+    """Queued jobs one worker is expected to absorb."""
+    if config.supervisor_backlog_per_worker:
+        return config.supervisor_backlog_per_worker
+    return config.async_worker_concurrency if config.worker_mode == "async" else 1
+
+
+def build(config: Config) -> Supervisor:
+    """Builds a Supervisor for every configured lane from config."""
+    conn = redis.from_url(config.redis_url)
+    autoscaler = Autoscaler(
+        min_workers=config.supervisor_min_workers,
+        max_workers=config.supervisor_max_workers,
+        target_wait_seconds=config.supervisor_target_queue_wait_seconds,
+        backlog_per_worker=backlog_per_worker(config),
+        scale_down_delay_seconds=config.supervisor_scale_down_delay_seconds,
+    )
+    return Supervisor(
+        [Queue(name, connection=conn) for name in config.lanes],
+        connection=conn,
+        autoscaler=autoscaler,
+        interval_seconds=config.supervisor_interval_seconds,
+        drain_timeout_seconds=config.supervisor_drain_timeout_seconds,
+        metrics_port=config.worker_metrics_port,
+    )
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    build(Config.load()).run()
@@ -9,56 +9,807 @@ Key Features:
 - Job enqueuing for text generation requests
 - Job status tracking (queued, processing, completed, failed, unknown)
 - Result retrieval from completed jobs
+- Optional response cache lookup before enqueueing: a hit is recorded as an
+  already-completed job, so no worker is involved
+- Optional single-flight coalescing: while a job for the same prompt
+  fingerprint is queued or running, identical submissions receive its job id
+- Batch enqueueing of many prompts in a single Redis pipeline, tracked under a
+  batch id for aggregate progress reporting
+- Priority lanes: each configured lane is its own RQ queue, and every enqueue
+  function takes an optional lane (the configured default lane otherwise)
+- Compact job storage: payloads and results are written by the compact JSON
+  serializer (serializer.py) instead of pickle, and job descriptions carry
+  only a prompt prefix rather than a second copy of the prompt
+- Per-request result retention: every enqueue function takes an optional
+  result_ttl, capped by Config.result_ttl_max_seconds
+- Optional token-budget admission control (admission.py): prompts that reach
+  a worker reserve their estimated tokens under the caller's client_id
+  before they are enqueued, and AdmissionRejectedError is raised when the global
+  or per-client budget is full. Cache hits are not charged, and a prompt
+  coalesced onto an in-flight job gives its reservation straight back
+- Session turns: add_to_queue/aadd_to_queue take an optional session_id,
+  passed to the worker, which sends the prompt after the session's history
+  (sessions.py). Session turns skip the response cache and coalescing, since
+  their completion depends on the history
 - Integration with Redis for persistent job storage
-- Connection management using configuration settings
+- Per-request generation params: add_to_queue/aadd_to_queue take an optional
+  params dict (model, max_tokens, temperature, stop), already checked
+  against the server's caps by the caller. They travel with the job to the
+  worker, are part of the cache and coalescing fingerprint, and a request's
+  max_tokens replaces max_new_tokens in its admission cost
+- Near-duplicate cache namespaces: every enqueue function takes an optional
+  cache_namespace, passed to the worker, which consults the near-duplicate
+  cache (similarity_cache.py) of that namespace before calling the provider
+- Lazy connection management: the Redis clients and RQ queues are created
+  on first use (get_connection, get_async_connection, get_queues; also
+  readable as the conn, aconn, serializer, queues and q attributes), so
+  importing the module is cheap and does not need Redis to be up. Jobs name
+  their function (utils.call_predict_response) as a string, so the provider
+  stack is only imported by workers
 
 Functions:
 - add_to_queue(): Enqueues a prompt for background processing
-- get_job_status_from_queue(): Retrieves job status and results
+- add_batch_to_queue(): Enqueues many prompts in one round trip
+- get_job_status_from_queue(): Retrieves job status and result in one round trip
+- get_job_status_many_from_queue(): Status and result of many jobs in one pipeline
+- get_job_statuses_from_queue(): Status names for many jobs in one pipeline
+- get_batch_status_from_queue(): Retrieves per-job statuses for a batch
+- get_job_detail_from_queue(): Status and result plus lane, worker, retries,
+  stage timestamps (timing.py) and profile path of one job, in one round trip
+- read_job_stream(): Reads partial text of a streaming job from an offset
+- a*(): Async equivalents of the above for the MCP server's event loop
+
+Async API:
+The a-prefixed functions use a shared redis.asyncio connection pool (aconn)
+so MCP handlers never block the event loop on Redis. Jobs are still built by
+RQ: its enqueue commands are recorded on an unexecuted pipeline and replayed
+on an async pipeline, so the stored job format is exactly what RQ workers read.
 
 Dependencies:
-- redis: Redis client for connection management
+- redis: Redis client for connection management (sync and redis.asyncio)
 - rq: Redis Queue for job management
 - logging: For operation logging
-- config: For Redis URL configuration
-- utils: For the actual prediction function
+- config: For Redis URL configuration, read when used so settings reloads apply
+- utils: The job function, referenced by name and imported only by workers
+- cache: For the optional response cache
+- lanes: For lane validation
+- serializer: For the compact job encoding
+- admission: For token-budget admission control
+- timing: For the stage timestamps stored on jobs
 
-The queue uses a TTL (Time To Live) of 3600 seconds (1 hour) for job results
-to prevent indefinite storage of generated text.
+Job results are kept for Config.result_ttl_seconds (default 3600 seconds)
+unless a request asks for a different retention, to prevent indefinite
+storage of generated text.
 """
 
 import logging
-import requests
+import uuid
+from typing import Optional
+
 import redis
+import redis.asyncio as aioredis
 from rq import Queue
-from rq.job import Job
+from rq.exceptions import NoSuchJobError
+from rq.job import Job, JobStatus
+from rq.results import Result
+from rq.utils import now
 
+from mcp_waifu_queue import timing
+from mcp_waifu_queue.admission import estimate_cost, get_admission_controller
+from mcp_waifu_queue.cache import KEY_PREFIX, fingerprint, get_response_cache
 from mcp_waifu_queue.config import Config
-from mcp_waifu_queue.utils import call_predict_response
-
-config = Config.load()
+from mcp_waifu_queue.lanes import resolve_lane
+from mcp_waifu_queue.respond import generation_params
+from mcp_waifu_queue.serializer import get_serializer
+from mcp_waifu_queue.settings import on_reload
+from mcp_waifu_queue.streaming import aread_stream, read_stream, stream_key
 
 logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Job function, by name so enqueueing does not import the provider stack.
+PREDICT_FUNC = "mcp_waifu_queue.utils.call_predict_response"
+
+# Redis clients and RQ queues, created on first use so importing this module
+# neither connects to Redis nor fails when it is down.
+_state: Optional[dict] = None
+
+
+def _connections() -> dict:
+    global _state
+    if _state is None:
+        config = Config.load()
+        connection = redis.from_url(config.redis_url)
+        job_serializer = get_serializer()
+        lane_queues = {
+            lane: Queue(lane, connection=connection, serializer=job_serializer) for lane in config.lanes
+        }
+        _state = {
+            "conn": connection,
+            "aconn": aioredis.from_url(config.redis_url),
+            "serializer": job_serializer,
+            "queues": lane_queues,
+            "q": lane_queues[config.default_lane],
+        }
+    return _state
+
+
+def _reset_connections() -> None:
+    # Rebuilt on next use with the reloaded Redis URL, lanes and job encoding.
+    global _state
+    _state = None
+
+
+on_reload(_reset_connections)
+
+
+def get_connection() -> redis.Redis:
+    """Returns the shared Redis client."""
+    return _connections()["conn"]
+
+
+def get_async_connection() -> aioredis.Redis:
+    """Returns the shared redis.asyncio client."""
+    return _connections()["aconn"]
+
+
+def get_queues() -> dict[str, Queue]:
+    """Returns the RQ queue of every lane, by lane name."""
+    return _connections()["queues"]
+
+
+def __getattr__(name: str):
+    # conn, aconn, serializer, queues and q remain readable as module attributes.
+    if name in ("conn", "aconn", "serializer", "queues", "q"):
+        return _connections()[name]
+    # So is config, always the current one.
+    if name == "config":
+        return Config.load()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Characters of the prompt kept in a job's description (shown in RQ logs).
+DESCRIPTION_PROMPT_CHARS = 50
+INFLIGHT_KEY_PREFIX = "waifu:inflight:"
+# Admission budget of requests that do not identify their client.
+DEFAULT_CLIENT_ID = "default"
+BATCH_KEY_PREFIX = "waifu:batch:"
+PENDING_STATUSES = {
+    JobStatus.QUEUED.value,
+    JobStatus.STARTED.value,
+    JobStatus.DEFERRED.value,
+    JobStatus.SCHEDULED.value,
+}
+
+
+def _queue_for(lane: Optional[str]) -> Queue:
+    """Returns the queue of a lane; None selects the default lane."""
+    return get_queues()[resolve_lane(lane, Config.load())]
+
+
+def _result_ttl(requested: Optional[int]) -> int:
+    """Result retention for a request: its own choice capped by the server's maximum."""
+    config = Config.load()
+    return min(requested or config.result_ttl_seconds, config.result_ttl_max_seconds)
+
+
+def _description(prompt: str) -> str:
+    # RQ's default description repeats every argument, i.e. the whole prompt.
+    head = prompt[:DESCRIPTION_PROMPT_CHARS]
+    suffix = f"... ({len(prompt)} chars)" if len(prompt) > DESCRIPTION_PROMPT_CHARS else ""
+    return f"call_predict_response({head!r}{suffix})"
+
+
+def _job_data(
+    prompt: str,
+    result_ttl: int,
+    job_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    params: Optional[dict] = None,
+    cache_namespace: Optional[str] = None,
+):
+    kwargs = {}
+    if session_id:
+        kwargs["session_id"] = session_id
+    if params:
+        kwargs["params"] = params
+    if cache_namespace:
+        kwargs["cache_namespace"] = cache_namespace
+    return Queue.prepare_data(
+        PREDICT_FUNC,
+        args=(prompt,),
+        kwargs=kwargs or None,
+        result_ttl=result_ttl,
+        description=_description(prompt),
+        job_id=job_id,
+    )
+
+
+def _new_job_ids(count: int) -> list[str]:
+    # Chosen before enqueueing so admission can reserve budget under the final ids.
+    return [uuid.uuid4().hex for _ in range(count)]
+
+
+def _reservations(
+    prompts: list[str], job_ids: list[str], max_new_tokens: Optional[int] = None
+) -> list[tuple[str, int]]:
+    max_new_tokens = max_new_tokens or Config.load().max_new_tokens
+    return [(job_id, estimate_cost(prompt, max_new_tokens)) for prompt, job_id in zip(prompts, job_ids, strict=True)]
+
+
+def _admit(client_id: Optional[str], prompts: list[str], max_new_tokens: Optional[int] = None) -> list[str]:
+    """Reserves admission budget for prompts; returns the job ids to enqueue them under."""
+    job_ids = _new_job_ids(len(prompts))
+    controller = get_admission_controller()
+    if controller is not None:
+        controller.admit(client_id or DEFAULT_CLIENT_ID, _reservations(prompts, job_ids, max_new_tokens))
+    return job_ids
+
+
+def _release(*job_ids: str) -> None:
+    controller = get_admission_controller()
+    if controller is not None:
+        controller.release(*job_ids)
+
+
+def _completed_job(prompt: str, result: str, queue: Queue, result_ttl: int, pipeline=None) -> Job:
+    """Records a job that is already finished with the given result."""
+    job = Job.create(
+        PREDICT_FUNC,
+        args=(prompt,),
+        connection=get_connection(),
+        result_ttl=result_ttl,
+        origin=queue.name,
+        description=_description(prompt),
+        serializer=_connections()["serializer"],
+    )
+    job._result = result
+    job.started_at = job.ended_at = now()
+    if pipeline is not None:
+        job._handle_success(result_ttl, pipeline=pipeline)
+        return job
+    with get_connection().pipeline() as pipeline:
+        job._handle_success(result_ttl, pipeline=pipeline)
+        pipeline.execute()
+    return job
+
+
+def _is_pending(job_id: bytes) -> bool:
+    status = get_connection().hget(Job.key_for(job_id.decode()), "status")
+    return status is not None and status.decode() in PENDING_STATUSES
+
+
+def _inflight_key(queue: Queue, digest: str) -> str:
+    # Per lane, so an interactive request never waits on a bulk job.
+    return f"{INFLIGHT_KEY_PREFIX}{queue.name}:{digest}"
+
+
+def _enqueue_coalesced(
+    prompt: str,
+    digest: str,
+    queue: Queue,
+    result_ttl: int,
+    job_id: str,
+    params: Optional[dict] = None,
+    cache_namespace: Optional[str] = None,
+) -> str:
+    """Enqueues prompt unless an identical job is already pending; returns the job id."""
+    inflight_key = _inflight_key(queue, digest)
+    with get_connection().pipeline() as pipeline:
+        while True:
+            try:
+                pipeline.watch(inflight_key)
+                leader = pipeline.get(inflight_key)
+                if leader is not None and _is_pending(leader):
+                    pipeline.unwatch()
+                    logger.info(f"Coalesced prompt onto in-flight job {leader.decode()}")
+                    return leader.decode()
+                pipeline.multi()
+                (job,) = queue.enqueue_many(
+                    [_job_data(prompt, result_ttl, job_id, params=params, cache_namespace=cache_namespace)],
+                    pipeline=pipeline,
+                )
+                pipeline.set(inflight_key, job.id, ex=Config.load().request_coalescing_ttl_seconds)
+                pipeline.execute()
+                return job.id
+            except redis.WatchError:
+                continue
+
+
+def add_to_queue(
+    prompt: str,
+    lane: Optional[str] = None,
+    result_ttl: Optional[int] = None,
+    client_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    params: Optional[dict] = None,
+    cache_namespace: Optional[str] = None,
+) -> str:
+    """Adds a text generation request to the Redis queue of the given lane.
+
+    With a session_id the prompt is the next user turn of that session.
+    params are the request's generation params, sent to the provider.
+    cache_namespace selects the worker's near-duplicate cache namespace.
+    Raises AdmissionRejectedError when admission control is enabled and the
+    budget of client_id (or the global budget) is full.
+    """
+    queue = _queue_for(lane)
+    result_ttl = _result_ttl(result_ttl)
+    digest = None
+    cache = None if session_id else get_response_cache()
+    coalesce = Config.load().request_coalescing_enabled and not session_id
+    if cache is not None or coalesce:
+        digest = fingerprint(prompt, **generation_params(params))
+    if cache is not None:
+        cached = cache.get(KEY_PREFIX + digest)
+        if cached is not None:
+            return _completed_job(prompt, cached, queue, result_ttl).id
+    (job_id,) = _admit(client_id, [prompt], (params or {}).get("max_tokens"))
+    try:
+        if coalesce:
+            enqueued = _enqueue_coalesced(prompt, digest, queue, result_ttl, job_id, params, cache_namespace)
+        else:
+            (job,) = queue.enqueue_many([_job_data(prompt, result_ttl, job_id, session_id, params, cache_namespace)])
+            enqueued = job.id
+    except BaseException:
+        _release(job_id)
+        raise
+    if enqueued != job_id:
+        _release(job_id)
+    return enqueued
+
+def add_batch_to_queue(
+    prompts: list[str],
+    lane: Optional[str] = None,
+    result_ttl: Optional[int] = None,
+    client_id: Optional[str] = None,
+    cache_namespace: Optional[str] = None,
+) -> tuple[str, list[str]]:
+    """Enqueues many prompts in one Redis pipeline; returns (batch_id, job_ids).
+
+    Cached prompts are served as already-completed jobs, like add_to_queue.
+    Coalescing is not applied to batch submissions. The remaining prompts are
+    admitted together or not at all.
+    """
+    if not prompts:
+        raise ValueError("A batch needs at least one prompt")
+    max_batch_size = Config.load().max_batch_size
+    if len(prompts) > max_batch_size:
+        raise ValueError(f"Batch of {len(prompts)} prompts exceeds the limit of {max_batch_size}")
+    queue = _queue_for(lane)
+    result_ttl = _result_ttl(result_ttl)
+
+    cached: list[Optional[str]] = [None] * len(prompts)
+    cache = get_response_cache()
+    if cache is not None:
+        params = generation_params()
+        cached = cache.get_many([KEY_PREFIX + fingerprint(prompt, **params) for prompt in prompts])
+
+    pending = [i for i, hit in enumerate(cached) if hit is None]
+    pending_ids = _admit(client_id, [prompts[i] for i in pending])
+    batch_id = uuid.uuid4().hex
+    batch_key = BATCH_KEY_PREFIX + batch_id
+    try:
+        with get_connection().pipeline() as pipeline:
+            job_ids = [None] * len(prompts)
+            for i, hit in enumerate(cached):
+                if hit is not None:
+                    job_ids[i] = _completed_job(prompts[i], hit, queue, result_ttl, pipeline=pipeline).id
+            jobs = queue.enqueue_many(
+                [
+                    _job_data(prompts[i], result_ttl, job_id, cache_namespace=cache_namespace)
+                    for i, job_id in zip(pending, pending_ids, strict=True)
+                ],
+                pipeline=pipeline,
+            )
+            for i, job in zip(pending, jobs, strict=True):
+                job_ids[i] = job.id
+            pipeline.rpush(batch_key, *job_ids)
+            pipeline.expire(batch_key, result_ttl)
+            pipeline.execute()
+    except BaseException:
+        _release(*pending_ids)
+        raise
+    return batch_id, job_ids
+
+
+STATUS_NAMES = {
+    JobStatus.FINISHED.value: "completed",
+    JobStatus.FAILED.value: "failed",
+    JobStatus.QUEUED.value: "queued",
+    # Throttled jobs wait in the scheduled registry until their retry is due.
+    JobStatus.SCHEDULED.value: "queued",
+    JobStatus.STARTED.value: "processing",
+}
+
+
+def _status_name(status) -> str:
+    return STATUS_NAMES.get(getattr(status, "value", status), "unknown")
+
+
+def get_job_statuses_from_queue(job_ids: list[str]) -> list[str]:
+    """Returns the status name of each job, reading only the status fields."""
+    with get_connection().pipeline(transaction=False) as pipeline:
+        for job_id in job_ids:
+            pipeline.hget(Job.key_for(job_id), "status")
+        raw = pipeline.execute()
+    return [_status_name(status.decode()) if status else "unknown" for status in raw]
 
-conn = redis.from_url(config.redis_url)
-q = Queue(connection=conn)
 
+def _queue_status_reads(pipeline, job_ids: list[str]) -> None:
+    """Queues, per job, a read of its status field and of its latest result."""
+    for job_id in job_ids:
+        pipeline.hget(Job.key_for(job_id), "status")
+        pipeline.xrevrange(Result.get_key(job_id), "+", "-", count=1)
+
+
+def _parse_status_reads(job_ids: list[str], raw: list) -> list[tuple[str, str | None]]:
+    statuses = []
+    for i, job_id in enumerate(job_ids):
+        status_raw, latest = raw[2 * i], raw[2 * i + 1]
+        status = _status_name(status_raw.decode()) if status_raw else "unknown"
+        result = None
+        if status == "completed" and latest:
+            result_id, payload = latest[0]
+            restored = Result.restore(
+                job_id,
+                result_id.decode(),
+                payload,
+                connection=get_connection(),
+                serializer=_connections()["serializer"],
+            )
+            if restored.type == Result.Type.SUCCESSFUL:
+                result = restored.return_value
+        statuses.append((status, result))
+    return statuses
+
+
+def get_job_status_many_from_queue(job_ids: list[str]) -> list[tuple[str, str | None]]:
+    """Returns (status, result) for many jobs in one pipelined round trip.
+
+    Unknown or expired job ids report status "unknown".
+    """
+    if not job_ids:
+        return []
+    with get_connection().pipeline(transaction=False) as pipeline:
+        _queue_status_reads(pipeline, job_ids)
+        raw = pipeline.execute()
+    return _parse_status_reads(job_ids, raw)
+
+
+def _batch_job_ids(raw: list) -> list[str]:
+    return [job_id.decode() for job_id in raw]
+
+
+def get_batch_status_from_queue(batch_id: str) -> list[tuple[str, str, str | None]]:
+    """Returns (job_id, status, result) for every job in a batch, in submission order."""
+    job_ids = _batch_job_ids(get_connection().lrange(BATCH_KEY_PREFIX + batch_id, 0, -1))
+    if not job_ids:
+        raise ValueError(f"Unknown or expired batch: {batch_id}")
+    return [(job_id, *status) for job_id, status in zip(job_ids, get_job_status_many_from_queue(job_ids), strict=True)]
 
-def add_to_queue(prompt: str) -> str:
-    """Adds a text generation request to the Redis queue."""
-    job = q.enqueue_call(func=call_predict_response, args=(prompt,), result_ttl=3600)
-    return job.id
 
 def get_job_status_from_queue(job_id: str) -> tuple[str, str | None]:
-    """Retrieves the status and result (if available) of a job."""
-    job = Job.fetch(job_id, connection=conn)
-    if job.is_finished:
-        return "completed", job.result
-    elif job.is_failed:
-        return "failed", None  # Or perhaps return the exception details
-    elif job.is_queued:
-        return "queued", None
-    elif job.is_started:
-        return "processing", None
-    else:
-        return "unknown", None
\ No newline at end of file
+    """Retrieves the status and result (if available) of a job in one round trip."""
+    ((status, result),) = get_job_status_many_from_queue([job_id])
+    if status == "unknown" and not get_connection().exists(Job.key_for(job_id)):
+        raise NoSuchJobError(f"No such job: {Job.key_for(job_id)}")
+    return status, result
+
+
+# Job hash fields read by the detail lookups, ahead of timing.HASH_FIELDS.
+DETAIL_FIELDS = ("origin", "worker_name", "number_of_retries")
+
+
+def _queue_detail_reads(pipeline, job_id: str) -> None:
+    _queue_status_reads(pipeline, [job_id])
+    pipeline.hmget(Job.key_for(job_id), *DETAIL_FIELDS, *timing.HASH_FIELDS)
+
+
+def _parse_detail_reads(job_id: str, raw: list) -> dict:
+    ((status, result),) = _parse_status_reads([job_id], raw[:2])
+    if status == "unknown" and not any(raw[2]):
+        raise NoSuchJobError(f"No such job: {Job.key_for(job_id)}")
+    detail, fields = raw[2][:len(DETAIL_FIELDS)], raw[2][len(DETAIL_FIELDS):]
+    lane, worker_name, retries = [value.decode() if value else None for value in detail]
+    timestamps, profile = timing.parse_fields(fields)
+    return {
+        "status": status,
+        "result": result,
+        "lane": lane,
+        "worker_name": worker_name,
+        "retries": int(retries or 0),
+        "timestamps": timestamps,
+        "profile": profile,
+    }
+
+
+def get_job_detail_from_queue(job_id: str) -> dict:
+    """Returns a job's status, result, lane, worker, retries, stage timestamps and profile path in one round trip."""
+    with get_connection().pipeline(transaction=False) as pipeline:
+        _queue_detail_reads(pipeline, job_id)
+        raw = pipeline.execute()
+    return _parse_detail_reads(job_id, raw)
+
+
+def read_job_stream(job_id: str, offset: str = "0", wait_ms: int = 0) -> tuple[str, str, bool, str]:
+    """Returns (text, next_offset, done, status) for the text after offset.
+
+    Jobs that produced no stream (streaming disabled, or served from the
+    cache) return their full result once completed.
+    """
+    wait_ms = max(0, min(wait_ms, Config.load().stream_max_wait_ms))
+    text, next_offset, done = read_stream(get_connection(), job_id, offset, wait_ms)
+    if done is not None:
+        return text, next_offset, True, done
+    if text or get_connection().exists(stream_key(job_id)):
+        return text, next_offset, False, "processing"
+    status, result = get_job_status_from_queue(job_id)
+    if status == "completed":
+        return (result or "") if offset == "0" else "", offset, True, status
+    return "", offset, status == "failed", status
+
+
+# --- Async API ---
+
+def _record(build) -> list[tuple]:
+    """Runs build(pipeline) on a pipeline that is never executed and returns its commands."""
+    recorder = get_connection().pipeline()
+    try:
+        build(recorder)
+        return list(recorder.command_stack)
+    finally:
+        recorder.reset()
+
+
+def _replay(commands: list[tuple], pipeline) -> None:
+    for args, options in commands:
+        pipeline.execute_command(*args, **options)
+
+
+async def _ensure_server_version() -> None:
+    # RQ stamps jobs with the server version; fetch it once without blocking.
+    if not _connections()["q"].redis_server_version:
+        info = await get_async_connection().info("server")
+        version = tuple(int(part) for part in str(info["redis_version"]).split(".")[:3])
+        version += (0,) * (3 - len(version))
+        for queue in get_queues().values():
+            queue.redis_server_version = version
+
+
+def _record_enqueue(
+    prompts: list[str],
+    queue: Queue,
+    result_ttl: int,
+    job_ids: list[str],
+    session_id: Optional[str] = None,
+    params: Optional[dict] = None,
+    cache_namespace: Optional[str] = None,
+) -> tuple[list[Job], list[tuple]]:
+    jobs: list[Job] = []
+    commands = _record(lambda pipeline: jobs.extend(queue.enqueue_many(
+        [
+            _job_data(prompt, result_ttl, job_id, session_id, params, cache_namespace)
+            for prompt, job_id in zip(prompts, job_ids, strict=True)
+        ],
+        pipeline=pipeline,
+    )))
+    return jobs, commands
+
+
+def _record_completed(prompt: str, result: str, queue: Queue, result_ttl: int) -> tuple[Job, list[tuple]]:
+    jobs: list[Job] = []
+    commands = _record(
+        lambda pipeline: jobs.append(_completed_job(prompt, result, queue, result_ttl, pipeline=pipeline))
+    )
+    return jobs[0], commands
+
+
+async def _ais_pending(job_id: bytes) -> bool:
+    status = await get_async_connection().hget(Job.key_for(job_id.decode()), "status")
+    return status is not None and status.decode() in PENDING_STATUSES
+
+
+async def _aadmit(
+    client_id: Optional[str], prompts: list[str], max_new_tokens: Optional[int] = None
+) -> list[str]:
+    job_ids = _new_job_ids(len(prompts))
+    controller = get_admission_controller()
+    if controller is not None:
+        await controller.aadmit(client_id or DEFAULT_CLIENT_ID, _reservations(prompts, job_ids, max_new_tokens))
+    return job_ids
+
+
+async def _arelease(*job_ids: str) -> None:
+    controller = get_admission_controller()
+    if controller is not None:
+        await controller.arelease(*job_ids)
+
+
+async def _aenqueue_coalesced(
+    prompt: str,
+    digest: str,
+    queue: Queue,
+    result_ttl: int,
+    job_id: str,
+    params: Optional[dict] = None,
+    cache_namespace: Optional[str] = None,
+) -> str:
+    inflight_key = _inflight_key(queue, digest)
+    jobs, commands = _record_enqueue(
+        [prompt], queue, result_ttl, [job_id], params=params, cache_namespace=cache_namespace
+    )
+    async with get_async_connection().pipeline() as pipeline:
+        while True:
+            try:
+                await pipeline.watch(inflight_key)
+                leader = await pipeline.get(inflight_key)
+                if leader is not None and await _ais_pending(leader):
+                    await pipeline.unwatch()
+                    logger.info(f"Coalesced prompt onto in-flight job {leader.decode()}")
+                    return leader.decode()
+                pipeline.multi()
+                _replay(commands, pipeline)
+                pipeline.set(inflight_key, jobs[0].id, ex=Config.load().request_coalescing_ttl_seconds)
+                await pipeline.execute()
+                return jobs[0].id
+            except redis.WatchError:
+                continue
+
+
+async def aadd_to_queue(
+    prompt: str,
+    lane: Optional[str] = None,
+    result_ttl: Optional[int] = None,
+    client_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    params: Optional[dict] = None,
+    cache_namespace: Optional[str] = None,
+) -> str:
+    """Async add_to_queue."""
+    queue = _queue_for(lane)
+    result_ttl = _result_ttl(result_ttl)
+    await _ensure_server_version()
+    digest = None
+    cache = None if session_id else get_response_cache()
+    coalesce = Config.load().request_coalescing_enabled and not session_id
+    if cache is not None or coalesce:
+        digest = fingerprint(prompt, **generation_params(params))
+    if cache is not None:
+        cached = await cache.aget(KEY_PREFIX + digest)
+        if cached is not None:
+            job, commands = _record_completed(prompt, cached, queue, result_ttl)
+            async with get_async_connection().pipeline() as pipeline:
+                _replay(commands, pipeline)
+                await pipeline.execute()
+            return job.id
+    (job_id,) = await _aadmit(client_id, [prompt], (params or {}).get("max_tokens"))
+    try:
+        if coalesce:
+            enqueued = await _aenqueue_coalesced(prompt, digest, queue, result_ttl, job_id, params, cache_namespace)
+        else:
+            jobs, commands = _record_enqueue(
+                [prompt], queue, result_ttl, [job_id], session_id, params, cache_namespace
+            )
+            async with get_async_connection().pipeline() as pipeline:
+                _replay(commands, pipeline)
+                await pipeline.execute()
+            enqueued = jobs[0].id
+    except BaseException:
+        await _arelease(job_id)
+        raise
+    if enqueued != job_id:
+        await _arelease(job_id)
+    return enqueued
+
+
+async def aadd_batch_to_queue(
+    prompts: list[str],
+    lane: Optional[str] = None,
+    result_ttl: Optional[int] = None,
+    client_id: Optional[str] = None,
+    cache_namespace: Optional[str] = None,
+) -> tuple[str, list[str]]:
+    """Async add_batch_to_queue."""
+    if not prompts:
+        raise ValueError("A batch needs at least one prompt")
+    max_batch_size = Config.load().max_batch_size
+    if len(prompts) > max_batch_size:
+        raise ValueError(f"Batch of {len(prompts)} prompts exceeds the limit of {max_batch_size}")
+    queue = _queue_for(lane)
+    result_ttl = _result_ttl(result_ttl)
+    await _ensure_server_version()
+
+    cached: list[Optional[str]] = [None] * len(prompts)
+    cache = get_response_cache()
+    if cache is not None:
+        params = generation_params()
+        cached = await cache.aget_many([KEY_PREFIX + fingerprint(prompt, **params) for prompt in prompts])
+
+    job_ids: list[Optional[str]] = [None] * len(prompts)
+    commands: list[tuple] = []
+    for i, hit in enumerate(cached):
+        if hit is not None:
+            job, job_commands = _record_completed(prompts[i], hit, queue, result_ttl)
+            job_ids[i] = job.id
+            commands.extend(job_commands)
+    pending = [i for i, hit in enumerate(cached) if hit is None]
+    pending_ids = await _aadmit(client_id, [prompts[i] for i in pending])
+    try:
+        if pending:
+            jobs, enqueue_commands = _record_enqueue(
+                [prompts[i] for i in pending], queue, result_ttl, pending_ids, cache_namespace=cache_namespace
+            )
+            commands.extend(enqueue_commands)
+            for i, job in zip(pending, jobs, strict=True):
+                job_ids[i] = job.id
+
+        batch_id = uuid.uuid4().hex
+        batch_key = BATCH_KEY_PREFIX + batch_id
+        async with get_async_connection().pipeline() as pipeline:
+            _replay(commands, pipeline)
+            pipeline.rpush(batch_key, *job_ids)
+            pipeline.expire(batch_key, result_ttl)
+            await pipeline.execute()
+    except BaseException:
+        await _arelease(*pending_ids)
+        raise
+    return batch_id, job_ids
+
+
+async def aget_job_status_many_from_queue(job_ids: list[str]) -> list[tuple[str, str | None]]:
+    """Async get_job_status_many_from_queue."""
+    if not job_ids:
+        return []
+    async with get_async_connection().pipeline(transaction=False) as pipeline:
+        _queue_status_reads(pipeline, job_ids)
+        raw = await pipeline.execute()
+    return _parse_status_reads(job_ids, raw)
+
+
+async def aget_job_status_from_queue(job_id: str) -> tuple[str, str | None]:
+    """Async get_job_status_from_queue."""
+    ((status, result),) = await aget_job_status_many_from_queue([job_id])
+    if status == "unknown" and not await get_async_connection().exists(Job.key_for(job_id)):
+        raise NoSuchJobError(f"No such job: {Job.key_for(job_id)}")
+    return status, result
+
+
+async def aget_job_detail_from_queue(job_id: str) -> dict:
+    """Async get_job_detail_from_queue."""
+    async with get_async_connection().pipeline(transaction=False) as pipeline:
+        _queue_detail_reads(pipeline, job_id)
+        raw = await pipeline.execute()
+    return _parse_detail_reads(job_id, raw)
+
+
+async def aget_job_statuses_from_queue(job_ids: list[str]) -> list[str]:
+    """Async get_job_statuses_from_queue."""
+    async with get_async_connection().pipeline(transaction=False) as pipeline:
+        for job_id in job_ids:
+            pipeline.hget(Job.key_for(job_id), "status")
+        raw = await pipeline.execute()
+    return [_status_name(status.decode()) if status else "unknown" for status in raw]
+
+
+async def aget_batch_status_from_queue(batch_id: str) -> list[tuple[str, str, str | None]]:
+    """Async get_batch_status_from_queue."""
+    job_ids = _batch_job_ids(await get_async_connection().lrange(BATCH_KEY_PREFIX + batch_id, 0, -1))
+    if not job_ids:
+        raise ValueError(f"Unknown or expired batch: {batch_id}")
+    statuses = await aget_job_status_many_from_queue(job_ids)
+    return [(job_id, *status) for job_id, status in zip(job_ids, statuses, strict=True)]
+
+
+async def aread_job_stream(job_id: str, offset: str = "0", wait_ms: int = 0) -> tuple[str, str, bool, str]:
+    """Async read_job_stream."""
+    wait_ms = max(0, min(wait_ms, Config.load().stream_max_wait_ms))
+    text, next_offset, done = await aread_stream(get_async_connection(), job_id, offset, wait_ms)
+    if done is not None:
+        return text, next_offset, True, done
+    if text or await get_async_connection().exists(stream_key(job_id)):
+        return text, next_offset, False, "processing"
+    status, result = await aget_job_status_from_queue(job_id)
+    if status == "completed":
+        return (result or "") if offset == "0" else "", offset, True, status
+    return "", offset, status == "failed", status
@@ -0,0 +1,185 @@
+"""
+Per-Job Stage Timing.
+
+This module records when each stage of a job happened, so a slow job can be
+attributed to queue wait, worker startup, preparation (config, credentials,
+session history, rate limiting) or the provider call itself.
+
+Key Features:
+- Stage timestamps, in job order:
+  - enqueued_at / started_at / finished_at: RQ's own enqueued_at, started_at
+    and ended_at job fields
+  - executing_at: the job function started running (after the RQ worker
+    forked or prepared the job)
+  - provider_sent_at: the first provider request was sent (after the rate
+    limiter and circuit breaker let it through)
+  - first_byte_at: the first streamed chunk arrived, or the whole completion
+    when the provider call does not stream
+- Worker side: job_timer() / ajob_timer() wrap a job function; mark() called
+  anywhere below them (metrics.ProviderCall does) records a stage once per
+  attempt. The marks are written as extra fields of the RQ job hash when the
+  attempt ends, so they expire with the job. Cache hits never reach a worker
+  and only carry RQ's timestamps
+- Client side: parse_fields() turns the hash fields (HASH_FIELDS, read with
+  one HMGET) into timestamps, and durations() into per-stage seconds
+- The job's profile (profiling.py), when one was dumped, is recorded in the
+  same hash
+
+Usage:
+    with job_timer(job_id):
+        ...
+        mark("provider_sent")
+
+    values = conn.hmget(Job.key_for(job_id), *HASH_FIELDS)
+    timestamps, profile = parse_fields(values)
+    durations(timestamps)  # {"queue_wait": 0.01, ..., "total": 1.2}
+
+Dependencies:
+- redis: Writes the marks into the job hash
+- rq: Job keys and timestamp formatting
+- config: Redis URL of the worker-side connection
+"""
+
+import asyncio
+import contextvars
+import logging
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from typing import AsyncIterator, Iterator, Optional
+
+import redis
+from rq.job import Job
+from rq.utils import now, utcformat, utcparse
+
+from mcp_waifu_queue.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Stages marked by the worker, and the job hash field each is stored in.
+STAGE_FIELDS = {
+    "executing": "waifu_executing_at",
+    "provider_sent": "waifu_provider_sent_at",
+    "first_byte": "waifu_first_byte_at",
+}
+PROFILE_FIELD = "waifu_profile"
+# Timestamp name -> job hash field, in stage order.
+TIMESTAMP_FIELDS = {
+    "enqueued_at": "enqueued_at",
+    "started_at": "started_at",
+    "executing_at": STAGE_FIELDS["executing"],
+    "provider_sent_at": STAGE_FIELDS["provider_sent"],
+    "first_byte_at": STAGE_FIELDS["first_byte"],
+    "finished_at": "ended_at",
+}
+HASH_FIELDS = (*TIMESTAMP_FIELDS.values(), PROFILE_FIELD)
+# Duration name -> (from, to) timestamps.
+DURATIONS = {
+    "queue_wait": ("enqueued_at", "started_at"),
+    "startup": ("started_at", "executing_at"),
+    "preparation": ("executing_at", "provider_sent_at"),
+    "time_to_first_byte": ("provider_sent_at", "first_byte_at"),
+    "generation": ("first_byte_at", "finished_at"),
+    "total": ("enqueued_at", "finished_at"),
+}
+
+
+class JobTimer:
+    """Stage timestamps of one attempt at a job."""
+
+    def __init__(self, job_id: Optional[str]):
+        self.job_id = job_id
+        self.marks: dict[str, str] = {}
+        self.profile: Optional[str] = None
+
+    def mark(self, stage: str) -> None:
+        """Records stage at the current time, unless it was already recorded."""
+        self.marks.setdefault(STAGE_FIELDS[stage], utcformat(now()))
+
+
+_current: contextvars.ContextVar[Optional[JobTimer]] = contextvars.ContextVar("waifu_job_timer", default=None)
+_connection: Optional[redis.Redis] = None
+
+
+def mark(stage: str) -> None:
+    """Records stage on the running job's timer; a no-op outside a job."""
+    timer = _current.get()
+    if timer is not None:
+        timer.mark(stage)
+
+
+def record_profile(path: str) -> None:
+    """Records where the running job's profile was written."""
+    timer = _current.get()
+    if timer is not None:
+        timer.profile = path
+
+
+def save(timer: JobTimer) -> None:
+    """Writes the timer's marks into its job hash, replacing an earlier attempt's. Never raises."""
+    global _connection
+    if timer.job_id is None:
+        return
+    try:
+        if _connection is None:
+            _connection = redis.from_url(Config.load().redis_url)
+        fields = dict(timer.marks)
+        if timer.profile is not None:
+            fields[PROFILE_FIELD] = timer.profile
+        stale = [field for field in (*STAGE_FIELDS.values(), PROFILE_FIELD) if field not in fields]
+        key = Job.key_for(timer.job_id)
+        with _connection.pipeline(transaction=False) as pipeline:
+            pipeline.hset(key, mapping=fields)
+            if stale:
+                pipeline.hdel(key, *stale)
+            pipeline.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record stage timings of job {timer.job_id}: {e}")
+
+
+@contextmanager
+def job_timer(job_id: Optional[str]) -> Iterator[JobTimer]:
+    """Times one attempt at a job, saving its marks when it ends."""
+    timer = JobTimer(job_id)
+    timer.mark("executing")
+    token = _current.set(timer)
+    try:
+        yield timer
+    finally:
+        _current.reset(token)
+        save(timer)
+
+
+@asynccontextmanager
+async def ajob_timer(job_id: Optional[str]) -> AsyncIterator[JobTimer]:
+    """Async job_timer; marks are saved off the event loop."""
+    timer = JobTimer(job_id)
+    timer.mark("executing")
+    token = _current.set(timer)
+    try:
+        yield timer
+    finally:
+        _current.reset(token)
+        await asyncio.to_thread(save, timer)
+
+
+def parse_fields(values: list) -> tuple[dict[str, Optional[str]], Optional[str]]:
+    """Returns (timestamps, profile path) from the HASH_FIELDS values of a job hash."""
+    decoded = [value.decode() if value else None for value in values]
+    *stamps, profile = decoded
+    return dict(zip(TIMESTAMP_FIELDS, stamps, strict=True)), profile
+
+
+def _parse(timestamp: Optional[str]) -> Optional[datetime]:
+    return utcparse(timestamp) if timestamp else None
+
+
+def durations(timestamps: dict[str, Optional[str]]) -> dict[str, Optional[float]]:
+    """Seconds spent in each stage; None where either end was not recorded."""
+    parsed = {name: _parse(value) for name, value in timestamps.items()}
+    spans = {}
+    for name, (start, end) in DURATIONS.items():
+        if parsed.get(start) is None or parsed.get(end) is None:
+            spans[name] = None
+        else:
+            spans[name] = round((parsed[end] - parsed[start]).total_seconds(), 6)
+    return spans
@@ -7,14 +7,39 @@ queue and the actual text generation logic.
 
 Key Components:
 - call_predict_response(): Main worker function that processes queued prompts
+- acall_predict_response(): Coroutine equivalent used by the asyncio worker
+- Storing successful completions in the optional response cache
+- Publishing partial text to the job's Redis stream when streaming is enabled
+- Retrying throttled jobs (rq.Retry) instead of failing them, once the
+  provider's Retry-After (or the longest provider backoff) has passed
+- Session turns: with a session_id, the prompt is sent after the session's
+  stored history (sessions.py) and the exchange is appended to it once the
+  completion succeeds. Session turns bypass the response cache
+- Per-request generation params (model, max_tokens, temperature, stop) are
+  passed through to respond.py, and cached completions are keyed on them,
+  with the model that generated the completion (after a failover, not the
+  requested one)
+- Near-duplicate cache (similarity_cache.py): when the job's cache namespace
+  opted in, a stored completion of a similar prompt is returned without
+  calling the provider, and new completions are indexed for later jobs.
+  Session turns bypass it, like the response cache
+- Stage timing: each attempt records when it started executing, sent its
+  provider request and received the first byte (timing.py)
+- Opt-in sampled profiling of RQ worker jobs (profiling.py): a configured
+  fraction of jobs, or every job slower than a threshold, has its stack
+  samples written to PROFILE_DIR
 - Integration with the respond.py module for actual text generation
 - Error handling and logging for job execution
 - Prompt truncation in logs for privacy/debugging balance
 
 Functionality:
 - Receives prompts from the Redis queue via RQ
-- Calls the predict_response function from respond.py
+- Calls predict_response from respond.py, which hands the prompt to the
+  provider router (providers/router.py) to pick a backend and fail over
 - Handles exceptions and ensures proper error reporting to RQ
+- Returns an rq.Retry when the provider or the shared rate limiter throttled
+  the call, so the worker runs the job again once the throttle's delay has
+  passed; after rate_limit_max_requeues retries the job fails
 - Provides logging for debugging and monitoring
 - Returns generated text for storage in Redis
 
@@ -27,38 +52,216 @@ Dependencies:
 - respond: For the actual AI text generation logic
 """
 
+import asyncio
 import logging
-# Removed requests import
-# Removed GPUServiceError class
-# Removed config import as it's not used here anymore
+import math
+from typing import Optional
 
-# Import the actual prediction function
-from mcp_waifu_queue.respond import predict_response
+from rq import Retry, get_current_job
+
+from mcp_waifu_queue.cache import cache_key, get_response_cache
+from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.errors import ProviderThrottledError
+from mcp_waifu_queue.profiling import profile_job
+from mcp_waifu_queue.respond import (
+    apredict_response,
+    generation_params,
+    predict_response,
+    served_params,
+)
+from mcp_waifu_queue.sessions import get_session_store
+from mcp_waifu_queue.similarity_cache import get_similarity_cache
+from mcp_waifu_queue.streaming import open_writer
+from mcp_waifu_queue.timing import ajob_timer, job_timer
 
 logger = logging.getLogger(__name__)
 
-# This function now directly calls the local predict_response function.
-def call_predict_response(prompt: str) -> str:
+
+def store_cached_response(prompt: str, result: str, params: Optional[dict] = None) -> None:
+    """Stores a completion in the response cache, if enabled. Never raises."""
+    try:
+        cache = get_response_cache()
+        if cache is not None:
+            cache.set(cache_key(prompt, **generation_params(params)), result)
+    except Exception as e:
+        logger.warning(f"Failed to store response in cache: {e}")
+
+def similar_response(prompt: str, params: Optional[dict], cache_namespace: Optional[str]) -> Optional[str]:
+    """Returns a completion of a near-duplicate prompt from the similarity cache, if any. Never raises."""
+    try:
+        cache = get_similarity_cache()
+        if cache is not None and cache.enabled_for(cache_namespace):
+            return cache.lookup(cache_namespace, prompt, generation_params(params))
+    except Exception as e:
+        logger.warning(f"Similarity cache lookup failed: {e}")
+    return None
+
+def store_similar_response(prompt: str, result: str, params: Optional[dict], cache_namespace: Optional[str]) -> None:
+    """Indexes a completion in the similarity cache, if its namespace opted in. Never raises."""
+    try:
+        cache = get_similarity_cache()
+        if cache is not None and cache.enabled_for(cache_namespace):
+            cache.store(cache_namespace, prompt, generation_params(params), result)
+    except Exception as e:
+        logger.warning(f"Failed to index response in similarity cache: {e}")
+
+def _throttled_retry(e: ProviderThrottledError) -> Retry:
+    # Wait as long as the provider (or the rate limiter) asked, else the longest provider backoff.
+    config = Config.load()
+    interval = max(1, math.ceil(e.retry_after or config.provider_retry_max_delay_seconds))
+    logger.warning(f"Provider call throttled, retrying job in {interval}s: {e}")
+    return Retry(max=max(1, config.rate_limit_max_requeues), interval=interval)
+
+def _finish_turn(
+    prompt: str, result: str, session_id: Optional[str], params: Optional[dict], cache_namespace: Optional[str]
+) -> None:
+    if session_id is None:
+        store_cached_response(prompt, result, params)
+        store_similar_response(prompt, result, params, cache_namespace)
+    else:
+        get_session_store().append_turn(session_id, prompt, result)
+
+def call_predict_response(
+    prompt: str,
+    session_id: Optional[str] = None,
+    params: Optional[dict] = None,
+    cache_namespace: Optional[str] = None,
+) -> str:
     """
-    Calls the Gemini prediction function directly.
+    Generates the completion of a queued prompt through the provider router.
+
+    A near-duplicate cache hit (similarity_cache.py) is returned without a
+    provider call; otherwise respond.predict_response sends the prompt,
+    after the session's history if any, to the router's best backend.
 
     Args:
         prompt: The input prompt string.
+        session_id: Conversation session the prompt continues, if any.
+        params: The request's generation params (model, max_tokens, temperature, stop).
+        cache_namespace: Near-duplicate cache namespace of the request, if any.
 
     Returns:
-        The generated text response.
+        The generated text response, or an rq.Retry if the call was throttled.
 
     Raises:
         RuntimeError: If the underlying predict_response fails.
     """
     logger.info(f"Worker calling predict_response for prompt: '{prompt[:50]}...'")
+    job = get_current_job()
+    job_id = job.id if job is not None else None
+    with job_timer(job_id), profile_job(job_id):
+        return _predict(prompt, job_id, session_id, params, cache_namespace)
+
+
+def _predict(
+    prompt: str,
+    job_id: Optional[str],
+    session_id: Optional[str],
+    params: Optional[dict],
+    cache_namespace: Optional[str],
+) -> str:
+    writer = open_writer(job_id)
     try:
-        # Directly call the function from respond.py
-        result = predict_response(prompt)
-        logger.info(f"predict_response returned: '{result[:50]}...'")
+        result = None if session_id else similar_response(prompt, params, cache_namespace)
+        if result is not None:
+            if writer:
+                writer.append(result)
+        else:
+            request = get_session_store().messages(session_id, prompt) if session_id else prompt
+            result = predict_response(request, on_chunk=writer.append if writer else None, params=params)
+            logger.info(f"predict_response returned: '{result[:50]}...'")
+            params = served_params(params)
+        if writer:
+            writer.finish("completed")
+        _finish_turn(prompt, result, session_id, params, cache_namespace)
         return result
+    except ProviderThrottledError as e:
+        # Nothing was generated yet; leave the stream open for the retry.
+        if job_id is None:
+            raise
+        return _throttled_retry(e)
     except Exception as e:
         # Log the error and re-raise it so RQ marks the job as failed
         logger.error(f"Error calling predict_response: {e}", exc_info=True)
+        if writer:
+            writer.finish("failed")
         # Re-raising the original exception or a new one to signal failure
-        raise # Reraises the caught exception
\ No newline at end of file
+        raise # Reraises the caught exception
+
+
+async def acall_predict_response(
+    prompt: str,
+    job_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    params: Optional[dict] = None,
+    cache_namespace: Optional[str] = None,
+) -> str:
+    """
+    Async counterpart of call_predict_response for the asyncio worker.
+
+    Args:
+        prompt: The input prompt string.
+        job_id: The RQ job id, used to publish partial text when streaming.
+        session_id: Conversation session the prompt continues, if any.
+        params: The request's generation params (model, max_tokens, temperature, stop).
+        cache_namespace: Near-duplicate cache namespace of the request, if any.
+
+    Returns:
+        The generated text response, or an rq.Retry if the call was throttled.
+    """
+    logger.info(f"Async worker calling apredict_response for prompt: '{prompt[:50]}...'")
+    async with ajob_timer(job_id):
+        return await _apredict(prompt, job_id, session_id, params, cache_namespace)
+
+
+async def _asimilar_response(
+    prompt: str, session_id: Optional[str], params: Optional[dict], cache_namespace: Optional[str]
+) -> Optional[str]:
+    if session_id:
+        return None
+    # Signatures are CPU work; keep them off the event loop.
+    return await asyncio.to_thread(similar_response, prompt, params, cache_namespace)
+
+
+async def _agenerate(prompt: str, session_id: Optional[str], params: Optional[dict], on_chunk) -> str:
+    request = prompt
+    if session_id:
+        request = await asyncio.to_thread(get_session_store().messages, session_id, prompt)
+    result = await apredict_response(request, on_chunk=on_chunk, params=params)
+    logger.info(f"apredict_response returned: '{result[:50]}...'")
+    return result
+
+
+async def _apredict(
+    prompt: str,
+    job_id: Optional[str],
+    session_id: Optional[str],
+    params: Optional[dict],
+    cache_namespace: Optional[str],
+) -> str:
+    writer = open_writer(job_id)
+
+    async def on_chunk(text: str) -> None:
+        await asyncio.to_thread(writer.append, text)
+
+    try:
+        result = await _asimilar_response(prompt, session_id, params, cache_namespace)
+        if result is not None:
+            if writer:
+                await on_chunk(result)
+        else:
+            result = await _agenerate(prompt, session_id, params, on_chunk if writer else None)
+            params = served_params(params)
+        if writer:
+            await asyncio.to_thread(writer.finish, "completed")
+        await asyncio.to_thread(_finish_turn, prompt, result, session_id, params, cache_namespace)
+        return result
+    except ProviderThrottledError as e:
+        if job_id is None:
+            raise
+        return _throttled_retry(e)
+    except Exception as e:
+        logger.error(f"Error calling apredict_response: {e}", exc_info=True)
+        if writer:
+            await asyncio.to_thread(writer.finish, "failed")
+        raise
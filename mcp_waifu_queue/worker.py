@@ -13,11 +13,29 @@ Key Features:
 - Integration with RQ for job management
 
 Architecture:
-- Uses RQ Worker class for queue monitoring
+- Uses RQ SimpleWorker by default so the provider HTTP pool survives across
+  jobs; set WORKER_FORK_PER_JOB=true to fork a work-horse per job instead
+- WORKER_MODE=async starts the asyncio engine (async_worker.py) instead, which
+  runs many provider calls concurrently in this one process
 - Connects to Redis using configuration settings
-- Listens to the 'default' queue for incoming jobs
-- Executes jobs by calling call_predict_response from utils.py
+- Reads and writes jobs with the compact serializer (serializer.py)
+- Listens to every configured priority lane (one RQ queue per lane, see
+  Config.lanes); before each dequeue the lanes are ordered by a weighted random
+  draw, so high-weight lanes are usually served first while low-weight lanes
+  keep making progress
+- Publishes a completion notification after each job's final status is saved,
+  so wait_for_job callers wake up without polling
+- Records job outcome, queue wait and duration metrics per lane, and serves
+  /metrics on WORKER_METRICS_PORT when it is set
+- Returns a job's admission budget (admission.py) once it completes or
+  finally fails
+- Runs RQ's scheduler, which puts throttled jobs back on their queue once
+  their retry interval has passed
+- Executes jobs by calling call_predict_response from utils.py; the
+  provider stack behind it is loaded at startup, before the first job
 - Provides logging for monitoring and debugging
+- SIGHUP reloads settings and provider credentials without a restart. The
+  Redis URL, the lanes listened to and the worker mode are read at startup
 
 Usage:
 Run this script as a separate process to start the worker:
@@ -25,7 +43,7 @@ Run this script as a separate process to start the worker:
 
 The worker should run continuously alongside the MCP server. It will:
 1. Connect to Redis using the configured URL
-2. Monitor the 'default' queue for new jobs
+2. Monitor the lane queues for new jobs
 3. Execute jobs by calling the prediction functions
 4. Handle errors gracefully and log them
 5. Continue processing until manually stopped
@@ -38,22 +56,116 @@ Dependencies:
 """
 
 import logging
+from typing import Optional
+
 import redis
-from rq import Worker, Queue, Connection
+from rq import Queue, Retry, SimpleWorker, Worker
+from rq.job import JobStatus
 
+from mcp_waifu_queue import (
+    http_client,
+    metrics,
+    providers,
+    utils,  # noqa: F401  (the job function, imported before the first job)
+)
+from mcp_waifu_queue.admission import release_admission
 from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.lanes import weighted_order
+from mcp_waifu_queue.notifications import publish_completion
+from mcp_waifu_queue.serializer import get_serializer
+from mcp_waifu_queue.settings import install_reload_signal
 
 config = Config.load()
 
-listen = ['default']
+listen = list(config.lanes)
 
 conn = redis.from_url(config.redis_url)
 
+
+class NotifyingWorkerMixin:
+    """Publishes job completions once RQ has recorded the final status.
+
+    Also records the per-lane job metrics and returns the job's admission
+    budget once it is finished.
+    """
+
+    def execute_job(self, job, queue):
+        metrics.observe_job_started(job)
+        return super().execute_job(job, queue)
+
+    def handle_job_success(self, job, queue, started_job_registry):
+        metrics.observe_job(job, "completed")
+        super().handle_job_success(job, queue, started_job_registry)
+        release_admission(job.id)
+        publish_completion(self.connection, job.id, "completed")
+
+    def handle_job_failure(self, job, queue, started_job_registry=None, exc_string=''):
+        super().handle_job_failure(job, queue, started_job_registry=started_job_registry, exc_string=exc_string)
+        # A job scheduled for retry has not reached its final status yet.
+        if job.get_status(refresh=False) == JobStatus.FAILED:
+            metrics.observe_job(job, "failed")
+            release_admission(job.id)
+            publish_completion(self.connection, job.id, "failed")
+        else:
+            metrics.observe_job(job, "requeued")
+
+    def handle_job_retry(self, job, queue, retry, started_job_registry):
+        # Once retries are used up RQ hands the job to handle_job_failure instead.
+        retrying = not (job.number_of_retries and job.number_of_retries >= retry.max)
+        if retrying:
+            metrics.observe_job(job, "requeued")
+        super().handle_job_retry(job, queue, retry, started_job_registry)
+        if retrying and Retry.get_interval(job.number_of_retries or 0, retry.intervals) > 0:
+            # RQ only counts immediate retries; count scheduled ones too so Retry.max holds.
+            self.connection.hincrby(job.key, "number_of_retries", 1)
+
+
+class WeightedLanesMixin:
+    """Reorders the lane queues by weight before the first dequeue and after every other."""
+
+    # None follows the configured lane weights, re-read before each dequeue so reloads apply.
+    lane_weights: Optional[dict[str, int]] = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # RQ only reorders after a job; without this the first dequeue follows listening order.
+        self.reorder_queues(reference_queue=None)
+
+    def reorder_queues(self, reference_queue):
+        weights = self.lane_weights or Config.load().lanes
+        self._ordered_queues = weighted_order(self.queues, [weights.get(queue.name, 1) for queue in self.queues])
+
+
+class NotifyingWorker(WeightedLanesMixin, NotifyingWorkerMixin, Worker):
+    pass
+
+
+class NotifyingSimpleWorker(WeightedLanesMixin, NotifyingWorkerMixin, SimpleWorker):
+    pass
+
+
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
-    with Connection(conn):
-        worker = Worker(list(map(Queue, listen)))
-        try:
-            worker.work()
-        except Exception as e:
-            logging.exception("Worker failed to start")
\ No newline at end of file
+    install_reload_signal()
+    # The MCP server never loads the provider stack; load it here rather than in the first job.
+    providers.get_router()
+    if config.worker_metrics_port:
+        metrics.start_metrics_server(config.worker_metrics_port)
+    if config.worker_mode == "async":
+        from mcp_waifu_queue import async_worker
+
+        async_worker.run(config, listen)
+        raise SystemExit(0)
+    worker_cls = NotifyingWorker if config.worker_fork_per_job else NotifyingSimpleWorker
+    serializer = get_serializer()
+    worker = worker_cls(
+        [Queue(name, connection=conn, serializer=serializer) for name in listen],
+        connection=conn,
+        serializer=serializer,
+    )
+    try:
+        worker.work(with_scheduler=True)
+    except Exception:
+        logging.exception("Worker failed to start")
+    finally:
+        http_client.close()
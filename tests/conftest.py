@@ -0,0 +1,96 @@
+"""
+Shared test fixtures.
+
+Every test runs against its own in-memory Redis (fakeredis, with Lua for the
+admission and rate-limit scripts): redis.from_url and redis.asyncio.from_url
+return clients of one FakeServer, and the package's lazily created clients,
+caches and controllers are reset so nothing leaks between tests.
+"""
+
+import json
+
+import fakeredis
+import pytest
+import redis
+import redis.asyncio as aioredis
+
+from mcp_waifu_queue.config import Config
+
+# fakeredis does not implement INFO, which RQ and task_queue read the server version from.
+SERVER_INFO = {"redis_version": "7.0.0"}
+
+# Module attributes holding process-wide clients, reset before each test.
+SINGLETONS = {
+    "mcp_waifu_queue.admission": {"_controller": None},
+    "mcp_waifu_queue.cache": {"_cache": None},
+    "mcp_waifu_queue.http_client": {"_client": None, "_async_client": None},
+    "mcp_waifu_queue.ratelimit": {"_limiters": {}},
+    "mcp_waifu_queue.resilience": {"_callers": {}},
+    "mcp_waifu_queue.serializer": {"_serializer": None},
+    "mcp_waifu_queue.sessions": {"_store": None},
+    "mcp_waifu_queue.settings": {"_files": {}},
+    "mcp_waifu_queue.similarity_cache": {"_cache": None},
+    "mcp_waifu_queue.streaming": {"_connection": None},
+    "mcp_waifu_queue.task_queue": {"_state": None},
+    "mcp_waifu_queue.timing": {"_connection": None},
+    "mcp_waifu_queue.providers.router": {"_router": None},
+}
+
+
+async def _ainfo(self, *args, **kwargs) -> dict:
+    return SERVER_INFO
+
+
+@pytest.fixture(autouse=True)
+def redis_server(monkeypatch, tmp_path):
+    """Routes every Redis connection of the test to one fresh in-memory server."""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(fakeredis.FakeRedis, "info", lambda self, *args, **kwargs: SERVER_INFO, raising=False)
+    monkeypatch.setattr(fakeredis.FakeAsyncRedis, "info", _ainfo, raising=False)
+    monkeypatch.setattr(redis, "from_url", lambda *args, **kwargs: fakeredis.FakeRedis(server=server))
+    monkeypatch.setattr(aioredis, "from_url", lambda *args, **kwargs: fakeredis.FakeAsyncRedis(server=server))
+    for module, attributes in SINGLETONS.items():
+        for name, value in attributes.items():
+            monkeypatch.setattr(f"{module}.{name}", type(value)() if value is not None else None)
+    # No .env file: the configuration comes from the environment only.
+    monkeypatch.chdir(tmp_path)
+    Config.invalidate()
+    yield server
+    Config.invalidate()
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    """Sets configuration environment variables and reloads Config."""
+
+    def apply(**values):
+        for name, value in values.items():
+            monkeypatch.setenv(name.upper(), str(value))
+        Config.invalidate()
+        return Config.load()
+
+    return apply
+
+
+@pytest.fixture
+def connection(redis_server):
+    return fakeredis.FakeRedis(server=redis_server)
+
+
+@pytest.fixture
+def async_connection(redis_server):
+    return fakeredis.FakeAsyncRedis(server=redis_server)
+
+
+@pytest.fixture
+def call_tool():
+    """Calls an MCP tool of the server in process; returns its decoded JSON result."""
+    from mcp_waifu_queue import main
+
+    async def call(name: str, **request):
+        result = await main.app.call_tool(name, {"request": request})
+        # Tools with a structured (model) result also return it as text content.
+        content = result[0] if isinstance(result, tuple) else result
+        return json.loads(content[0].text)
+
+    return call
@@ -0,0 +1,109 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from mcp_waifu_queue import main, task_queue
+from mcp_waifu_queue.admission import (
+    LEASES_KEY,
+    AdmissionController,
+    AdmissionRejectedError,
+    get_admission_controller,
+)
+from mcp_waifu_queue.worker import NotifyingSimpleWorker
+
+
+@pytest.fixture
+def controller(connection, async_connection):
+    return AdmissionController(
+        connection, global_token_limit=150, client_token_limit=100, async_connection=async_connection
+    )
+
+
+def test_budgets_are_per_client_and_global(controller):
+    controller.admit("a", [("a1", 80)])
+    with pytest.raises(AdmissionRejectedError) as rejected:
+        controller.admit("a", [("a2", 30)])
+    assert (rejected.value.scope, rejected.value.retry_after) == ("client", 5.0)
+    controller.admit("b", [("b1", 50)])
+    with pytest.raises(AdmissionRejectedError, match="global token budget"):
+        controller.admit("c", [("c1", 30)])
+    assert controller.outstanding() == {"global": 130, "client:a": 80, "client:b": 50}
+
+
+def test_oversized_request_is_admitted_when_nothing_is_outstanding(controller):
+    controller.admit("a", [("big", 1000)])
+    with pytest.raises(AdmissionRejectedError):
+        controller.admit("b", [("small", 1)])
+
+
+def test_batches_are_all_or_nothing(controller):
+    controller.admit("a", [("a1", 50)])
+    with pytest.raises(AdmissionRejectedError):
+        controller.admit("a", [("a2", 30), ("a3", 30)])
+    assert controller.outstanding() == {"global": 50, "client:a": 50}
+    controller.admit("a", [("a2", 20), ("a3", 30)])
+    assert controller.outstanding() == {"global": 100, "client:a": 100}
+
+
+def test_release_and_expired_leases_return_tokens(controller, connection):
+    controller.admit("a", [("a1", 60), ("a2", 30)])
+    controller.release("a1", "unknown")
+    assert controller.outstanding() == {"global": 30, "client:a": 30}
+    connection.zadd(LEASES_KEY, {"a2": time.time() - 1})
+    controller.admit("b", [("b1", 10)])
+    assert controller.outstanding() == {"global": 10, "client:b": 10}
+
+
+def test_deferred_request_is_admitted_once_budget_frees(controller, connection):
+    controller.max_wait_seconds = 2
+    controller.retry_after_seconds = 0.1
+    controller.admit("a", [("a1", 100)])
+    connection.zadd(LEASES_KEY, {"a1": time.time() + 0.3})
+    started = time.monotonic()
+    controller.admit("a", [("a2", 100)])
+    assert 0.2 < time.monotonic() - started < 2
+
+
+@pytest.mark.asyncio
+async def test_async_admission_shares_the_budget(controller):
+    await controller.aadmit("a", [("a1", 100)])
+    with pytest.raises(AdmissionRejectedError):
+        controller.admit("a", [("a2", 1)])
+    await controller.arelease("a1")
+    assert controller.outstanding() == {}
+
+
+def test_worker_releases_admission_when_the_job_finishes(configure, connection):
+    configure(
+        admission_enabled=True,
+        admission_client_token_limit=10_000,
+        default_provider="local",
+        max_new_tokens=100,
+    )
+    job_ids = [task_queue.add_to_queue("hi", client_id="a") for _ in range(2)]
+    assert get_admission_controller().outstanding()["client:a"] == 202
+    queue = task_queue.get_queues()["default"]
+    NotifyingSimpleWorker([queue], connection=connection, serializer=queue.serializer).work(burst=True)
+    assert [task_queue.get_job_status_from_queue(job_id)[0] for job_id in job_ids] == ["completed"] * 2
+    assert get_admission_controller().outstanding() == {}
+
+
+class Session:
+    """Stands in for an MCP ServerSession (hashable and weakly referenceable)."""
+
+
+def test_client_identity_comes_from_the_server_side_session():
+    def context(request=None, session=None):
+        return SimpleNamespace(request_context=SimpleNamespace(request=request, session=session))
+
+    def request(headers=None, query=None, host=None):
+        client = SimpleNamespace(host=host) if host else None
+        return SimpleNamespace(headers=headers or {}, query_params=query or {}, client=client)
+
+    assert main._client_id(context(request({"mcp-session-id": "s1"}))) == "session:s1"
+    assert main._client_id(context(request(query={"session_id": "s2"}))) == "session:s2"
+    assert main._client_id(context(request(host="10.0.0.1"))) == "addr:10.0.0.1"
+    stdio = Session()
+    assert main._client_id(context(session=stdio)) == main._client_id(context(session=stdio))
+    assert main._client_id(context(session=stdio)) != main._client_id(context(session=Session()))
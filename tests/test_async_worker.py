@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import pytest
+from rq import Queue
+from rq.job import JobStatus
+
+from mcp_waifu_queue import async_worker
+from mcp_waifu_queue.async_worker import AsyncWorker
+
+FUNC = "tests.generate"
+
+
+@pytest.fixture
+def queue(connection):
+    return Queue("default", connection=connection)
+
+
+async def wait_for(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        await asyncio.sleep(0.05)
+
+
+async def run_worker(worker: AsyncWorker, until, timeout: float = 5.0) -> None:
+    task = asyncio.create_task(worker.run())
+    try:
+        await wait_for(until, timeout)
+    finally:
+        worker.request_stop()
+        await task
+
+
+@pytest.mark.asyncio
+async def test_runs_jobs_concurrently(monkeypatch, connection, queue):
+    async def generate(prompt, job_id=None):
+        await asyncio.sleep(0.5)
+        return f"echo:{prompt}"
+
+    monkeypatch.setitem(async_worker.ASYNC_FUNCS, FUNC, generate)
+    jobs = [queue.enqueue(FUNC, f"p{i}") for i in range(8)]
+    worker = AsyncWorker([queue], connection, concurrency=8)
+
+    started = time.monotonic()
+    await run_worker(worker, lambda: all(job.get_status(refresh=True) == JobStatus.FINISHED for job in jobs))
+    assert time.monotonic() - started < 3
+    assert [job.return_value() for job in jobs] == [f"echo:p{i}" for i in range(8)]
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_marked_failed(monkeypatch, connection, queue):
+    async def generate(prompt, job_id=None):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(async_worker.ASYNC_FUNCS, FUNC, generate)
+    job = queue.enqueue(FUNC, "p")
+    await run_worker(AsyncWorker([queue], connection), lambda: job.get_status(refresh=True) == JobStatus.FAILED)
+    assert "boom" in job.latest_result().exc_string
+    assert queue.started_job_registry.get_job_ids() == []
+
+
+@pytest.mark.asyncio
+async def test_running_jobs_are_in_started_registry(monkeypatch, connection, queue):
+    release = asyncio.Event()
+
+    async def generate(prompt, job_id=None):
+        await release.wait()
+        return "done"
+
+    monkeypatch.setitem(async_worker.ASYNC_FUNCS, FUNC, generate)
+    job = queue.enqueue(FUNC, "p")
+    worker = AsyncWorker([queue], connection)
+    task = asyncio.create_task(worker.run())
+    await wait_for(lambda: job.id in queue.started_job_registry.get_job_ids())
+    release.set()
+    await wait_for(lambda: job.get_status(refresh=True) == JobStatus.FINISHED)
+    assert queue.started_job_registry.get_job_ids() == []
+    worker.request_stop()
+    await task
+
+
+@pytest.mark.asyncio
+async def test_stop_requeues_jobs_past_shutdown_grace(monkeypatch, connection, queue):
+    async def generate(prompt, job_id=None):
+        await asyncio.sleep(30)
+
+    monkeypatch.setitem(async_worker.ASYNC_FUNCS, FUNC, generate)
+    jobs = [queue.enqueue(FUNC, f"p{i}") for i in range(3)]
+    worker = AsyncWorker([queue], connection, concurrency=1, shutdown_grace=0)
+    task = asyncio.create_task(worker.run())
+    await wait_for(lambda: queue.started_job_registry.get_job_ids())
+
+    started = time.monotonic()
+    worker.request_stop()
+    await task
+    assert time.monotonic() - started < 3
+    assert sorted(queue.get_job_ids()) == sorted(job.id for job in jobs)
+    assert {job.get_status(refresh=True) for job in jobs} == {JobStatus.QUEUED}
+    assert queue.started_job_registry.get_job_ids() == []
@@ -0,0 +1,41 @@
+import pytest
+
+from mcp_waifu_queue import task_queue
+from mcp_waifu_queue.cache import cache_key, get_response_cache
+from mcp_waifu_queue.respond import generation_params
+
+
+def test_batch_is_enqueued_in_submission_order():
+    batch_id, job_ids = task_queue.add_batch_to_queue(["a", "b", "c"])
+    assert len(set(job_ids)) == 3
+    assert task_queue.get_queues()["default"].get_job_ids() == job_ids
+    assert task_queue.get_batch_status_from_queue(batch_id) == [(job_id, "queued", None) for job_id in job_ids]
+
+
+def test_batch_serves_cached_prompts_as_completed_jobs(configure):
+    configure(response_cache_enabled=True)
+    get_response_cache().set(cache_key("b", **generation_params()), "cached")
+    batch_id, job_ids = task_queue.add_batch_to_queue(["a", "b"])
+    statuses = task_queue.get_batch_status_from_queue(batch_id)
+    assert [status[1:] for status in statuses] == [("queued", None), ("completed", "cached")]
+    assert task_queue.get_queues()["default"].get_job_ids() == job_ids[:1]
+
+
+def test_batch_size_is_bounded(configure):
+    configure(max_batch_size=2)
+    with pytest.raises(ValueError):
+        task_queue.add_batch_to_queue([])
+    with pytest.raises(ValueError):
+        task_queue.add_batch_to_queue(["a", "b", "c"])
+
+
+def test_unknown_batch_is_rejected():
+    with pytest.raises(ValueError):
+        task_queue.get_batch_status_from_queue("missing")
+
+
+@pytest.mark.asyncio
+async def test_async_batch_matches_sync():
+    batch_id, job_ids = await task_queue.aadd_batch_to_queue(["a", "b"], lane="bulk")
+    assert task_queue.get_queues()["bulk"].get_job_ids() == job_ids
+    assert await task_queue.aget_batch_status_from_queue(batch_id) == task_queue.get_batch_status_from_queue(batch_id)
@@ -0,0 +1,65 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from mcp_waifu_queue import benchmark
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_percentiles_use_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert [benchmark.percentile(values, q) for q in (50, 95, 99, 100)] == [50, 95, 99, 100]
+    assert benchmark.percentile([], 50) is None
+    assert benchmark.summarize([0.001, 0.003]) == {
+        "count": 2,
+        "mean_ms": 2.0,
+        "p50_ms": 1.0,
+        "p95_ms": 3.0,
+        "p99_ms": 3.0,
+        "max_ms": 3.0,
+    }
+
+
+def test_compare_reports_percentage_changes():
+    baseline = {"throughput_jobs_per_second": 10.0, "stages": {"enqueue": {"p50_ms": 2.0}}}
+    report = {"throughput_jobs_per_second": 12.0, "stages": {"enqueue": {"p50_ms": 1.0}}}
+    lines = benchmark.compare(report, baseline).splitlines()
+    assert "throughput_jobs_per_second: 10.0 -> 12.0 (+20.0%)" in lines
+    assert "enqueue.p50_ms: 2.0 -> 1.0 (-50.0%)" in lines
+
+
+def test_mock_provider_injects_errors_at_the_configured_rates():
+    mock = benchmark.MockOpenRouter(error_rate=0.2, throttle_rate=0.1, seed=7)
+    outcomes = [mock.outcome() for _ in range(5000)]
+    assert outcomes.count(429) / 5000 == pytest.approx(0.1, abs=0.02)
+    assert outcomes.count(503) / 5000 == pytest.approx(0.2, abs=0.02)
+    assert mock.counts["requests"] == 5000
+
+
+def test_worker_none_needs_a_real_redis():
+    with pytest.raises(SystemExit):
+        benchmark.parse_args(["--worker", "none"])
+
+
+@pytest.mark.parametrize("worker", ["async", "rq"])
+def test_benchmark_runs_end_to_end(tmp_path, worker):
+    output = tmp_path / "report.json"
+    args = ["--jobs", "10", "--rate", "100", "--latency-ms", "5", "--seed", "1", "--worker", worker]
+    done = subprocess.run(
+        [sys.executable, "-m", "mcp_waifu_queue.benchmark", *args, "--output", str(output)],
+        cwd=tmp_path,
+        env=dict(os.environ, PYTHONPATH=str(ROOT), HOME=str(tmp_path)),
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert done.returncode == 0, done.stderr
+    report = json.loads(output.read_text())
+    assert report["jobs"] == {"submitted": 10, "completed": 10, "failed": 0, "timeout": 0}
+    assert report["stages"]["end_to_end"]["count"] == 10
+    assert report["mock_provider"]["requests"] == 10
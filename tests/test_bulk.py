@@ -0,0 +1,100 @@
+import asyncio
+import json
+import os
+
+import pytest
+import pytest_asyncio
+import redis
+
+from mcp_waifu_queue import bulk, task_queue
+from mcp_waifu_queue.async_worker import AsyncWorker
+from mcp_waifu_queue.bulk import Checkpoint
+
+
+@pytest_asyncio.fixture
+async def worker(configure, connection):
+    configure(default_provider="local")
+    worker = AsyncWorker(list(task_queue.get_queues().values()), connection, concurrency=4)
+    task = asyncio.create_task(worker.run())
+    yield worker
+    worker.request_stop()
+    await task
+
+
+@pytest.fixture
+def files(tmp_path):
+    def write(*lines: str) -> tuple[str, str]:
+        source = tmp_path / "prompts.jsonl"
+        source.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+        return str(source), str(tmp_path / "results.jsonl")
+
+    return write
+
+
+def arguments(source: str, output: str, *options: str):
+    return bulk.parse_args([source, output, "--concurrency", "2", "--chunk-size", "2", *options])
+
+
+def rows(output: str) -> dict[int, dict]:
+    with open(output, encoding="utf-8") as f:
+        return {row["index"]: row for row in map(json.loads, f)}
+
+
+def prompt(text: str, **extra) -> str:
+    return json.dumps({"prompt": text, **extra})
+
+
+@pytest.mark.asyncio
+async def test_rows_are_generated_and_the_checkpoint_removed(worker, files):
+    source, output = files(prompt("a", id="first"), "", "not json", prompt("b"), prompt("c"))
+    counts = await bulk.run(arguments(source, output))
+    assert counts == {"completed": 3, "failed": 0, "invalid": 1, "errors": 0}
+    results = rows(output)
+    assert sorted(results) == [0, 2, 3, 4]
+    assert (results[0]["id"], results[0]["result"]) == ("first", "[stub] a")
+    assert results[2]["status"] == "invalid"
+    assert not os.path.exists(output + ".checkpoint")
+
+
+@pytest.mark.asyncio
+async def test_resume_reattaches_to_jobs_in_flight(worker, files):
+    source, output = files(*(prompt(text) for text in "abcde"))
+    finished = [{"index": i, "job_id": f"old-{i}", "status": "completed", "result": "kept"} for i in (0, 1, 3)]
+    kept = "".join(json.dumps(row) + "\n" for row in finished)
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(kept + '{"index": 4, "partial')  # Written after the last checkpoint.
+    in_flight = task_queue.add_to_queue("c", lane="bulk")
+    checkpoint = Checkpoint(output + ".checkpoint", source)
+    checkpoint.watermark, checkpoint.done, checkpoint.inflight = 2, {3}, {2: in_flight}
+    checkpoint.save(len(kept.encode()))
+
+    counts = await bulk.run(arguments(source, output))
+    results = rows(output)
+    assert counts == {"completed": 2, "failed": 0, "invalid": 0, "errors": 0}
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    assert (results[2]["job_id"], results[2]["result"]) == (in_flight, "[stub] c")
+    assert results[4]["result"] == "[stub] e"
+
+
+@pytest.mark.asyncio
+async def test_untracked_row_keeps_the_checkpoint_and_fails_the_run(worker, files, monkeypatch):
+    source, output = files(*(prompt(text) for text in "abcd"))
+    status = bulk.aget_job_status_from_queue
+
+    async def flaky_status(job_id):
+        if flaky_status.calls == 0:
+            flaky_status.calls += 1
+            raise redis.ConnectionError("Redis went away")
+        return await status(job_id)
+
+    flaky_status.calls = 0
+    monkeypatch.setattr(bulk, "aget_job_status_from_queue", flaky_status)
+    counts = await bulk.run(arguments(source, output))
+    assert counts["errors"] == 1
+    with open(output + ".checkpoint", encoding="utf-8") as f:
+        assert len(json.load(f)["inflight"]) == 1
+    monkeypatch.setattr(bulk, "aget_job_status_from_queue", status)
+    counts = await bulk.run(arguments(source, output))
+    assert counts["errors"] == 0
+    assert sorted(rows(output)) == [0, 1, 2, 3]
+    assert not os.path.exists(output + ".checkpoint")
@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+from mcp_waifu_queue import task_queue, utils
+from mcp_waifu_queue.cache import (
+    ResponseCache,
+    cache_key,
+    fingerprint,
+    get_response_cache,
+)
+from mcp_waifu_queue.providers import router
+from mcp_waifu_queue.respond import generation_params
+
+
+@pytest.fixture
+def cache(connection, async_connection):
+    return ResponseCache(connection, ttl_seconds=100, max_entries=3, max_entry_bytes=64, async_connection=async_connection)
+
+
+def test_fingerprint_covers_every_generation_input():
+    base = fingerprint("hi", "m", 0.2, 100)
+    assert fingerprint("hi", "m", 0.2, 100) == base
+    assert fingerprint("hi!", "m", 0.2, 100) != base
+    assert fingerprint("hi", "other", 0.2, 100) != base
+    assert fingerprint("hi", "m", 0.3, 100) != base
+    assert fingerprint("hi", "m", 0.2, 101) != base
+    assert fingerprint("hi", "m", 0.2, 100, ["\n"]) != base
+
+
+def test_get_and_set_count_hits_and_misses(cache):
+    key = cache_key("hi", "m", 0.2, 100)
+    assert cache.get(key) is None
+    assert cache.set(key, "hello")
+    assert cache.get(key) == "hello"
+    assert cache.stats() == {"hits": 1, "misses": 1, "stores": 1, "evictions": 0, "entries": 1}
+
+
+def test_hit_renews_ttl(cache, connection):
+    key = cache_key("hi", "m", 0.2, 100)
+    cache.set(key, "hello")
+    connection.expire(key, 5)
+    cache.get(key)
+    assert connection.ttl(key) > 5
+
+
+def test_least_recently_used_entry_is_evicted(cache, connection):
+    keys = [cache_key(f"p{i}", "m", 0.2, 100) for i in range(4)]
+    for key in keys[:3]:
+        cache.set(key, "x")
+    connection.zadd("waifu:cache:lru", {keys[1]: time.time() - 50})  # Least recently read.
+    cache.set(keys[3], "x")
+    assert cache.get(keys[1]) is None
+    assert [cache.get(key) for key in (keys[0], keys[2], keys[3])] == ["x", "x", "x"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_oversized_entries_are_not_stored(cache):
+    key = cache_key("hi", "m", 0.2, 100)
+    assert not cache.set(key, "x" * 65)
+    assert cache.get(key) is None
+
+
+@pytest.mark.asyncio
+async def test_async_get_matches_sync(cache):
+    key = cache_key("hi", "m", 0.2, 100)
+    cache.set(key, "hello")
+    assert await cache.aget_many([key, key + "-missing"]) == ["hello", None]
+    assert (await cache.astats())["hits"] == 1
+
+
+def test_cached_prompt_completes_without_a_worker(configure):
+    configure(response_cache_enabled=True)
+    get_response_cache().set(cache_key("hi", **generation_params()), "cached")
+    job_id = task_queue.add_to_queue("hi")
+    assert task_queue.get_job_status_from_queue(job_id) == ("completed", "cached")
+    assert task_queue.get_queues()[task_queue.config.default_lane].count == 0
+
+
+def test_completion_is_keyed_on_the_served_model(configure, monkeypatch):
+    configure(response_cache_enabled=True)
+
+    def failover(request, on_chunk=None, params=None):
+        router._served_model.set("backup/model")
+        return "from backup"
+
+    monkeypatch.setattr(utils, "predict_response", failover)
+    assert utils.call_predict_response("hi") == "from backup"
+    cache = get_response_cache()
+    assert cache.get(cache_key("hi", **generation_params({"model": "backup/model"}))) == "from backup"
+    assert cache.get(cache_key("hi", **generation_params())) is None
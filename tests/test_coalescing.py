@@ -0,0 +1,40 @@
+import pytest
+from rq.job import Job
+
+from mcp_waifu_queue import task_queue
+
+
+@pytest.fixture(autouse=True)
+def coalescing(configure):
+    return configure(request_coalescing_enabled=True)
+
+
+def finish(job_id: str) -> None:
+    job = Job.fetch(job_id, connection=task_queue.get_connection(), serializer=task_queue.serializer)
+    job.set_status("finished")
+
+
+def test_identical_pending_prompts_share_a_job():
+    first = task_queue.add_to_queue("hello")
+    assert task_queue.add_to_queue("hello") == first
+    assert task_queue.get_queues()["default"].count == 1
+
+
+def test_finished_job_is_not_joined():
+    first = task_queue.add_to_queue("hello")
+    finish(first)
+    assert task_queue.add_to_queue("hello") != first
+
+
+def test_lanes_params_and_sessions_are_not_coalesced():
+    first = task_queue.add_to_queue("hello")
+    assert task_queue.add_to_queue("hello", lane="bulk") != first
+    assert task_queue.add_to_queue("hello", params={"temperature": 0.9}) != first
+    assert task_queue.add_to_queue("hello", session_id="s1") != first
+
+
+@pytest.mark.asyncio
+async def test_async_enqueue_joins_sync_job():
+    first = task_queue.add_to_queue("hello")
+    assert await task_queue.aadd_to_queue("hello") == first
+    assert await task_queue.aadd_to_queue("other") != first
@@ -0,0 +1,82 @@
+import json
+
+import httpx
+import pytest
+from mcp.server.fastmcp.exceptions import ToolError
+
+from mcp_waifu_queue import task_queue
+from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.providers import openrouter
+from mcp_waifu_queue.respond import check_generation_params, generation_params
+from mcp_waifu_queue.worker import NotifyingSimpleWorker
+
+
+def test_unset_params_take_the_server_defaults(configure):
+    configure(default_provider="local", max_new_tokens=64)
+    assert generation_params() == {"model": "stub", "max_tokens": 64, "temperature": 0.2}
+    assert generation_params({"model": "m", "max_tokens": 8, "temperature": 0.0, "stop": ("\n",)}) == {
+        "model": "m",
+        "max_tokens": 8,
+        "temperature": 0.0,
+        "stop": ["\n"],
+    }
+
+
+def test_params_are_checked_against_the_server_caps(configure):
+    config = configure(
+        default_provider="local",
+        max_tokens_limit=100,
+        max_new_tokens=50,
+        max_stop_sequences=2,
+        allowed_models='["listed"]',
+        provider_backends='["local", "openrouter:routed"]',
+    )
+    check_generation_params({"max_tokens": 100, "stop": ["a", "b"]}, config)
+    for model in ("listed", "routed", "stub"):
+        check_generation_params({"model": model}, config)
+    with pytest.raises(ValueError, match="exceeds the server limit"):
+        check_generation_params({"max_tokens": 101}, config)
+    with pytest.raises(ValueError, match="At most 2 stop sequences"):
+        check_generation_params({"stop": ["a", "b", "c"]}, config)
+    with pytest.raises(ValueError, match="not allowed"):
+        check_generation_params({"model": "other"}, Config.load())
+
+
+@pytest.mark.asyncio
+async def test_request_params_reach_the_provider(configure, call_tool, connection):
+    configure(default_provider="local", response_cache_enabled=True)
+    prompt = "one two three four five"
+    limited = await call_tool("generate_text", prompt=prompt, max_tokens=3)
+    stopped = await call_tool("generate_text", prompt=prompt, stop=[" four"])
+    unlimited = await call_tool("generate_text", prompt=prompt)
+    assert len({limited["job_id"], stopped["job_id"], unlimited["job_id"]}) == 3
+    queue = task_queue.get_queues()["default"]
+    NotifyingSimpleWorker([queue], connection=connection, serializer=queue.serializer).work(burst=True)
+
+    results = [task_queue.get_job_status_from_queue(job["job_id"])[1] for job in (limited, stopped, unlimited)]
+    assert results == ["[stub] one two", "[stub] one two three", "[stub] one two three four five"]
+
+
+@pytest.mark.asyncio
+async def test_requests_over_the_caps_are_rejected(configure, call_tool):
+    configure(default_provider="local", max_tokens_limit=100, max_new_tokens=50)
+    with pytest.raises(ToolError, match="exceeds the server limit"):
+        await call_tool("generate_text", prompt="hi", max_tokens=1000)
+    with pytest.raises(ToolError, match="not allowed"):
+        await call_tool("generate_text", prompt="hi", model="someone/else")
+
+
+def test_direct_openrouter_calls_are_bounded(configure, monkeypatch):
+    configure(max_new_tokens=64)
+    payloads = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payloads.append(json.loads(request.content))
+        return httpx.Response(200, json={"choices": [{"message": {"content": "hi"}}]})
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr("mcp_waifu_queue.providers.openrouter.get_client", lambda: client)
+    monkeypatch.setenv("OPENROUTER_API_KEY", "key")
+    assert openrouter.generate("hello", "some/model") == "hi"
+    assert openrouter.generate("hello", "some/model", max_tokens=8, stop=["\n"], temperature=0.0) == "hi"
+    assert [(p["max_tokens"], p.get("stop"), p["temperature"]) for p in payloads] == [(64, None, 0.2), (8, ["\n"], 0.0)]
@@ -0,0 +1,51 @@
+import httpx
+import pytest
+
+from mcp_waifu_queue import http_client
+from mcp_waifu_queue.providers.openrouter import OpenRouterProvider
+
+
+def test_client_is_shared_across_calls():
+    assert http_client.get_client() is http_client.get_client()
+    http_client.close()
+
+
+def test_client_is_rebuilt_after_fork(monkeypatch):
+    parent = http_client.get_client()
+    monkeypatch.setattr(http_client, "_client_pid", -1)
+    assert http_client.get_client() is not parent
+    http_client.close()
+
+
+def test_request_timeout_keeps_pooled_connect_timeout(configure):
+    configure(http_connect_timeout_seconds=3)
+    timeout = http_client.request_timeout(45)
+    assert timeout.connect == 3
+    assert timeout.read == 45
+
+
+def test_openrouter_reuses_pooled_client(monkeypatch):
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        return httpx.Response(200, json={"choices": [{"message": {"content": "hi"}}]})
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_client, "get_client", lambda: client)
+    monkeypatch.setattr("mcp_waifu_queue.providers.openrouter.get_client", lambda: client)
+    monkeypatch.setenv("OPENROUTER_API_KEY", "key")
+
+    provider = OpenRouterProvider()
+    assert provider.generate("hello", "some/model", timeout=5) == "hi"
+    assert provider.generate("again", "some/model", timeout=5) == "hi"
+    assert len(seen) == 2
+    assert seen[0].headers["Authorization"] == "Bearer key"
+    assert seen[0].extensions["timeout"]["connect"] == http_client.request_timeout(5).connect
+
+
+@pytest.mark.asyncio
+async def test_async_client_is_shared_within_a_loop():
+    client = http_client.get_async_client()
+    assert http_client.get_async_client() is client
+    await http_client.aclose()
@@ -0,0 +1,65 @@
+import pytest
+import redis
+from rq.exceptions import NoSuchJobError
+from rq.job import Job, JobStatus
+
+from mcp_waifu_queue import task_queue
+
+
+@pytest.fixture
+def jobs():
+    queue = task_queue.get_queues()["default"]
+    completed = task_queue._completed_job("done", "the result", queue, 60).id
+    failed = task_queue.add_to_queue("fails")
+    Job.fetch(failed, connection=task_queue.get_connection(), serializer=task_queue.serializer).set_status(
+        JobStatus.FAILED
+    )
+    return {"completed": completed, "failed": failed, "queued": task_queue.add_to_queue("waits")}
+
+
+@pytest.fixture
+def round_trips(monkeypatch):
+    """Counts commands and pipelines sent on synchronous clients."""
+    counts = {"commands": 0, "pipelines": 0}
+    execute_command, execute = redis.Redis.execute_command, redis.client.Pipeline.execute
+
+    def count_command(self, *args, **kwargs):
+        counts["commands"] += 1
+        return execute_command(self, *args, **kwargs)
+
+    def count_pipeline(self, *args, **kwargs):
+        counts["pipelines"] += 1
+        return execute(self, *args, **kwargs)
+
+    monkeypatch.setattr(redis.Redis, "execute_command", count_command)
+    monkeypatch.setattr(redis.client.Pipeline, "execute", count_pipeline)
+    return counts
+
+
+def test_many_statuses_are_read_in_one_round_trip(jobs, round_trips):
+    job_ids = [jobs["completed"], jobs["failed"], jobs["queued"], "missing"]
+    statuses = task_queue.get_job_status_many_from_queue(job_ids)
+    assert statuses == [("completed", "the result"), ("failed", None), ("queued", None), ("unknown", None)]
+    assert round_trips == {"commands": 0, "pipelines": 1}
+
+
+def test_single_status_raises_for_unknown_jobs(jobs):
+    assert task_queue.get_job_status_from_queue(jobs["completed"]) == ("completed", "the result")
+    with pytest.raises(NoSuchJobError):
+        task_queue.get_job_status_from_queue("missing")
+
+
+def test_detail_is_read_in_one_round_trip(jobs, round_trips):
+    detail = task_queue.get_job_detail_from_queue(jobs["queued"])
+    assert (detail["status"], detail["lane"], detail["retries"]) == ("queued", "default", 0)
+    assert detail["timestamps"]["enqueued_at"] is not None
+    assert round_trips == {"commands": 0, "pipelines": 1}
+
+
+@pytest.mark.asyncio
+async def test_async_statuses_match_sync(jobs):
+    job_ids = list(jobs.values())
+    assert await task_queue.aget_job_status_many_from_queue(job_ids) == task_queue.get_job_status_many_from_queue(
+        job_ids
+    )
+    assert await task_queue.aget_job_statuses_from_queue(job_ids) == ["completed", "failed", "queued"]
@@ -0,0 +1,79 @@
+import asyncio
+import collections
+import random
+
+import pytest
+from rq import Queue
+
+from mcp_waifu_queue import async_worker
+from mcp_waifu_queue.async_worker import AsyncWorker
+from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.lanes import resolve_lane, weighted_order
+from mcp_waifu_queue.worker import NotifyingSimpleWorker
+
+WEIGHTS = {"interactive": 8, "default": 3, "bulk": 1}
+
+
+def test_resolve_lane_defaults_and_rejects_unknown_lanes():
+    config = Config.load()
+    assert resolve_lane(None, config) == config.default_lane
+    assert resolve_lane("bulk", config) == "bulk"
+    with pytest.raises(ValueError, match="Unknown lane"):
+        resolve_lane("vip", config)
+
+
+def test_first_lane_is_drawn_in_proportion_to_its_weight():
+    rng = random.Random(42)
+    draws = 20000
+    firsts = collections.Counter(weighted_order(list(WEIGHTS), list(WEIGHTS.values()), rng)[0] for _ in range(draws))
+    total = sum(WEIGHTS.values())
+    for lane, weight in WEIGHTS.items():
+        assert firsts[lane] / draws == pytest.approx(weight / total, abs=0.02)
+
+
+def test_zero_weight_lanes_go_last():
+    for _ in range(50):
+        assert weighted_order(["off", "on"], [0, 1])[-1] == "off"
+
+
+@pytest.fixture
+def lanes(connection):
+    # The low-weight lane is listed first, where RQ alone would always serve it first.
+    return {name: Queue(name, connection=connection) for name in ("bulk", "interactive")}
+
+
+def enqueue_interleaved(lanes: dict, func: str, count: int) -> dict:
+    jobs = {}
+    for i in range(count):
+        for name, queue in lanes.items():
+            jobs[queue.enqueue(func, f"{name}-{i}").id] = name
+    return jobs
+
+
+def lanes_in_completion_order(lanes: dict, jobs: dict) -> list[str]:
+    finished = [job for queue in lanes.values() for job in queue.finished_job_registry.get_job_ids()]
+    fetched = [lanes[jobs[job_id]].fetch_job(job_id) for job_id in finished]
+    return [jobs[job.id] for job in sorted(fetched, key=lambda job: job.ended_at)]
+
+
+def test_rq_worker_serves_lanes_by_weight(monkeypatch, connection, lanes):
+    monkeypatch.setattr(NotifyingSimpleWorker, "lane_weights", {"interactive": 1, "bulk": 0})
+    jobs = enqueue_interleaved(lanes, "builtins.len", 3)
+    NotifyingSimpleWorker(list(lanes.values()), connection=connection).work(burst=True)
+    assert lanes_in_completion_order(lanes, jobs) == ["interactive"] * 3 + ["bulk"] * 3
+
+
+@pytest.mark.asyncio
+async def test_async_worker_serves_lanes_by_weight(monkeypatch, connection, lanes):
+    async def generate(prompt, job_id=None):
+        return prompt
+
+    monkeypatch.setitem(async_worker.ASYNC_FUNCS, "tests.generate", generate)
+    jobs = enqueue_interleaved(lanes, "tests.generate", 3)
+    worker = AsyncWorker(list(lanes.values()), connection, concurrency=1, lane_weights={"interactive": 1, "bulk": 0})
+    task = asyncio.create_task(worker.run())
+    while sum(queue.finished_job_registry.count for queue in lanes.values()) < len(jobs):
+        await asyncio.sleep(0.05)
+    worker.request_stop()
+    await task
+    assert lanes_in_completion_order(lanes, jobs) == ["interactive"] * 3 + ["bulk"] * 3
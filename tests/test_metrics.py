@@ -0,0 +1,55 @@
+import pytest
+from prometheus_client import REGISTRY
+from rq import Queue
+
+from mcp_waifu_queue import main, metrics
+from mcp_waifu_queue.errors import ProviderError, ProviderThrottledError
+from mcp_waifu_queue.worker import NotifyingSimpleWorker
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_provider_call_records_outcome_ttft_and_tokens():
+    labels = {"provider": "test", "model": "m"}
+    before = {
+        outcome: sample("waifu_provider_requests_total", **labels, outcome=outcome)
+        for outcome in ("ok", "throttled", "error")
+    }
+    ttft = sample("waifu_provider_ttft_seconds_count", **labels)
+    call = metrics.ProviderCall("test", "m")
+    on_chunk = call.wrap(lambda text: None)
+    on_chunk("a")
+    on_chunk("b")
+    call.finish(prompt_tokens=3, completion_tokens=5)
+    metrics.ProviderCall("test", "m").finish(ProviderThrottledError("429"))
+    metrics.ProviderCall("test", "m").finish(ProviderError("500", status_code=500))
+
+    for outcome in before:
+        assert sample("waifu_provider_requests_total", **labels, outcome=outcome) == before[outcome] + 1
+    assert sample("waifu_provider_ttft_seconds_count", **labels) == ttft + 1
+    assert sample("waifu_provider_tokens_total", **labels, kind="completion") >= 5
+
+
+@pytest.mark.asyncio
+async def test_tools_record_requests_and_expose_queue_depth(call_tool):
+    requests = sample("waifu_requests_total", lane="default", kind="batch")
+    await call_tool("generate_text_batch", prompts=["a", "b", "c"])
+    assert sample("waifu_requests_total", lane="default", kind="batch") == requests + 3
+    response = await main.get_metrics(None)
+    assert b'waifu_queue_depth{lane="default"} 3.0' in response.body
+    assert response.media_type.startswith("text/plain")
+
+
+def test_worker_records_queue_wait_and_outcomes(connection):
+    completed = sample("waifu_jobs_total", lane="metrics", outcome="completed")
+    failed = sample("waifu_jobs_total", lane="metrics", outcome="failed")
+    waits = sample("waifu_queue_wait_seconds_count", lane="metrics")
+    queue = Queue("metrics", connection=connection)
+    queue.enqueue("builtins.len", "abc")
+    queue.enqueue("builtins.len", 1)
+    NotifyingSimpleWorker([queue], connection=connection).work(burst=True)
+    assert sample("waifu_jobs_total", lane="metrics", outcome="completed") == completed + 1
+    assert sample("waifu_jobs_total", lane="metrics", outcome="failed") == failed + 1
+    assert sample("waifu_queue_wait_seconds_count", lane="metrics") == waits + 2
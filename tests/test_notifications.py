@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+
+from mcp_waifu_queue import main
+from mcp_waifu_queue.cache import cache_key, get_response_cache
+from mcp_waifu_queue.notifications import (
+    COMPLETION_CHANNEL,
+    CompletionListener,
+    publish_completion,
+)
+from mcp_waifu_queue.respond import generation_params
+
+
+@pytest_asyncio.fixture
+async def listener():
+    statuses = {}
+
+    async def lookup(job_ids):
+        return [statuses.get(job_id, "queued") for job_id in job_ids]
+
+    listener = CompletionListener("redis://test", lookup)
+    listener.statuses = statuses
+    yield listener
+    await listener.close()
+
+
+async def publish_soon(connection, job_id: str, status: str, *raw: str) -> None:
+    await asyncio.sleep(0.1)
+    for message in raw:
+        connection.publish(COMPLETION_CHANNEL, message)
+    publish_completion(connection, job_id, status)
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_woken_by_the_completion(listener, connection):
+    waiters = [asyncio.create_task(listener.wait("job", timeout=5)) for _ in range(3)]
+    await publish_soon(connection, "job", "completed")
+    assert await asyncio.gather(*waiters) == ["completed"] * 3
+    assert listener._waiters == {}
+
+
+@pytest.mark.asyncio
+async def test_finished_job_returns_without_waiting(listener):
+    listener.statuses["job"] = "failed"
+    assert await asyncio.wait_for(listener.wait("job", timeout=30), timeout=2) == "failed"
+
+
+@pytest.mark.asyncio
+async def test_timeout_returns_the_current_status(listener):
+    assert await listener.wait("job", timeout=0.2) == "queued"
+
+
+@pytest.mark.asyncio
+async def test_unknown_job_returns_without_waiting(listener):
+    listener.statuses["gone"] = "unknown"
+    assert await asyncio.wait_for(listener.wait("gone", timeout=30), timeout=2) == "unknown"
+    assert listener._task is None  # Not even subscribed.
+
+
+@pytest.mark.asyncio
+async def test_one_timeout_covers_the_subscription_and_the_wait(listener, monkeypatch):
+    ensure_started = listener._ensure_started
+
+    async def slow_start():
+        await asyncio.sleep(0.3)
+        await ensure_started()
+
+    monkeypatch.setattr(listener, "_ensure_started", slow_start)
+    started = time.monotonic()
+    assert await listener.wait("job", timeout=0.5) == "queued"
+    assert time.monotonic() - started < 0.7
+
+
+@pytest.mark.asyncio
+async def test_malformed_messages_do_not_stop_the_listener(listener, connection):
+    waiter = asyncio.create_task(listener.wait("job", timeout=5))
+    await publish_soon(connection, "job", "completed", "not json", '{"status": "completed"}', "[]")
+    assert await waiter == "completed"
+
+
+@pytest.mark.asyncio
+async def test_wait_for_job_returns_status_result_and_timings(configure, call_tool):
+    configure(response_cache_enabled=True)
+    get_response_cache().set(cache_key("hi", **generation_params()), "cached")
+    try:
+        job_id = (await call_tool("generate_text", prompt="hi"))["job_id"]
+        response = await call_tool("wait_for_job", job_id=job_id, timeout_seconds=1)
+    finally:
+        await main.completion_listener.close()
+    assert (response["status"], response["result"]) == ("completed", "cached")
+    assert response["timings"]["finished_at"] is not None
+    assert "total" in response["timings"]["durations"]
@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+import pytest
+from rq import Queue, Retry
+from rq.job import JobStatus
+
+from mcp_waifu_queue import async_worker, utils
+from mcp_waifu_queue.async_worker import AsyncWorker
+from mcp_waifu_queue.errors import ProviderError, ProviderThrottledError
+from mcp_waifu_queue.ratelimit import RateLimiter
+
+
+@pytest.fixture
+def limiter(connection, async_connection):
+    def build(**options):
+        options.setdefault("max_wait_seconds", 0)
+        return RateLimiter(connection, async_connection=async_connection, **options)
+
+    return build
+
+
+def limit(connection) -> float:
+    return float(connection.hget("waifu:ratelimit:default:state", "limit"))
+
+
+def test_requests_per_minute_bucket(limiter):
+    rate_limiter = limiter(requests_per_minute=2)
+    rate_limiter.release(rate_limiter.acquire())
+    rate_limiter.release(rate_limiter.acquire())
+    with pytest.raises(ProviderThrottledError) as raised:
+        rate_limiter.acquire()
+    assert 25 <= raised.value.retry_after <= 30
+
+
+def test_tokens_per_minute_bucket_charges_completions(limiter):
+    rate_limiter = limiter(tokens_per_minute=600)
+    with rate_limiter.slot(100) as slot:
+        slot.charge(450)
+    with pytest.raises(ProviderThrottledError) as raised:
+        rate_limiter.acquire(100)
+    assert raised.value.retry_after == pytest.approx(5, abs=0.5)
+
+
+def test_concurrency_is_bounded_by_leases(limiter):
+    rate_limiter = limiter(max_concurrency=1, lease_seconds=0.2)
+    held = rate_limiter.acquire()
+    with pytest.raises(ProviderThrottledError):
+        rate_limiter.acquire()
+    rate_limiter.release(held)
+    rate_limiter.acquire()  # Never released: its lease expires instead.
+    time.sleep(0.3)
+    rate_limiter.acquire()
+
+
+def test_limit_grows_on_success_and_halves_on_server_errors(limiter, connection):
+    rate_limiter = limiter(min_concurrency=1, max_concurrency=8)
+    with pytest.raises(ProviderError), rate_limiter.slot():
+        raise ProviderError("upstream", status_code=503)
+    assert limit(connection) == 4
+    with rate_limiter.slot():
+        pass
+    assert limit(connection) == pytest.approx(4.25)
+    with pytest.raises(ValueError), rate_limiter.slot():
+        raise ValueError("local failure")
+    assert limit(connection) == pytest.approx(4.25)
+
+
+def test_throttle_pauses_admissions_for_retry_after(limiter):
+    rate_limiter = limiter()
+    with pytest.raises(ProviderThrottledError), rate_limiter.slot():
+        raise ProviderThrottledError("429", retry_after=10)
+    with pytest.raises(ProviderThrottledError) as raised:
+        rate_limiter.acquire()
+    assert 9 <= raised.value.retry_after <= 10
+
+
+@pytest.mark.asyncio
+async def test_async_slot_shares_the_sync_state(limiter):
+    rate_limiter = limiter(requests_per_minute=1)
+    async with rate_limiter.aslot():
+        pass
+    with pytest.raises(ProviderThrottledError):
+        rate_limiter.acquire()
+
+
+def test_throttled_job_retries_after_retry_after(configure):
+    configure(rate_limit_max_requeues=3, provider_retry_max_delay_seconds=7)
+    retry = utils._throttled_retry(ProviderThrottledError("429", retry_after=1.2))
+    assert (retry.max, retry.intervals) == (3, [2])
+    assert utils._throttled_retry(ProviderThrottledError("429")).intervals == [7]
+
+
+@pytest.mark.asyncio
+async def test_async_worker_schedules_throttled_retries(monkeypatch, connection):
+    calls = []
+
+    async def generate(prompt, job_id=None):
+        calls.append(time.monotonic())
+        return Retry(max=2, interval=1)
+
+    monkeypatch.setitem(async_worker.ASYNC_FUNCS, "tests.generate", generate)
+    queue = Queue("default", connection=connection)
+    job = queue.enqueue("tests.generate", "p")
+    worker = AsyncWorker([queue], connection)
+    task = asyncio.create_task(worker.run())
+    seen = set()
+    while (status := job.get_status(refresh=True)) != JobStatus.FAILED:
+        seen.add(status)
+        await asyncio.sleep(0.05)
+    worker.request_stop()
+    await task
+    assert len(calls) == 3
+    assert JobStatus.SCHEDULED in seen
+    assert calls[1] - calls[0] >= 0.9
+    job.refresh()
+    assert job.number_of_retries == 2
@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from mcp_waifu_queue.errors import ProviderError, ProviderThrottledError
+from mcp_waifu_queue.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientCaller,
+    is_retryable,
+)
+
+
+def flaky(*failures: Exception, result: str = "ok"):
+    """A provider call that raises each failure in turn, then returns result."""
+    calls = []
+
+    def call():
+        calls.append(time.monotonic())
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return result
+
+    call.calls = calls
+    return call
+
+
+def test_retryable_failures_are_classified():
+    assert is_retryable(ProviderError("bad gateway", status_code=502))
+    assert is_retryable(ProviderError("timeout", status_code=408))
+    assert is_retryable(httpx.ConnectError("refused"))
+    assert not is_retryable(ProviderError("bad request", status_code=400))
+    assert not is_retryable(ProviderThrottledError("429"))
+    assert not is_retryable(ValueError("no choices"))
+
+
+def test_retries_transient_failures_with_backoff():
+    caller = ResilientCaller(max_attempts=3, base_delay=0.01, max_delay=0.05)
+    call = flaky(ProviderError("502", status_code=502), httpx.ReadTimeout("slow"))
+    assert caller.call(call) == "ok"
+    assert len(call.calls) == 3
+
+
+def test_permanent_failures_and_exhausted_retries_raise():
+    caller = ResilientCaller(max_attempts=2, base_delay=0.01)
+    call = flaky(ProviderError("400", status_code=400))
+    with pytest.raises(ProviderError, match="400"):
+        caller.call(call)
+    assert len(call.calls) == 1
+    call = flaky(*[ProviderError("503", status_code=503)] * 2)
+    with pytest.raises(ProviderError, match="503"):
+        caller.call(call)
+    assert len(call.calls) == 2
+
+
+def test_backoff_honors_retry_after_up_to_max_delay():
+    caller = ResilientCaller(base_delay=0.01, max_delay=4)
+    assert caller.backoff(1, ProviderError("503", status_code=503, retry_after=2)) >= 2
+    assert caller.backoff(1, ProviderError("503", status_code=503, retry_after=60)) == 4
+
+
+def test_circuit_opens_fails_fast_and_closes_after_a_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.1)
+    caller = ResilientCaller(max_attempts=1, breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(ProviderError):
+            caller.call(flaky(ProviderError("500", status_code=500)))
+    call = flaky()
+    with pytest.raises(CircuitOpenError):
+        caller.call(call)
+    assert (breaker.state, call.calls) == ("open", [])
+    time.sleep(0.15)
+    assert breaker.state == "half-open"
+    assert caller.call(call) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_failed_trial_reopens_the_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.1)
+    caller = ResilientCaller(max_attempts=1, breaker=breaker)
+    with pytest.raises(ProviderError):
+        caller.call(flaky(ProviderError("500", status_code=500)))
+    time.sleep(0.15)
+    with pytest.raises(ProviderError):
+        caller.call(flaky(ProviderError("500", status_code=500)))
+    assert breaker.state == "open"
+
+
+def hedging_caller() -> ResilientCaller:
+    caller = ResilientCaller(hedge_enabled=True, hedge_min_samples=1, hedge_min_delay=0.05)
+    caller.latency.record(0.05)
+    return caller
+
+
+def test_slow_call_is_hedged():
+    caller = hedging_caller()
+    calls = []
+
+    def call():
+        calls.append(None)
+        time.sleep(1 if len(calls) == 1 else 0)
+        return f"answer {len(calls)}"
+
+    started = time.monotonic()
+    assert caller.call(call, hedge=True) == "answer 2"
+    assert time.monotonic() - started < 0.5
+
+
+@pytest.mark.asyncio
+async def test_async_hedge_cancels_the_slower_request():
+    caller = hedging_caller()
+    calls, cancelled = [], []
+
+    async def call():
+        calls.append(None)
+        attempt = len(calls)
+        try:
+            await asyncio.sleep(1 if attempt == 1 else 0)
+        except asyncio.CancelledError:
+            cancelled.append(attempt)
+            raise
+        return f"answer {attempt}"
+
+    assert await caller.acall(call, hedge=True) == "answer 2"
+    await asyncio.sleep(0)
+    assert cancelled == [1]
+
+
+def test_hedging_waits_for_enough_history():
+    caller = ResilientCaller(hedge_enabled=True, hedge_min_samples=3)
+    caller.latency.record(0.1)
+    assert caller.hedge_delay() is None
+    caller.latency.record(0.2)
+    caller.latency.record(0.9)
+    assert caller.hedge_delay() == 0.9
@@ -0,0 +1,122 @@
+import pytest
+
+from mcp_waifu_queue.errors import ProviderError, ProviderThrottledError
+from mcp_waifu_queue.providers.base import Provider
+from mcp_waifu_queue.providers.router import (
+    Backend,
+    ProviderRouter,
+    parse_backend,
+    served_model,
+)
+
+
+class FakeProvider(Provider):
+    """Answers with its own name, or raises each queued failure in turn."""
+
+    rate_limited = False
+
+    def __init__(self, name: str, *failures: Exception):
+        self.name = name
+        self.failures = list(failures)
+        self.calls = []
+
+    def default_model(self) -> str:
+        return f"{self.name}-default"
+
+    def generate(self, prompt, model, timeout, on_chunk=None, options=None):
+        self.calls.append((model, options))
+        if self.failures:
+            raise self.failures.pop(0)
+        if on_chunk is not None:
+            on_chunk(self.name)
+        return self.name
+
+    async def agenerate(self, prompt, model, timeout, on_chunk=None, options=None):
+        self.calls.append((model, options))
+        if self.failures:
+            raise self.failures.pop(0)
+        if on_chunk is not None:
+            await on_chunk(self.name)
+        return self.name
+
+
+@pytest.fixture(autouse=True)
+def single_attempt(configure):
+    configure(provider_retry_max_attempts=1)
+
+
+def router(*backends: Backend, **options) -> ProviderRouter:
+    options.setdefault("explore_ratio", 0)
+    return ProviderRouter(list(backends), **options)
+
+
+def test_parse_backend_reads_an_optional_model():
+    assert (parse_backend("local").key, parse_backend("local").model) == ("local", "stub")
+    assert parse_backend("openrouter:openai/gpt-4o-mini").model == "openai/gpt-4o-mini"
+    with pytest.raises(ValueError, match="Unknown provider"):
+        parse_backend("nope")
+
+
+def test_fails_over_and_records_the_served_model():
+    failing = Backend(FakeProvider("a", ProviderError("500", status_code=500)), "model-a")
+    healthy = Backend(FakeProvider("b"))
+    provider_router = router(failing, healthy)
+    assert provider_router.call("hi") == "b"
+    assert served_model() == "b-default"
+    assert (failing.error_rate, healthy.error_rate) == (0.2, 0.0)
+    assert healthy.latency is not None
+
+
+def test_throttling_is_raised_when_every_backend_fails():
+    provider_router = router(
+        Backend(FakeProvider("a", ProviderError("400", status_code=400))),
+        Backend(FakeProvider("b", ProviderThrottledError("429", retry_after=3))),
+    )
+    with pytest.raises(ProviderThrottledError):
+        provider_router.call("hi")
+
+
+def test_ranks_by_latency_then_health():
+    slow, fast, unmeasured = (Backend(FakeProvider(name)) for name in ("slow", "fast", "new"))
+    provider_router = router(slow, fast, unmeasured, max_error_rate=0.5, unhealthy_cooldown=60)
+    provider_router.record(slow, 2.0)
+    provider_router.record(fast, 0.5)
+    assert provider_router.ranked() == [unmeasured, fast, slow]
+    for _ in range(5):
+        provider_router.record(fast)
+    assert provider_router.ranked() == [unmeasured, slow, fast]
+
+
+def test_unhealthy_backend_is_probed_after_the_cooldown():
+    backend = Backend(FakeProvider("a"))
+    provider_router = router(backend, max_error_rate=0.1, unhealthy_cooldown=0)
+    provider_router.record(backend)
+    assert provider_router.is_healthy(backend)
+    provider_router.unhealthy_cooldown = 60
+    assert not provider_router.is_healthy(backend)
+
+
+def test_streamed_call_does_not_fail_over():
+    class BrokenStream(FakeProvider):
+        def generate(self, prompt, model, timeout, on_chunk=None, options=None):
+            on_chunk("partial ")
+            raise ProviderError("connection reset", status_code=502)
+
+    fallback = FakeProvider("b")
+    chunks = []
+    with pytest.raises(ProviderError, match="reset"):
+        router(Backend(BrokenStream("a")), Backend(fallback)).call("hi", on_chunk=chunks.append)
+    assert (chunks, fallback.calls) == (["partial "], [])
+
+
+@pytest.mark.asyncio
+async def test_requested_model_selects_backends_serving_it():
+    first, second = FakeProvider("a"), FakeProvider("b")
+    provider_router = router(Backend(first, "small"), Backend(second, "large"))
+    options = {"max_tokens": 16, "temperature": 0.0}
+    assert await provider_router.acall("hi", model="large", options=options) == "b"
+    assert second.calls == [("large", options)]
+    # A model nobody serves runs on the primary backend's provider as an extra backend.
+    assert await provider_router.acall("hi", model="other") == "a"
+    assert first.calls[-1] == ("other", None)
+    assert [b["backend"] for b in provider_router.snapshot()] == ["a:small", "b:large", "a:other"]
@@ -0,0 +1,75 @@
+import base64
+import pickle
+
+import pytest
+from rq.job import Job
+
+from mcp_waifu_queue import serializer, task_queue
+from mcp_waifu_queue.serializer import CompactSerializer, get_serializer
+from mcp_waifu_queue.worker import NotifyingSimpleWorker
+
+VALUES = [
+    None,
+    "short",
+    "long completion " * 200,
+    {"prompt": "héllo", "params": {"max_tokens": 16, "temperature": 0.5, "stop": ["\n"]}},
+    ["a", 1, 2.5, True],
+]
+
+
+@pytest.mark.parametrize("compression", ["zlib", "none"])
+@pytest.mark.parametrize("value", VALUES)
+def test_json_values_round_trip(compression, value):
+    compact = CompactSerializer(compression=compression, threshold_bytes=64)
+    data = compact.dumps(value)
+    assert data[:1] in (b"j", b"z")
+    assert compact.loads(data) == value
+
+
+def test_large_payloads_are_compressed_and_small_ones_are_not():
+    compact = CompactSerializer(threshold_bytes=64)
+    assert compact.dumps("x" * 10).startswith(b"j")
+    assert compact.dumps("x" * 1000).startswith(b"z")
+    assert CompactSerializer(compression="none", threshold_bytes=64).dumps("x" * 1000).startswith(b"j")
+
+
+def test_values_json_cannot_represent_fall_back_to_pickle():
+    compact = CompactSerializer()
+    for value in (b"raw", {1: "int key"}, {"set"}):
+        data = compact.dumps(value)
+        assert data[0] == serializer.PICKLE_PROTOCOL_HEADER
+        assert compact.loads(data) == value
+    # Tuples are JSON-safe and come back as lists, as RQ's job args already allow.
+    assert compact.loads(compact.dumps(("a", "tuple"))) == ["a", "tuple"]
+
+
+def test_legacy_pickle_payloads_are_read():
+    assert CompactSerializer().loads(pickle.dumps({"job": 1}, protocol=2)) == {"job": 1}
+    with pytest.raises(ValueError, match="Unknown job payload encoding"):
+        CompactSerializer().loads(b"?garbage")
+
+
+def test_zstd_falls_back_to_zlib_without_zstandard(monkeypatch):
+    monkeypatch.setattr(serializer, "zstandard", None)
+    assert CompactSerializer(compression="zstd").compression == "zlib"
+
+
+def test_pickle_setting_keeps_rq_default(configure):
+    configure(job_serializer="pickle")
+    assert get_serializer() is None
+
+
+def test_jobs_and_results_are_stored_compactly(configure, connection):
+    configure(default_provider="local", result_ttl_seconds=60, result_ttl_max_seconds=120)
+    prompt = "explain queues " * 100
+    job_id = task_queue.add_to_queue(prompt, result_ttl=10_000)
+    queue = task_queue.get_queues()["default"]
+    NotifyingSimpleWorker([queue], connection=connection, serializer=queue.serializer).work(burst=True)
+
+    job = Job.fetch(job_id, connection=connection, serializer=get_serializer())
+    assert list(job.args) == [prompt]
+    assert job.result_ttl == 120
+    assert job.get_status() == "finished"
+    assert isinstance(job.return_value(), str)
+    ((_, fields),) = connection.xrange(f"rq:results:{job_id}")
+    assert base64.b64decode(fields[b"return_value"])[:1] in (b"j", b"z")
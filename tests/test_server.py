@@ -0,0 +1,42 @@
+import json
+
+import pytest
+import redis
+
+from mcp_waifu_queue import main, task_queue
+
+
+@pytest.fixture
+def no_blocking_redis(monkeypatch):
+    """Fails any command sent on a synchronous Redis client (pipelines only record theirs)."""
+    task_queue.get_connection()  # Created lazily; creation itself sends nothing.
+
+    def blocking(self, *args, **kwargs):
+        raise AssertionError(f"synchronous Redis call from the event loop: {args[0]}")
+
+    monkeypatch.setattr(redis.Redis, "execute_command", blocking)
+
+
+async def read_resource(uri: str) -> dict:
+    (content,) = await main.app.read_resource(uri)
+    return json.loads(content.content)
+
+
+@pytest.mark.asyncio
+async def test_handlers_use_only_async_redis(configure, call_tool, no_blocking_redis):
+    configure(response_cache_enabled=True, streaming_enabled=True)
+    job_id = (await call_tool("generate_text", prompt="hi"))["job_id"]
+    batch = await call_tool("generate_text_batch", prompts=["a", "b"])
+
+    assert (await read_resource(f"job://{job_id}"))["status"] == "queued"
+    assert [job["status"] for job in (await read_resource(f"batch://{batch['batch_id']}"))["jobs"]] == ["queued"] * 2
+    statuses = await call_tool("get_job_statuses", job_ids=[job_id, *batch["job_ids"]])
+    assert [job["status"] for job in statuses["jobs"]] == ["queued"] * 3
+    assert (await call_tool("read_stream", job_id=job_id))["done"] is False
+    assert (await read_resource("stats://cache"))["misses"] == 3
+
+
+@pytest.mark.asyncio
+async def test_unknown_job_is_an_error():
+    with pytest.raises(ValueError, match="No such job"):
+        await read_resource("job://missing")
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from mcp_waifu_queue import main, task_queue
+from mcp_waifu_queue.sessions import SessionStore, messages_key
+from mcp_waifu_queue.worker import NotifyingSimpleWorker
+
+
+@pytest.fixture
+def store(connection, async_connection):
+    return SessionStore(connection, ttl_seconds=60, max_messages=8, async_connection=async_connection)
+
+
+def turn(n: int) -> list[dict]:
+    return [{"role": "user", "content": f"q{n}"}, {"role": "assistant", "content": f"a{n}"}]
+
+
+@pytest.mark.asyncio
+async def test_messages_keep_a_stable_prefix(store):
+    await store.aset_system("s", "You are Waifu.")
+    store.append_turn("s", "q1", "a1")
+    first = store.messages("s", "q2")
+    store.append_turn("s", "q2", "a2")
+    second = store.messages("s", "q3")
+    assert first == [{"role": "system", "content": "You are Waifu."}, *turn(1), {"role": "user", "content": "q2"}]
+    assert second[: len(first)] == first
+    assert await store.ahistory("s") == second[:-1]
+
+
+def test_window_drops_the_oldest_half_in_one_step(store, connection):
+    for n in range(1, 5):
+        store.append_turn("s", f"q{n}", f"a{n}")
+    assert store.history("s") == [message for n in range(1, 5) for message in turn(n)]
+    store.append_turn("s", "q5", "a5")
+    assert store.history("s") == turn(4) + turn(5)
+    assert 0 < connection.ttl(messages_key("s")) <= 60
+
+
+@pytest.mark.asyncio
+async def test_adelete_forgets_the_session(store):
+    store.append_turn("s", "q1", "a1")
+    assert await store.adelete("s") is True
+    assert await store.adelete("s") is False
+    assert store.history("s") == []
+
+
+@pytest.mark.asyncio
+async def test_session_turns_are_recorded_by_the_worker(configure, call_tool, connection):
+    configure(default_provider="local", response_cache_enabled=True)
+    for prompt in ("hello", "again"):
+        await call_tool("generate_text", prompt=prompt, session_id="chat", system_prompt="Be brief.")
+        queue = task_queue.get_queues()["default"]
+        NotifyingSimpleWorker([queue], connection=connection, serializer=queue.serializer).work(burst=True)
+
+    (content,) = await main.app.read_resource("session://chat")
+    assert json.loads(content.content)["messages"] == [
+        {"role": "system", "content": "Be brief."},
+        {"role": "user", "content": "hello"},
+        {"role": "assistant", "content": "[stub] hello"},
+        {"role": "user", "content": "again"},
+        {"role": "assistant", "content": "[stub] again"},
+    ]
+    assert (await call_tool("end_session", session_id="chat"))["deleted"] is True
@@ -0,0 +1,126 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+from mcp.server.fastmcp.exceptions import ToolError
+
+from mcp_waifu_queue import config, settings, task_queue
+from mcp_waifu_queue.cache import get_response_cache
+from mcp_waifu_queue.config import Config
+from mcp_waifu_queue.ratelimit import get_rate_limiter
+from mcp_waifu_queue.resilience import get_resilient_caller
+
+
+def rewrite(path, text: str) -> None:
+    """Writes text and moves the mtime forward, as a later edit would."""
+    mtime = path.stat().st_mtime if path.exists() else 0
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, (mtime + 10, mtime + 10))
+
+
+@pytest.fixture
+def recheck(monkeypatch):
+    def set_recheck(seconds: float) -> None:
+        monkeypatch.setattr(settings, "RECHECK_SECONDS", seconds)
+        monkeypatch.setattr(config, "RECHECK_SECONDS", seconds)
+
+    return set_recheck
+
+
+def test_file_value_is_cached_until_its_mtime_changes(tmp_path, recheck):
+    path = tmp_path / ".api-openrouter"
+    assert settings.read_file_value(path) is None
+    rewrite(path, "key-1\n")
+    assert settings.read_file_value(path) is None  # Within the recheck interval.
+    recheck(0)
+    assert settings.read_file_value(path) == "key-1"
+    rewrite(path, "key-2")
+    assert settings.read_file_value(path) == "key-2"
+
+
+def test_unchanged_file_is_not_read_again(tmp_path, recheck, monkeypatch):
+    recheck(0)
+    path = tmp_path / ".model-openrouter"
+    rewrite(path, "openai/gpt-4o-mini")
+    reads = []
+    read_single_line = settings._read_single_line
+    monkeypatch.setattr(settings, "_read_single_line", lambda p: reads.append(p) or read_single_line(p))
+    for _ in range(3):
+        assert settings.read_file_value(path) == "openai/gpt-4o-mini"
+    assert reads == [path]
+
+
+def test_config_is_reloaded_when_env_file_changes(tmp_path, recheck):
+    env_file = tmp_path / ".env"
+    rewrite(env_file, "MAX_NEW_TOKENS=100\n")
+    assert Config.load().max_new_tokens == 100
+    rewrite(env_file, "MAX_NEW_TOKENS=200\n")
+    assert Config.load().max_new_tokens == 100
+    recheck(0)
+    assert Config.load().max_new_tokens == 200
+    assert Config.load() is Config.load()
+
+
+def test_reload_drops_caches_and_runs_hooks(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "_hooks", [])
+    calls = []
+    settings.on_reload(lambda: calls.append("router"))
+    settings.on_reload(lambda: 1 / 0)
+    settings.on_reload(lambda: calls.append("after a failing hook"))
+    path = tmp_path / ".api-openrouter"
+    rewrite(path, "old")
+    assert settings.read_file_value(path) == "old"
+    path.write_text("new", encoding="utf-8")
+    before = Config.load()
+    settings.reload()
+    assert settings.read_file_value(path) == "new"
+    assert Config.load() is not before
+    assert calls == ["router", "after a failing hook"]
+
+
+def test_config_is_read_outside_the_lock(monkeypatch):
+    read = Config._read.__func__
+    held = []
+    monkeypatch.setattr(Config, "_read", classmethod(lambda cls: held.append(config._lock.locked()) or read(cls)))
+    Config.load()
+    assert held == [False]
+
+
+def test_sighup_reloads_without_waiting_on_held_locks(monkeypatch):
+    monkeypatch.setattr(settings, "_hooks", [])
+    reloaded = threading.Event()
+    settings.on_reload(reloaded.set)
+    previous = signal.getsignal(signal.SIGHUP)
+    try:
+        assert settings.install_reload_signal()
+        # As if the signal interrupted read_file_value and Config.load mid-update.
+        with settings._lock, config._lock:
+            os.kill(os.getpid(), signal.SIGHUP)
+            time.sleep(0.01)  # The handler runs here, on this thread.
+        assert reloaded.wait(5)
+    finally:
+        signal.signal(signal.SIGHUP, previous)
+
+
+def test_reload_rebuilds_the_clients_built_from_config(configure):
+    configure(response_cache_enabled=True, rate_limit_enabled=True)
+    built = [get_response_cache(), get_rate_limiter(), get_resilient_caller(), task_queue.get_queues()]
+    assert [get_response_cache(), get_rate_limiter(), get_resilient_caller(), task_queue.get_queues()] == built
+    configure(lanes='{"only": 1}', default_lane="only")
+    settings.reload()
+    rebuilt = [get_response_cache(), get_rate_limiter(), get_resilient_caller(), task_queue.get_queues()]
+    assert all(after is not before for after, before in zip(rebuilt, built, strict=True))
+    assert list(rebuilt[-1]) == ["only"]
+
+
+@pytest.mark.asyncio
+async def test_server_limits_follow_an_edited_env_file(tmp_path, recheck, call_tool):
+    recheck(0)
+    job_ids = ["a", "b", "c"]
+    rewrite(tmp_path / ".env", "MAX_BATCH_SIZE=2\n")
+    with pytest.raises(ToolError, match="At most 2"):
+        await call_tool("get_job_statuses", job_ids=job_ids)
+    rewrite(tmp_path / ".env", "MAX_BATCH_SIZE=3\n")
+    assert len((await call_tool("get_job_statuses", job_ids=job_ids))["jobs"]) == 3
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from mcp_waifu_queue import main, task_queue
+from mcp_waifu_queue.similarity_cache import MinHasher, SimilarityCache, normalize
+from mcp_waifu_queue.worker import NotifyingSimpleWorker
+
+PARAMS = {"model": "stub", "max_tokens": 64, "temperature": 0.2}
+PROMPT = (
+    "Write a short story about a lighthouse keeper who finds a message in a bottle "
+    "washed up on the rocks after a long winter storm, and decides to answer it."
+)
+
+
+@pytest.fixture
+def cache(connection, async_connection):
+    return SimilarityCache(connection, ["docs"], threshold=0.8, async_connection=async_connection)
+
+
+@pytest.mark.parametrize(
+    ("a", "b"),
+    [
+        ("Hello,   World!", "hello world"),
+        ("What\u2019s up?", "whats up"),
+        ("Summarize the news 2024-05-01T10:00:00Z", "summarize the news"),
+        ("Summarize the news [2024-05-01 10:00]", "summarize the news"),
+        ("\uff28\uff49", "hi"),
+    ],
+)
+def test_ignored_differences_normalize_away(a, b):
+    assert normalize(a) == normalize(b)
+
+
+@pytest.mark.parametrize(
+    ("a", "b"),
+    [
+        ("John 3:16", "John 4:12"),
+        ("2+2", "2*2"),
+        ("x > y", "x < y"),
+        ("due 2024-05-01 or later", "due 2024-06-01 or later"),
+    ],
+)
+def test_content_is_kept(a, b):
+    assert normalize(a) != normalize(b)
+
+
+def test_signature_estimates_jaccard_similarity():
+    hasher = MinHasher(bands=16, rows=8)
+    base = hasher.signature(normalize(PROMPT))
+    assert hasher.similarity(base, hasher.signature(normalize(PROMPT))) == 1.0
+    assert hasher.similarity(base, hasher.signature(normalize(PROMPT.replace("winter", "summer")))) > 0.8
+    assert hasher.similarity(base, hasher.signature("an entirely unrelated request about tax law")) < 0.2
+
+
+def test_normalized_and_similar_prompts_hit(cache):
+    assert cache.lookup("docs", PROMPT, PARAMS) is None
+    assert cache.store("docs", PROMPT, PARAMS, "Once upon a time")
+    assert cache.lookup("docs", PROMPT.upper() + "  2024-05-01", PARAMS) == "Once upon a time"
+    assert cache.lookup("docs", PROMPT.replace("winter", "summer"), PARAMS) == "Once upon a time"
+    assert cache.lookup("docs", "Write a haiku about tax law.", PARAMS) is None
+    assert cache.lookup("docs", PROMPT, {**PARAMS, "temperature": 0.9}) is None
+    assert cache.lookup("other", PROMPT, PARAMS) is None
+    assert cache.stats()["docs"] == {
+        "normalized_hits": 1,
+        "similar_hits": 1,
+        "misses": 3,
+        "stores": 1,
+        "provider_calls_saved": 2,
+    }
+
+
+def test_threshold_bounds_what_counts_as_similar(connection):
+    strict = SimilarityCache(connection, ["docs"], threshold=1.0)
+    strict.store("docs", PROMPT, PARAMS, "stored")
+    assert strict.lookup("docs", PROMPT.replace("winter", "summer"), PARAMS) is None
+
+
+def test_store_reuses_the_signature_of_the_missed_lookup(cache, monkeypatch):
+    signed = []
+    signature = cache.hasher.signature
+    monkeypatch.setattr(cache.hasher, "signature", lambda text: signed.append(text) or signature(text))
+    assert cache.lookup("docs", PROMPT, PARAMS) is None
+    cache.store("docs", PROMPT, PARAMS, "stored")
+    assert len(signed) == 1
+    cache.store("docs", PROMPT + " again", PARAMS, "stored")  # No lookup before it: signed now.
+    assert len(signed) == 2
+
+
+def test_oversized_completions_are_not_stored(connection):
+    small = SimilarityCache(connection, ["docs"], max_entry_bytes=8)
+    assert small.store("docs", PROMPT, PARAMS, "far too long for the limit") is False
+    assert small.lookup("docs", PROMPT, PARAMS) is None
+
+
+@pytest.mark.asyncio
+async def test_workers_serve_near_duplicates_in_opted_in_namespaces(configure, call_tool, connection):
+    configure(default_provider="local", similarity_cache_namespaces='["docs"]', similarity_cache_threshold=0.8)
+    queue = task_queue.get_queues()["default"]
+
+    async def generate(prompt: str, namespace: str) -> str:
+        job_id = (await call_tool("generate_text", prompt=prompt, cache_namespace=namespace))["job_id"]
+        NotifyingSimpleWorker([queue], connection=connection, serializer=queue.serializer).work(burst=True)
+        return task_queue.get_job_status_from_queue(job_id)[1]
+
+    first = await generate(PROMPT, "docs")
+    assert await generate(PROMPT.replace("winter", "summer"), "docs") == first
+    assert await generate(PROMPT.replace("winter", "summer"), None) != first  # Default namespace not opted in.
+    (content,) = await main.app.read_resource("stats://similarity-cache")
+    assert json.loads(content.content)["namespaces"]["docs"]["provider_calls_saved"] == 1
@@ -0,0 +1,26 @@
+from pathlib import Path
+
+import pytest
+
+from mcp_waifu_queue import benchmark
+from mcp_waifu_queue.providers import base, primary_model
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.mark.parametrize("module", ["mcp_waifu_queue.task_queue", "mcp_waifu_queue.main"])
+def test_server_import_loads_no_provider_code_and_opens_no_connection(monkeypatch, module):
+    # The probe points REDIS_URL at a closed port, so an import-time connection fails it.
+    monkeypatch.setenv("PYTHONPATH", str(ROOT))
+    assert benchmark.measure_import(module, repeats=1)["worker_only_modules_loaded"] == []
+
+
+def test_primary_model_follows_the_first_backend(configure, tmp_path, monkeypatch):
+    monkeypatch.setattr(base, "OPENROUTER_MODEL_FILE_PATH", tmp_path / "missing")
+    assert primary_model(configure(default_provider="openrouter")) == base.DEFAULT_OPENROUTER_MODEL
+    model_file = tmp_path / ".model-openrouter"
+    model_file.write_text("openai/gpt-4o-mini\n", encoding="utf-8")
+    monkeypatch.setattr(base, "OPENROUTER_MODEL_FILE_PATH", model_file)
+    assert primary_model(configure(default_provider="openrouter")) == "openai/gpt-4o-mini"
+    assert primary_model(configure(default_provider="local")) == "stub"
+    assert primary_model(configure(provider_backends='["openrouter:x/y", "local"]')) == "x/y"
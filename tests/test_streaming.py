@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from mcp_waifu_queue import task_queue, utils
+from mcp_waifu_queue.cache import cache_key, get_response_cache
+from mcp_waifu_queue.respond import generation_params
+from mcp_waifu_queue.streaming import (
+    StreamWriter,
+    aread_stream,
+    open_writer,
+    read_stream,
+    stream_key,
+)
+
+
+def test_reads_continue_from_the_returned_offset(connection):
+    writer = StreamWriter(connection, "job", ttl_seconds=60)
+    writer.append("Hello, ")
+    text, offset, done = read_stream(connection, "job")
+    assert (text, done) == ("Hello, ", None)
+
+    writer.append("world")
+    writer.finish("completed")
+    text, offset, done = read_stream(connection, "job", offset)
+    assert (text, done) == ("world", "completed")
+    assert read_stream(connection, "job", offset) == ("", offset, "completed")
+    assert 0 < connection.ttl(stream_key("job")) <= 60
+
+
+def test_writer_is_only_opened_when_streaming_is_enabled(configure):
+    assert open_writer("job") is None
+    configure(streaming_enabled=True)
+    assert open_writer(None) is None
+    assert open_writer("job") is not None
+
+
+@pytest.mark.asyncio
+async def test_async_read_waits_for_the_next_chunk(connection, async_connection):
+    writer = StreamWriter(connection, "job")
+    writer.append("a")
+    _, offset, _ = await aread_stream(async_connection, "job")
+
+    async def write_later():
+        await asyncio.sleep(0.1)
+        await asyncio.to_thread(writer.append, "b")
+
+    task = asyncio.create_task(write_later())
+    text, _, done = await aread_stream(async_connection, "job", offset, wait_ms=2000)
+    await task
+    assert (text, done) == ("b", None)
+
+
+@pytest.mark.asyncio
+async def test_worker_streams_provider_chunks(configure, monkeypatch, connection):
+    configure(streaming_enabled=True)
+
+    async def apredict_response(request, on_chunk=None, params=None):
+        for chunk in ("one ", "two"):
+            await on_chunk(chunk)
+        return "one two"
+
+    monkeypatch.setattr(utils, "apredict_response", apredict_response)
+    assert await utils.acall_predict_response("hi", job_id="job") == "one two"
+    assert read_stream(connection, "job")[::2] == ("one two", "completed")
+
+
+def test_job_without_a_stream_returns_its_result(configure):
+    configure(response_cache_enabled=True)
+    get_response_cache().set(cache_key("hi", **generation_params()), "cached")
+    job_id = task_queue.add_to_queue("hi")
+    assert task_queue.read_job_stream(job_id) == ("cached", "0", True, "completed")
+    assert task_queue.read_job_stream(task_queue.add_to_queue("other"))[2:] == (False, "queued")
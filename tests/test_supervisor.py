@@ -0,0 +1,101 @@
+import sys
+import time
+from datetime import timedelta
+
+import pytest
+from rq import Queue
+from rq.job import Job
+from rq.utils import now, utcformat
+
+from mcp_waifu_queue.supervisor import Autoscaler, Supervisor
+
+IDLE_WORKER = [sys.executable, "-c", "import time; time.sleep(60)"]
+CRASHING_WORKER = [sys.executable, "-c", "raise SystemExit(3)"]
+
+
+def autoscaler(**options) -> Autoscaler:
+    defaults = {
+        "min_workers": 1,
+        "max_workers": 8,
+        "target_wait_seconds": 10,
+        "backlog_per_worker": 4,
+        "scale_down_delay_seconds": 30,
+    }
+    return Autoscaler(**{**defaults, **options})
+
+
+def test_pool_follows_depth_within_bounds():
+    scaler = autoscaler()
+    assert scaler.desired(1, depth=0, oldest_age=0, at=0) == 1
+    assert scaler.desired(1, depth=9, oldest_age=0, at=0) == 3
+    assert scaler.desired(1, depth=100, oldest_age=0, at=0) == 8
+
+
+def test_pool_grows_with_queue_wait_over_target():
+    assert autoscaler().desired(2, depth=1, oldest_age=30, at=0) == 6
+
+
+def test_scale_down_is_delayed_and_gradual():
+    scaler = autoscaler()
+    assert scaler.desired(4, depth=0, oldest_age=0, at=0) == 4
+    assert scaler.desired(4, depth=0, oldest_age=0, at=29) == 4
+    assert scaler.desired(4, depth=0, oldest_age=0, at=30) == 3
+    assert scaler.desired(3, depth=0, oldest_age=0, at=31) == 3
+    # Waits near the target hold the pool and restart the delay.
+    assert scaler.desired(3, depth=0, oldest_age=6, at=70) == 3
+    assert scaler.desired(3, depth=0, oldest_age=0, at=71) == 3
+
+
+@pytest.fixture
+def supervisor(connection):
+    def build(command, **options):
+        queues = [Queue(name, connection=connection) for name in ("interactive", "default")]
+        built = Supervisor(queues, connection, autoscaler(**options), drain_timeout_seconds=5, command=command)
+        supervisors.append(built)
+        return built
+
+    supervisors = []
+    yield build
+    for built in supervisors:
+        built.shutdown()
+
+
+def test_sample_reads_depth_and_oldest_wait(supervisor, connection):
+    pool = supervisor(IDLE_WORKER)
+    assert pool.sample() == (0, 0.0)
+    queue = pool.queues[1]
+    job = queue.enqueue("builtins.len", "x")
+    queue.enqueue("builtins.len", "y")
+    connection.hset(Job.key_for(job.id), "enqueued_at", utcformat(now() - timedelta(seconds=42)))
+    depth, oldest = pool.sample()
+    assert depth == 2 and oldest == pytest.approx(42, abs=1)
+
+
+def test_scales_up_then_drains_newest_workers(supervisor):
+    pool = supervisor(IDLE_WORKER, min_workers=1, max_workers=3, scale_down_delay_seconds=0)
+    for _ in range(9):
+        pool.queues[0].enqueue("builtins.len", "x")
+    pool.scale()
+    assert [worker.slot for worker in pool.active()] == [1, 2, 3]
+    pool.queues[0].empty()
+    pool.scale()
+    pool.scale()
+    assert [worker.slot for worker in pool.active()] == [1]
+    deadline = time.monotonic() + 5
+    while len(pool.workers) > 1 and time.monotonic() < deadline:
+        pool.reap()
+        time.sleep(0.05)
+    assert len(pool.workers) == 1
+
+
+def test_crashing_workers_are_replaced_with_backoff(supervisor):
+    pool = supervisor(CRASHING_WORKER, min_workers=1, max_workers=1)
+    pool.scale()
+    pool.workers[0].process.wait(5)
+    pool.reap()
+    assert pool.workers == [] and pool._restart_backoff == 1.0
+    pool.scale()
+    assert pool.workers == []  # Still backing off.
+    pool._next_start_at = 0
+    pool.scale()
+    assert len(pool.workers) == 1
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+from rq.job import Job
+
+from mcp_waifu_queue import task_queue, timing
+from mcp_waifu_queue.worker import NotifyingSimpleWorker
+
+
+def stage_fields(connection, job_id: str) -> dict:
+    fields = (*timing.STAGE_FIELDS.values(), timing.PROFILE_FIELD)
+    values = connection.hmget(Job.key_for(job_id), *fields)
+    return {field: value for field, value in zip(fields, values, strict=True) if value}
+
+
+def test_marks_are_saved_once_per_attempt(connection):
+    timing.mark("provider_sent")  # No job running: ignored.
+    with timing.job_timer("job") as timer:
+        timing.mark("provider_sent")
+        first = timer.marks[timing.STAGE_FIELDS["provider_sent"]]
+        timing.mark("provider_sent")
+        timing.record_profile("/tmp/job.folded")
+    assert timer.marks[timing.STAGE_FIELDS["provider_sent"]] == first
+    assert set(stage_fields(connection, "job")) == {
+        "waifu_executing_at",
+        "waifu_provider_sent_at",
+        timing.PROFILE_FIELD,
+    }
+    # A retry replaces the earlier attempt's marks, including the ones it did not reach.
+    with timing.job_timer("job"):
+        pass
+    assert set(stage_fields(connection, "job")) == {"waifu_executing_at"}
+
+
+@pytest.mark.asyncio
+async def test_async_timer_saves_its_marks(connection):
+    async with timing.ajob_timer("job"):
+        timing.mark("first_byte")
+    assert set(stage_fields(connection, "job")) == {"waifu_executing_at", "waifu_first_byte_at"}
+
+
+def test_durations_cover_each_stage():
+    stamps = ["2026-01-01T00:00:00.000000Z", "2026-01-01T00:00:01.000000Z", None, None, None, None]
+    values = [stamp.encode() if stamp else None for stamp in stamps] + [b"/tmp/p.folded"]
+    timestamps, profile = timing.parse_fields(values)
+    assert profile == "/tmp/p.folded"
+    assert list(timestamps) == list(timing.TIMESTAMP_FIELDS)
+    spans = timing.durations(timestamps)
+    assert spans["queue_wait"] == 1.0
+    assert spans["total"] is None
+
+
+def test_worker_records_every_stage_and_the_profile(configure, connection, tmp_path):
+    configure(default_provider="local", profile_sample_rate=1, profile_dir=tmp_path / "profiles")
+    job_id = task_queue.add_to_queue("time me")
+    queue = task_queue.get_queues()["default"]
+    NotifyingSimpleWorker([queue], connection=connection, serializer=queue.serializer).work(burst=True)
+
+    detail = task_queue.get_job_detail_from_queue(job_id)
+    assert all(detail["timestamps"].values())
+    spans = timing.durations(detail["timestamps"])
+    assert all(value is not None and value >= 0 for value in spans.values())
+    assert detail["profile"] == os.path.join(tmp_path / "profiles", f"{job_id}.folded")
+    assert os.path.exists(detail["profile"])